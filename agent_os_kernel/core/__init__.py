@@ -542,7 +542,6 @@ from .scheduler import (
     AgentState,
     ResourceQuota,
     AgentProcess,
-    SchedulableProcess,
     IPCChannel,
     ResourceQuotaManager,
     AgentScheduler,
@@ -560,6 +559,7 @@ from .security import (
 from .service_mesh import (
     CircuitState,
     LoadBalancingStrategy,
+    ConsistentHashStrategy,
     ServiceInstance,
     ServiceInfo,
     CircuitBreaker,
@@ -586,6 +586,7 @@ from .state_machine import (
     Transition,
     StateCallbacks,
     StateMachine,
+    StateMachineSchema,
     HierarchicalStateMachine,
     ParallelStateMachine,
 )
@@ -594,6 +595,7 @@ from .state_machine import (
 from .storage import (
     StorageStats,
     StorageInterface,
+    EvictionPolicy,
     MemoryStorage,
     FileStorage,
     PostgreSQLStorage,
@@ -1056,7 +1058,6 @@ __all__ = [
     "AgentState",
     "ResourceQuota",
     "AgentProcess",
-    "SchedulableProcess",
     "IPCChannel",
     "ResourceQuotaManager",
     "AgentScheduler",
@@ -1066,6 +1067,7 @@ __all__ = [
     "PermissionManager",
     "CircuitState",
     "LoadBalancingStrategy",
+    "ConsistentHashStrategy",
     "ServiceInstance",
     "ServiceInfo",
     "CircuitBreaker",
@@ -1084,10 +1086,12 @@ __all__ = [
     "Transition",
     "StateCallbacks",
     "StateMachine",
+    "StateMachineSchema",
     "HierarchicalStateMachine",
     "ParallelStateMachine",
     "StorageStats",
     "StorageInterface",
+    "EvictionPolicy",
     "MemoryStorage",
     "FileStorage",
     "PostgreSQLStorage",
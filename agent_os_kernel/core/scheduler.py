@@ -15,17 +15,67 @@ Agent Scheduler - 进程调度器
 """
 
 import time
+import heapq
 import logging
 from typing import Optional, Dict, Any, List, Callable, Tuple
-from queue import PriorityQueue, Empty
-from collections import defaultdict
+from collections import defaultdict, deque
 from dataclasses import dataclass, field
 from enum import Enum
 from abc import ABC, abstractmethod
 
+from .types import DATACLASS_SLOTS
+
 
 logger = logging.getLogger(__name__)
 
+# 等待进程的默认超时唤醒时间（秒）
+WAIT_TIMEOUT = 30.0
+
+# 优先级范围（0-100，越小越高）
+MAX_PRIORITY = 100
+
+# 最小时间片（秒）：运行不足该时长的进程不会因更高优先级进程就绪而被抢占
+MIN_TIME_SLICE = 1.0
+
+# 各优先级的虚拟运行时间权重：默认优先级 50 为 1.0，每高 10 级增长放慢 1.25 倍
+_PRIORITY_WEIGHTS = tuple(1.25 ** ((p - 50) / 10) for p in range(MAX_PRIORITY + 1))
+
+# 单个 Agent 最多可占用全局配额的比例
+AGENT_QUOTA_SHARE = 0.3
+
+# per_agent_usage 中 [tokens, api_calls] 的下标
+_TOKENS = 0
+_API_CALLS = 1
+
+# 尚无使用记录的 Agent 的只读默认值
+_EMPTY_USAGE = (0, 0)
+
+# 配额状态码（acquire 的返回值）及对应原因
+QUOTA_OK = 0
+QUOTA_GLOBAL_TOKENS = 1
+QUOTA_GLOBAL_CALLS = 2
+QUOTA_REQUEST_TOKENS = 3
+QUOTA_AGENT_TOKENS = 4
+QUOTA_AGENT_CALLS = 5
+QUOTA_REASONS = (
+    "Approved",
+    "Global token quota exceeded",
+    "Global API call quota exceeded",
+    "Request exceeds max tokens per request",
+    "Agent token quota exceeded (30% of global)",
+    "Agent API call quota exceeded (30% of global)",
+)
+_QUOTA_RESULTS = tuple((code == QUOTA_OK, reason) for code, reason in enumerate(QUOTA_REASONS))
+
+# 调度时钟：所有截止时间计算使用单调时钟，不受系统时间调整影响
+# （绑定为模块级名字，省去属性查找）
+_now = time.monotonic
+
+
+def _clamp_priority(priority: int) -> int:
+    """将优先级限制在 [0, MAX_PRIORITY] 范围内"""
+    return 0 if priority < 0 else MAX_PRIORITY if priority > MAX_PRIORITY else priority
+
 
 class AgentState(Enum):
     """Agent 进程状态"""
@@ -37,6 +87,12 @@ class AgentState(Enum):
     ERROR = "error"           # 错误状态
 
 
+# 活动状态集合
+ACTIVE_STATES = frozenset((
+    AgentState.READY, AgentState.RUNNING, AgentState.WAITING, AgentState.SUSPENDED
+))
+
+
 @dataclass
 class ResourceQuota:
     """资源配额配置"""
@@ -46,7 +102,7 @@ class ResourceQuota:
     window_seconds: float = 3600            # 配额窗口（秒）
 
 
-@dataclass
+@dataclass(**DATACLASS_SLOTS)
 class AgentProcess:
     """
     Agent 进程控制块（PCB）
@@ -63,12 +119,16 @@ class AgentProcess:
     api_calls: int = 0
     execution_time: float = 0.0
     cpu_time: float = 0.0                   # 实际 LLM 推理时间
+    vruntime: float = 0.0                   # 按优先级加权的虚拟运行时间（秒）
     
     # 上下文
     context: Dict[str, Any] = field(default_factory=dict)
     checkpoint_id: Optional[str] = None
     
     # 调度信息
+    # created_at / terminated_at 为墙上时间（time.time）；
+    # last_run / started_at / waiting_since 为单调时钟（time.monotonic），
+    # 仅用于本进程内的时间差计算
     created_at: float = field(default_factory=time.time)
     last_run: float = 0.0
     started_at: Optional[float] = None
@@ -90,7 +150,7 @@ class AgentProcess:
     
     def is_active(self) -> bool:
         """是否处于活动状态"""
-        return self.state in (AgentState.READY, AgentState.RUNNING, AgentState.WAITING, AgentState.SUSPENDED)
+        return self.state in ACTIVE_STATES
     
     def to_dict(self) -> Dict[str, Any]:
         """序列化为字典"""
@@ -103,6 +163,7 @@ class AgentProcess:
             'api_calls': self.api_calls,
             'execution_time': self.execution_time,
             'cpu_time': self.cpu_time,
+            'vruntime': self.vruntime,
             'context': self.context,
             'checkpoint_id': self.checkpoint_id,
             'created_at': self.created_at,
@@ -127,6 +188,7 @@ class AgentProcess:
             api_calls=data.get('api_calls', 0),
             execution_time=data.get('execution_time', 0.0),
             cpu_time=data.get('cpu_time', 0.0),
+            vruntime=data.get('vruntime', 0.0),
             context=data.get('context', {}),
             checkpoint_id=data.get('checkpoint_id'),
             created_at=data.get('created_at', time.time()),
@@ -141,14 +203,6 @@ class AgentProcess:
         return process
 
 
-@dataclass(order=True)
-class SchedulableProcess:
-    """可调度进程包装器（用于优先级队列）"""
-    priority: int
-    timestamp: float = field(compare=True)
-    process: AgentProcess = field(compare=False)
-
-
 class IPCChannel:
     """
     进程间通信通道
@@ -197,74 +251,130 @@ class ResourceQuotaManager:
     
     def __init__(self, quota: ResourceQuota):
         self.quota = quota
-        self.current_usage = {'tokens': 0, 'api_calls': 0}
-        self.per_agent_usage: Dict[str, Dict[str, int]] = defaultdict(lambda: {
-            'tokens': 0, 'api_calls': 0
-        })
-        self.window_start = time.time()
-    
-    def reset_if_needed(self):
-        """检查并重置配额窗口"""
-        current_time = time.time()
+        # 全局使用量（整数计数器，字典视图仅在统计时构建）
+        self._global_tokens = 0
+        self._global_calls = 0
+        # 每个 Agent 的使用量：[tokens, api_calls]
+        self.per_agent_usage: Dict[str, List[int]] = {}
+        self.window_start = _now()
+        # 窗口代数：每次重置加一，调用方比较代数即可发现窗口已重置，无论由谁触发
+        self.window_generation = 0
+    
+    @property
+    def quota(self) -> ResourceQuota:
+        """配额配置"""
+        return self._quota
+    
+    @quota.setter
+    def quota(self, quota: ResourceQuota):
+        """替换配额配置，并预先计算单个 Agent 的上限"""
+        self._quota = quota
+        self.max_agent_tokens = quota.max_tokens_per_window * AGENT_QUOTA_SHARE
+        self.max_agent_calls = quota.max_api_calls_per_window * AGENT_QUOTA_SHARE
+    
+    @property
+    def current_usage(self) -> Dict[str, int]:
+        """当前窗口的全局使用量"""
+        return {'tokens': self._global_tokens, 'api_calls': self._global_calls}
+    
+    def reset_if_needed(self, now: Optional[float] = None) -> bool:
+        """
+        检查并重置配额窗口
+        
+        Args:
+            now: 当前时间（调度器在每个 tick 中复用同一时间戳）
+        
+        Returns:
+            是否发生了重置
+        """
+        current_time = _now() if now is None else now
         if current_time - self.window_start >= self.quota.window_seconds:
             logger.info(f"Resetting quota window")
-            self.current_usage = {'tokens': 0, 'api_calls': 0}
+            self._global_tokens = 0
+            self._global_calls = 0
             self.per_agent_usage.clear()
             self.window_start = current_time
+            self.window_generation += 1
+            return True
+        return False
     
-    def request_quota(self, agent_pid: str, tokens: int,
-                     api_calls: int = 1) -> Tuple[bool, str]:
-        """
-        请求资源配额
-        
-        Returns:
-            (是否批准, 原因)
-        """
-        self.reset_if_needed()
+    def _check_quota(self, tokens: int, api_calls: int, agent_usage) -> int:
+        """检查配额（不记录使用量），返回配额状态码"""
+        quota = self._quota
         
         # 检查全局配额
-        if self.current_usage['tokens'] + tokens > self.quota.max_tokens_per_window:
-            return False, "Global token quota exceeded"
+        if self._global_tokens + tokens > quota.max_tokens_per_window:
+            return QUOTA_GLOBAL_TOKENS
         
-        if self.current_usage['api_calls'] + api_calls > self.quota.max_api_calls_per_window:
-            return False, "Global API call quota exceeded"
+        if self._global_calls + api_calls > quota.max_api_calls_per_window:
+            return QUOTA_GLOBAL_CALLS
         
         # 检查单个请求限制
-        if tokens > self.quota.max_tokens_per_request:
-            return False, f"Request exceeds max tokens per request"
+        if tokens > quota.max_tokens_per_request:
+            return QUOTA_REQUEST_TOKENS
         
         # 检查单个 Agent 配额（最多 30%）
-        agent_usage = self.per_agent_usage[agent_pid]
-        max_per_agent_tokens = self.quota.max_tokens_per_window * 0.3
-        max_per_agent_calls = self.quota.max_api_calls_per_window * 0.3
+        if agent_usage[_TOKENS] + tokens > self.max_agent_tokens:
+            return QUOTA_AGENT_TOKENS
+        
+        if agent_usage[_API_CALLS] + api_calls > self.max_agent_calls:
+            return QUOTA_AGENT_CALLS
         
-        if agent_usage['tokens'] + tokens > max_per_agent_tokens:
-            return False, "Agent token quota exceeded (30% of global)"
+        return QUOTA_OK
+    
+    def can_grant(self, agent_pid: str, tokens: int, api_calls: int = 1) -> bool:
+        """检查配额是否足够，不记录使用量"""
+        self.reset_if_needed()
+        agent_usage = self.per_agent_usage.get(agent_pid, _EMPTY_USAGE)
+        return self._check_quota(tokens, api_calls, agent_usage) == QUOTA_OK
+    
+    def acquire(self, agent_pid: str, tokens: int, api_calls: int = 1) -> int:
+        """
+        申请资源配额，批准时记录使用量
+        
+        Returns:
+            配额状态码：QUOTA_OK 表示批准，其余见 QUOTA_REASONS
+        """
+        self.reset_if_needed()
         
-        if agent_usage['api_calls'] + api_calls > max_per_agent_calls:
-            return False, "Agent API call quota exceeded (30% of global)"
+        agent_usage = self.per_agent_usage.get(agent_pid, _EMPTY_USAGE)
+        code = self._check_quota(tokens, api_calls, agent_usage)
+        if code:
+            return code
         
         # 批准并记录
-        self.current_usage['tokens'] += tokens
-        self.current_usage['api_calls'] += api_calls
-        agent_usage['tokens'] += tokens
-        agent_usage['api_calls'] += api_calls
+        self._global_tokens += tokens
+        self._global_calls += api_calls
+        if agent_usage is _EMPTY_USAGE:
+            agent_usage = self.per_agent_usage[agent_pid] = [0, 0]
+        agent_usage[_TOKENS] += tokens
+        agent_usage[_API_CALLS] += api_calls
         
-        return True, "Approved"
+        return QUOTA_OK
+    
+    def request_quota(self, agent_pid: str, tokens: int,
+                     api_calls: int = 1) -> Tuple[bool, str]:
+        """
+        请求资源配额
+        
+        Returns:
+            (是否批准, 原因)
+        """
+        return _QUOTA_RESULTS[self.acquire(agent_pid, tokens, api_calls)]
     
     def get_usage_stats(self) -> Dict[str, Any]:
         """获取使用统计"""
         return {
             'window_start': self.window_start,
-            'window_elapsed': time.time() - self.window_start,
-            'global_usage': self.current_usage.copy(),
+            'window_elapsed': _now() - self.window_start,
+            'global_usage': self.current_usage,
             'global_limits': {
                 'tokens': self.quota.max_tokens_per_window,
                 'api_calls': self.quota.max_api_calls_per_window,
             },
             'usage_percent': {
-                'tokens': (self.current_usage['tokens'] / self.quota.max_tokens_per_window) * 100,
-                'api_calls': (self.current_usage['api_calls'] / self.quota.max_api_calls_per_window) * 100,
+                'tokens': (self._global_tokens / self.quota.max_tokens_per_window) * 100,
+                'api_calls': (self._global_calls / self.quota.max_api_calls_per_window) * 100,
             },
             'per_agent_count': len(self.per_agent_usage),
         }
@@ -315,12 +425,25 @@ class AgentScheduler:
         self.time_slice = time_slice
         self.storage = storage
         
-        # 队列
-        self.ready_queue: PriorityQueue[SchedulableProcess] = PriorityQueue()
+        # 就绪队列：每个优先级一个 FIFO 队列，入队/出队均为 O(1)
+        # _active_mask 的第 i 位表示优先级 i 的队列非空，最低置位即最高优先级。
+        # 采用惰性删除：失效条目在出队时跳过
+        self._runqs: List[deque] = [deque() for _ in range(MAX_PRIORITY + 1)]
+        self._active_mask = 0
+        self._ready_count = 0
+        
+        # 虚拟时间片：已调度进程的虚拟运行时间前沿，及当前进程的实际时间片
+        self._min_vruntime = 0.0
+        self._running_slice = time_slice
         self.waiting_queue: Dict[str, AgentProcess] = {}
+        self._wait_deadlines: List[Tuple[float, str]] = []  # (唤醒截止时间, pid) 最小堆
+        # 等待条件：pid -> (唤醒截止时间, 就绪判断函数)
+        self._wait_conditions: Dict[str, Tuple[float, Optional[Callable[[], bool]]]] = {}
         
         # 进程表
         self.processes: Dict[str, AgentProcess] = {}
+        # 各状态的进程数，随状态变更增量维护
+        self._state_counts: Dict[AgentState, int] = defaultdict(int)
         self.running: Optional[AgentProcess] = None
         
         # IPC 通道
@@ -328,16 +451,16 @@ class AgentScheduler:
         
         # 资源配额
         self.quota_manager = ResourceQuotaManager(quota or ResourceQuota())
+        # 上次通知等待进程时的配额窗口代数
+        self._quota_generation = self.quota_manager.window_generation
         
-        # 统计
-        self.stats = {
-            'total_scheduled': 0,
-            'total_preempted': 0,
-            'total_completed': 0,
-            'total_errors': 0,
-            'total_checkpoints': 0,
-            'total_restores': 0,
-        }
+        # 统计（整数属性，stats 属性提供字典视图）
+        self.total_scheduled = 0
+        self.total_preempted = 0
+        self.total_completed = 0
+        self.total_errors = 0
+        self.total_checkpoints = 0
+        self.total_restores = 0
         
         # 优雅终止标志
         self._shutdown_requested = False
@@ -345,6 +468,18 @@ class AgentScheduler:
         
         logger.info(f"AgentScheduler initialized (time_slice={time_slice}s)")
     
+    @property
+    def stats(self) -> Dict[str, int]:
+        """调度统计"""
+        return {
+            'total_scheduled': self.total_scheduled,
+            'total_preempted': self.total_preempted,
+            'total_completed': self.total_completed,
+            'total_errors': self.total_errors,
+            'total_checkpoints': self.total_checkpoints,
+            'total_restores': self.total_restores,
+        }
+    
     def add_process(self, process: AgentProcess):
         """
         添加新进程到调度队列
@@ -352,19 +487,37 @@ class AgentScheduler:
         Args:
             process: Agent 进程
         """
-        self.processes[process.pid] = process
+        self._register(process)
         self._enqueue(process)
         logger.info(f"Added process {process.name} (PID: {process.pid[:8]}...)")
     
+    def _register(self, process: AgentProcess):
+        """将进程写入进程表（替换同 PID 的旧进程）"""
+        counts = self._state_counts
+        old = self.processes.get(process.pid)
+        if old is not None:
+            counts[old.state] -= 1
+        self.processes[process.pid] = process
+        counts[process.state] += 1
+    
+    def _set_state(self, process: AgentProcess, state: AgentState):
+        """变更进程状态，同步维护状态计数"""
+        counts = self._state_counts
+        counts[process.state] -= 1
+        counts[state] += 1
+        process.state = state
+    
     def _enqueue(self, process: AgentProcess):
         """将进程加入就绪队列"""
-        process.state = AgentState.READY
-        schedulable = SchedulableProcess(
-            priority=process.priority,
-            timestamp=time.time(),
-            process=process
-        )
-        self.ready_queue.put(schedulable)
+        self._set_state(process, AgentState.READY)
+        # 长时间未运行的进程最多积累一个时间片的补偿，避免回来后独占
+        floor = self._min_vruntime - process.time_slice
+        if process.vruntime < floor:
+            process.vruntime = floor
+        prio = _clamp_priority(process.priority)
+        self._runqs[prio].append(process)
+        self._active_mask |= 1 << prio
+        self._ready_count += 1
     
     def schedule(self) -> Optional[AgentProcess]:
         """
@@ -376,93 +529,128 @@ class AgentScheduler:
         if self._shutdown_requested:
             return None
         
-        # 检查并重置配额
-        self.quota_manager.reset_if_needed()
+        # 本次调度统一使用同一时间戳
+        now = _now()
+        
+        # 检查并重置配额；窗口代数变化（包括 acquire 等路径触发的重置）时
+        # 通知带就绪条件的等待进程
+        quota_manager = self.quota_manager
+        quota_manager.reset_if_needed(now)
+        if quota_manager.window_generation != self._quota_generation:
+            self._quota_generation = quota_manager.window_generation
+            for pid, (_, ready_fn) in list(self._wait_conditions.items()):
+                if ready_fn is not None:
+                    self.signal(pid)
         
         # 检查当前进程是否需要抢占
-        if self.running:
-            if self._should_preempt(self.running):
-                logger.debug(f"Preempting {self.running.name}")
-                self._enqueue(self.running)
-                self.running = None
-                self.stats['total_preempted'] += 1
+        running = self.running
+        if running is not None and self._should_preempt(running, now):
+            logger.debug(f"Preempting {running.name}")
+            self._release_running(now)
+            self._enqueue(running)
+            self.total_preempted += 1
+            running = None
         
         # 检查等待队列中是否有进程可以唤醒
-        self._check_waiting_queue()
+        self._check_waiting_queue(now)
         
         # 如果没有运行中的进程，从队列取一个
-        if not self.running:
-            try:
-                schedulable = self.ready_queue.get(block=False)
-                process = schedulable.process
+        if running is None:
+            running = self._pop_ready()
+            if running is not None:
+                self._set_state(running, AgentState.RUNNING)
+                running.last_run = now
+                if running.started_at is None:
+                    running.started_at = now
                 
-                # 检查进程是否仍然有效
-                if process.state == AgentState.TERMINATED:
-                    return self.schedule()  # 递归获取下一个
+                # 落后于前沿的进程获得更长的时间片，领先的进程时间片缩短
+                time_slice = running.time_slice
+                vruntime = running.vruntime
+                min_vruntime = self._min_vruntime
+                lag = (min_vruntime - vruntime) / _PRIORITY_WEIGHTS[_clamp_priority(running.priority)]
+                self._running_slice = min(max(time_slice + lag, MIN_TIME_SLICE), time_slice * 2)
+                if vruntime > min_vruntime:
+                    self._min_vruntime = vruntime
                 
-                process.state = AgentState.RUNNING
-                process.last_run = time.time()
-                if process.started_at is None:
-                    process.started_at = time.time()
+                self.running = running
+                self.total_scheduled += 1
                 
-                self.running = process
-                self.stats['total_scheduled'] += 1
-                
-                logger.debug(f"Scheduled {process.name} (priority={process.priority})")
-                
-            except Empty:
-                pass
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Scheduled {running.name} (priority={running.priority})")
+        
+        return running
+    
+    def _release_running(self, now: Optional[float] = None):
+        """让出 CPU：按优先级权重累计当前进程的虚拟运行时间"""
+        process = self.running
+        if process is None:
+            return
+        ran = (_now() if now is None else now) - process.last_run
+        process.vruntime += ran * _PRIORITY_WEIGHTS[_clamp_priority(process.priority)]
+        self.running = None
+    
+    def _pop_ready(self) -> Optional[AgentProcess]:
+        """
+        弹出下一个可运行的进程
         
-        return self.running
+        惰性删除：已终止、挂起或重复入队的条目不会从队列中主动移除，
+        而是在这里一次性跳过，避免逐条递归调度。
+        """
+        runqs = self._runqs
+        while self._active_mask:
+            mask = self._active_mask
+            prio = (mask & -mask).bit_length() - 1
+            runq = runqs[prio]
+            process = runq.popleft()
+            self._ready_count -= 1
+            if not runq:
+                self._active_mask = mask & ~(1 << prio)
+            if process.state == AgentState.READY:
+                return process
+        return None
     
-    def _should_preempt(self, process: AgentProcess) -> bool:
+    def _should_preempt(self, process: AgentProcess, now: float) -> bool:
         """
         判断是否应该抢占当前进程
         
         抢占条件：
-        1. 时间片用完
-        2. 有更高优先级的进程在等待
+        1. 时间片用完（时间片由虚拟运行时间决定）
+        2. 有更高优先级的进程在等待（至少运行满最小时间片）
         3. 资源使用过多
-        4. 进程执行时间过长
         """
+        ran = now - process.last_run
+        
         # 1. 时间片用完
-        if time.time() - process.last_run > process.time_slice:
+        if ran > self._running_slice:
             logger.debug(f"Time slice expired for {process.name}")
             return True
         
         # 2. 有更高优先级的进程在等待
-        if not self.ready_queue.empty():
-            next_schedulable = self.ready_queue.queue[0]
-            if next_schedulable.priority < process.priority - 10:
+        if ran >= MIN_TIME_SLICE:
+            threshold = _clamp_priority(process.priority - 10)
+            if self._active_mask & ((1 << threshold) - 1):
                 logger.debug(f"Higher priority process waiting")
                 return True
         
         # 3. 资源使用过多
-        quota_stats = self.quota_manager.get_usage_stats()
-        agent_usage = self.quota_manager.per_agent_usage.get(process.pid, {})
-        if agent_usage.get('tokens', 0) > quota_stats['global_limits']['tokens'] * 0.3:
+        quota_manager = self.quota_manager
+        if quota_manager.per_agent_usage.get(process.pid, _EMPTY_USAGE)[_TOKENS] \
+                > quota_manager.max_agent_tokens:
             logger.debug(f"Resource usage exceeded for {process.name}")
             return True
         
         return False
     
-    def _check_waiting_queue(self):
-        """检查等待队列，尝试唤醒进程"""
-        to_wakeup = []
-        
-        for pid, process in self.waiting_queue.items():
-            # 检查资源是否可用
-            if process.waiting_reason and process.waiting_reason.startswith("quota"):
-                approved, _ = self.quota_manager.request_quota(pid, 100, 0)
-                if approved:
-                    to_wakeup.append(pid)
-            
-            # 超时唤醒
-            elif process.waiting_since and time.time() - process.waiting_since > 30:
-                to_wakeup.append(pid)
-        
-        for pid in to_wakeup:
-            self.wakeup_process(pid)
+    def _check_waiting_queue(self, now: float):
+        """唤醒等待超时的进程（只弹出截止时间已过的条目）"""
+        deadlines = self._wait_deadlines
+        conditions = self._wait_conditions
+        while deadlines and deadlines[0][0] < now:
+            deadline, pid = heapq.heappop(deadlines)
+            # 进程可能已被唤醒后再次等待，此时旧条目已失效
+            condition = conditions.get(pid)
+            if condition is not None and condition[0] == deadline:
+                self.wakeup_process(pid)
     
     def suspend_process(self, pid: str, create_checkpoint: bool = True) -> Optional[str]:
         """
@@ -482,9 +670,9 @@ class AgentScheduler:
             return None
         
         if self.running and self.running.pid == pid:
-            self.running = None
+            self._release_running()
         
-        process.state = AgentState.SUSPENDED
+        self._set_state(process, AgentState.SUSPENDED)
         
         checkpoint_id = None
         if create_checkpoint and self.storage:
@@ -496,7 +684,7 @@ class AgentScheduler:
                     description=f"Suspended at {time.time()}"
                 )
                 process.checkpoint_id = checkpoint_id
-                self.stats['total_checkpoints'] += 1
+                self.total_checkpoints += 1
                 logger.info(f"Created checkpoint {checkpoint_id[:8]} for {process.name}")
             except Exception as e:
                 logger.error(f"Failed to create checkpoint: {e}")
@@ -522,8 +710,8 @@ class AgentScheduler:
             if checkpoint:
                 process = AgentProcess.from_dict(checkpoint['process_state'])
                 process.state = AgentState.READY
-                self.processes[pid] = process
-                self.stats['total_restores'] += 1
+                self._register(process)
+                self.total_restores += 1
                 logger.info(f"Restored process {process.name} from checkpoint {checkpoint_id[:8]}")
         
         if not process:
@@ -553,58 +741,100 @@ class AgentScheduler:
             except Exception as e:
                 logger.error(f"Error in shutdown callback: {e}")
         
-        process.state = AgentState.TERMINATED
+        self._set_state(process, AgentState.TERMINATED)
         process.terminated_at = time.time()
         
         if self.running and self.running.pid == pid:
-            self.running = None
+            self._release_running()
         
         if pid in self.waiting_queue:
             del self.waiting_queue[pid]
+            self._wait_conditions.pop(pid, None)
         
         if reason == "error":
-            self.stats['total_errors'] += 1
+            self.total_errors += 1
         else:
-            self.stats['total_completed'] += 1
+            self.total_completed += 1
         
         logger.info(f"Terminated {process.name} (reason: {reason})")
     
     def request_resources(self, agent_pid: str, tokens: int,
                          api_calls: int = 1) -> bool:
         """请求资源配额"""
-        approved, reason = self.quota_manager.request_quota(agent_pid, tokens, api_calls)
+        quota_manager = self.quota_manager
+        code = quota_manager.acquire(agent_pid, tokens, api_calls)
         
-        if not approved:
+        if code:
+            reason = QUOTA_REASONS[code]
             logger.warning(f"Resource request denied for {agent_pid[:8]}: {reason}")
-            self.wait_process(agent_pid, reason)
-        else:
-            process = self.processes.get(agent_pid)
-            if process:
-                process.token_usage += tokens
-                process.api_calls += api_calls
+            self.wait_process(
+                agent_pid, reason,
+                ready_fn=lambda: quota_manager.can_grant(agent_pid, tokens, api_calls),
+            )
+            return False
         
-        return approved
+        process = self.processes.get(agent_pid)
+        if process:
+            process.token_usage += tokens
+            process.api_calls += api_calls
+        return True
     
-    def wait_process(self, pid: str, reason: str = "waiting"):
-        """将进程置为等待状态"""
+    def wait_process(self, pid: str, reason: str = "waiting",
+                     timeout: Optional[float] = WAIT_TIMEOUT,
+                     ready_fn: Optional[Callable[[], bool]] = None):
+        """
+        将进程置为等待状态
+        
+        等待中的进程不会被轮询：超时后自动唤醒，或由 signal() 显式唤醒。
+        
+        Args:
+            pid: 进程 ID
+            reason: 等待原因
+            timeout: 超时唤醒时间（秒），None 表示只能由 signal() 唤醒
+            ready_fn: 就绪判断函数，signal() 时返回 True 才唤醒
+        """
         process = self.processes.get(pid)
         if not process:
             return
         
         if self.running and self.running.pid == pid:
-            self.running = None
+            self._release_running()
         
-        process.state = AgentState.WAITING
-        process.waiting_since = time.time()
+        self._set_state(process, AgentState.WAITING)
+        process.waiting_since = _now()
         process.waiting_reason = reason
         self.waiting_queue[pid] = process
         
+        deadline = float('inf') if timeout is None else process.waiting_since + timeout
+        self._wait_conditions[pid] = (deadline, ready_fn)
+        if timeout is not None:
+            heapq.heappush(self._wait_deadlines, (deadline, pid))
+        
         logger.debug(f"Process {process.name} is now waiting ({reason})")
     
+    def signal(self, pid: str) -> bool:
+        """
+        通知等待中的进程其等待条件可能已满足
+        
+        没有就绪判断函数或判断通过时唤醒进程。
+        
+        Returns:
+            是否唤醒了进程
+        """
+        condition = self._wait_conditions.get(pid)
+        if condition is None:
+            return False
+        ready_fn = condition[1]
+        if ready_fn is not None and not ready_fn():
+            return False
+        self.wakeup_process(pid)
+        return True
+    
     def wakeup_process(self, pid: str):
         """唤醒等待中的进程"""
         if pid in self.waiting_queue:
             process = self.waiting_queue.pop(pid)
+            self._wait_conditions.pop(pid, None)
             process.waiting_since = None
             process.waiting_reason = None
             self._enqueue(process)
@@ -659,17 +889,15 @@ class AgentScheduler:
     
     def get_process_stats(self) -> Dict[str, Any]:
         """获取进程统计"""
-        states = defaultdict(int)
-        for p in self.processes.values():
-            states[p.state.value] += 1
+        counts = self._state_counts
         
         return {
             **self.stats,
             'total_processes': len(self.processes),
-            'active_processes': len([p for p in self.processes.values() if p.is_active()]),
+            'active_processes': sum(counts[s] for s in ACTIVE_STATES),
             'running': self.running.name if self.running else None,
-            'ready_queue_size': self.ready_queue.qsize(),
+            'ready_queue_size': self._ready_count,
             'waiting_queue_size': len(self.waiting_queue),
-            'state_distribution': dict(states),
+            'state_distribution': {s.value: n for s, n in counts.items() if n},
             'quota_usage': self.quota_manager.get_usage_stats(),
         }
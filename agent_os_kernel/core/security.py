@@ -10,14 +10,18 @@ Security Subsystem - 安全子系统
 """
 
 import os
+import shlex
 import uuid
 import time
+import socket
 import logging
 import subprocess
-from typing import Optional, Dict, Any, List, Tuple
+from typing import Optional, Dict, Any, List, Tuple, FrozenSet
 from dataclasses import dataclass, field
 from enum import Enum
 
+from .types import DATACLASS_SLOTS
+
 
 logger = logging.getLogger(__name__)
 
@@ -30,12 +34,18 @@ class PermissionLevel(Enum):
     ADMIN = "admin"              # 管理权限
 
 
-@dataclass
+def _path_prefixes(paths: List[str]) -> Tuple[str, ...]:
+    """将路径列表规范化为以分隔符结尾的前缀元组"""
+    return tuple(os.path.normpath(p).rstrip(os.sep) + os.sep for p in paths)
+
+
+@dataclass(frozen=True, **DATACLASS_SLOTS)
 class SecurityPolicy:
     """
     安全策略配置
     
-    定义 Agent 的权限和资源限制
+    定义 Agent 的权限和资源限制。策略创建后不可修改，
+    需要调整时请用 dataclasses.replace() 构造新策略。
     """
     permission_level: PermissionLevel = PermissionLevel.STANDARD
     
@@ -63,8 +73,40 @@ class SecurityPolicy:
     use_sandbox: bool = True
     sandbox_image: str = "agent-sandbox:latest"
     
+    # 预先规范化的路径前缀，供 str.startswith(tuple) 一次匹配
+    _allowed_prefixes: Tuple[str, ...] = field(init=False, repr=False, compare=False)
+    _blocked_prefixes: Tuple[str, ...] = field(init=False, repr=False, compare=False)
+    
+    # 工具 / 主机名单的集合形式，成员检查为 O(1)
+    _allowed_tools_set: Optional[FrozenSet[str]] = field(init=False, repr=False, compare=False)
+    _blocked_tools_set: FrozenSet[str] = field(init=False, repr=False, compare=False)
+    _allowed_hosts_set: FrozenSet[str] = field(init=False, repr=False, compare=False)
+    _blocked_hosts_set: FrozenSet[str] = field(init=False, repr=False, compare=False)
+    
+    # to_dict() 的缓存结果
+    _cached_dict: Optional[Dict[str, Any]] = field(
+        init=False, default=None, repr=False, compare=False
+    )
+    
+    def __post_init__(self):
+        # 冻结的 dataclass 只能通过 object.__setattr__ 初始化派生字段
+        set_attr = object.__setattr__
+        set_attr(self, '_allowed_prefixes', _path_prefixes(self.allowed_paths))
+        set_attr(self, '_blocked_prefixes', _path_prefixes(self.blocked_paths))
+        set_attr(self, '_allowed_tools_set', (
+            frozenset(self.allowed_tools) if self.allowed_tools is not None else None
+        ))
+        set_attr(self, '_blocked_tools_set', frozenset(self.blocked_tools))
+        set_attr(self, '_allowed_hosts_set', frozenset(self.allowed_hosts))
+        set_attr(self, '_blocked_hosts_set', frozenset(self.blocked_hosts))
+    
     def to_dict(self) -> Dict[str, Any]:
-        """转换为字典"""
+        """转换为字典（结果会被缓存，调用方不应修改）"""
+        if self._cached_dict is None:
+            object.__setattr__(self, '_cached_dict', self._build_dict())
+        return self._cached_dict
+    
+    def _build_dict(self) -> Dict[str, Any]:
         return {
             'permission_level': self.permission_level.value,
             'allowed_paths': self.allowed_paths,
@@ -84,6 +126,122 @@ class SecurityPolicy:
         }
 
 
+# Docker 探测结果与客户端在所有 SandboxManager 实例间共享
+_DOCKER_AVAILABLE: Optional[bool] = None
+_DOCKER_CLIENT: Optional[Any] = None
+
+
+def _get_docker_client() -> Optional[Any]:
+    """获取共享的 Docker 客户端，初始化失败时返回 None"""
+    global _DOCKER_AVAILABLE, _DOCKER_CLIENT
+    if _DOCKER_CLIENT is None and _DOCKER_AVAILABLE:
+        try:
+            import docker
+            _DOCKER_CLIENT = docker.from_env()
+            logger.info("Docker sandbox available")
+        except Exception as e:
+            logger.warning(f"Docker client initialization failed: {e}")
+            _DOCKER_AVAILABLE = False
+    return _DOCKER_CLIENT
+
+
+class _ShellUnavailable(Exception):
+    """常驻 shell 在命令发出前已失效，命令未执行，可安全改用 exec_run 重试"""
+
+
+class _PersistentShell:
+    """
+    容器内常驻的 /bin/sh 会话
+    
+    每次 exec_run 都要在容器中 fork/exec 一个新进程，短命令的开销主要
+    花在这里。常驻 shell 通过 stdin 接收命令，并以哨兵行标记命令结束
+    及其退出码。
+    """
+    
+    def __init__(self, api_client, container_id: str):
+        exec_id = api_client.exec_create(
+            container_id, '/bin/sh', stdin=True, tty=False
+        )['Id']
+        sock = api_client.exec_start(exec_id, socket=True)
+        self._sock = getattr(sock, '_sock', sock)
+        self._marker = f"__AGENT_OS_END_{uuid.uuid4().hex}__".encode()
+        self.alive = True
+    
+    def run(self, command: str, timeout: int) -> Dict[str, Any]:
+        """
+        执行命令并读取输出，直到遇到哨兵行
+        
+        命令按 exec_run 的规则（shlex.split）拆分为参数并逐个转义，
+        shell 不解释其中的 ; | $ 等元字符。timeout 限制整条命令的总耗时。
+        """
+        try:
+            argv = shlex.split(command)
+        except ValueError as e:
+            return {'success': False, 'error': str(e), 'stdout': '', 'stderr': ''}
+        if not argv:
+            return {'success': False, 'error': 'Empty command', 'stdout': '', 'stderr': ''}
+        # 在子 shell 中执行，保持与 exec_run 相同的隔离性（cd/exit 不影响会话）
+        quoted = ' '.join(map(shlex.quote, argv))
+        script = f"( {quoted}\n) </dev/null; echo \"{self._marker.decode()} $?\"\n"
+        self._deadline = time.monotonic() + timeout
+        try:
+            self._sock.settimeout(timeout)
+            self._sock.sendall(script.encode())
+        except socket.timeout:
+            raise
+        except OSError as e:
+            raise _ShellUnavailable(str(e)) from e
+        
+        stdout, stderr = bytearray(), bytearray()
+        while True:
+            stream, data = self._read_frame()
+            if stream == 2:
+                stderr += data
+                continue
+            stdout += data
+            idx = stdout.find(self._marker)
+            if idx != -1:
+                line_end = stdout.find(b'\n', idx)
+                if line_end != -1:
+                    exit_code = int(stdout[idx + len(self._marker):line_end])
+                    del stdout[idx:]
+                    break
+        
+        return {
+            'success': exit_code == 0,
+            'stdout': stdout.decode(errors='replace'),
+            'stderr': stderr.decode(errors='replace'),
+            'exit_code': exit_code
+        }
+    
+    def _read_frame(self) -> Tuple[int, bytes]:
+        """读取一帧 Docker 多路复用流（8 字节头 + 数据）"""
+        header = self._read_exactly(8)
+        return header[0], self._read_exactly(int.from_bytes(header[4:8], 'big'))
+    
+    def _read_exactly(self, size: int) -> bytes:
+        buf = b''
+        while len(buf) < size:
+            # 每次读取前按剩余时间收紧超时，持续输出的命令也不能超过总时限
+            remaining = self._deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout("Command deadline exceeded")
+            self._sock.settimeout(remaining)
+            chunk = self._sock.recv(size - len(buf))
+            if not chunk:
+                raise EOFError("Persistent shell closed")
+            buf += chunk
+        return buf
+    
+    def close(self):
+        """关闭会话"""
+        self.alive = False
+        try:
+            self._sock.close()
+        except Exception:
+            pass
+
+
 class SandboxManager:
     """
     沙箱管理器
@@ -93,32 +251,27 @@ class SandboxManager:
     
     def __init__(self):
         self.containers: Dict[str, Any] = {}
-        self.docker_available = self._check_docker()
+        self._shells: Dict[str, _PersistentShell] = {}
+        self.docker_client = _get_docker_client() if self._check_docker() else None
+        self.docker_available = self.docker_client is not None
         
-        if self.docker_available:
-            try:
-                import docker
-                self.docker_client = docker.from_env()
-                logger.info("Docker sandbox available")
-            except Exception as e:
-                logger.warning(f"Docker client initialization failed: {e}")
-                self.docker_available = False
-                self.docker_client = None
-        else:
+        if not self.docker_available:
             logger.warning("Docker not available, using fallback isolation")
-            self.docker_client = None
     
     def _check_docker(self) -> bool:
-        """检查 Docker 是否可用"""
-        try:
-            result = subprocess.run(
-                ["docker", "--version"],
-                capture_output=True,
-                timeout=5
-            )
-            return result.returncode == 0
-        except Exception:
-            return False
+        """检查 Docker 是否可用（探测结果在进程内缓存）"""
+        global _DOCKER_AVAILABLE
+        if _DOCKER_AVAILABLE is None:
+            try:
+                result = subprocess.run(
+                    ["docker", "--version"],
+                    capture_output=True,
+                    timeout=5
+                )
+                _DOCKER_AVAILABLE = result.returncode == 0
+            except Exception:
+                _DOCKER_AVAILABLE = False
+        return _DOCKER_AVAILABLE
     
     def create_sandbox(self, agent_pid: str, 
                       policy: Optional[SecurityPolicy] = None) -> Optional[str]:
@@ -164,6 +317,12 @@ class SandboxManager:
             container = self.docker_client.containers.run(**container_config)
             self.containers[agent_pid] = container
             
+            # 启动常驻 shell，失败时回退到逐条 exec_run
+            try:
+                self._shells[agent_pid] = _PersistentShell(self.docker_client.api, container.id)
+            except Exception as e:
+                logger.warning(f"Persistent shell unavailable, falling back to exec_run: {e}")
+            
             logger.info(f"Created sandbox for agent {agent_pid[:8]}... (container: {container.id[:12]})")
             return container.id
             
@@ -217,11 +376,53 @@ class SandboxManager:
         
         # Docker 沙箱
         if hasattr(container, 'exec_run'):
+            shell = self._shells.get(agent_pid)
+            if shell is not None:
+                result = self._execute_in_shell(agent_pid, shell, command, timeout)
+                if result is not None:
+                    return result
             return self._execute_in_docker(container, command, timeout)
         
         # 进程级隔离
         return self._execute_in_process(container, command, timeout)
     
+    def _execute_in_shell(self, agent_pid: str, shell: _PersistentShell,
+                          command: str, timeout: int) -> Optional[Dict[str, Any]]:
+        """
+        通过常驻 shell 执行
+        
+        Returns:
+            执行结果；命令发出前 shell 已失效时返回 None，由调用方回退到 exec_run。
+            命令发出后才失败时返回错误结果，不再回退，避免有副作用的命令执行两次
+        """
+        try:
+            return shell.run(command, timeout)
+        except socket.timeout:
+            # 会话中仍有未完成的命令，无法继续复用
+            shell.close()
+            self._shells.pop(agent_pid, None)
+            return {
+                'success': False,
+                'error': f'Command timed out after {timeout} seconds',
+                'stdout': '',
+                'stderr': ''
+            }
+        except _ShellUnavailable as e:
+            logger.warning(f"Persistent shell for agent {agent_pid[:8]}... died: {e}")
+            shell.close()
+            self._shells.pop(agent_pid, None)
+            return None
+        except (OSError, EOFError, ValueError) as e:
+            logger.warning(f"Persistent shell for agent {agent_pid[:8]}... died: {e}")
+            shell.close()
+            self._shells.pop(agent_pid, None)
+            return {
+                'success': False,
+                'error': f'Persistent shell failed: {e}',
+                'stdout': '',
+                'stderr': ''
+            }
+    
     def _execute_in_docker(self, container, command: str, 
                           timeout: int) -> Dict[str, Any]:
         """在 Docker 容器中执行"""
@@ -256,24 +457,28 @@ class SandboxManager:
         policy = container_info['policy']
         workspace = container_info['workspace']
         
-        # 检查命令是否在允许的工具列表中
-        cmd_parts = command.split()
-        if cmd_parts:
-            tool_name = cmd_parts[0]
-            if policy.allowed_tools and tool_name not in policy.allowed_tools:
-                return {
-                    'success': False,
-                    'error': f'Tool {tool_name} is not in allowed tools list',
-                    'stdout': '',
-                    'stderr': ''
-                }
-            if tool_name in policy.blocked_tools:
-                return {
-                    'success': False,
-                    'error': f'Tool {tool_name} is blocked',
-                    'stdout': '',
-                    'stderr': ''
-                }
+        # 检查命令是否在允许的工具列表中（无工具限制时跳过命令解析）
+        allowed_tools = policy._allowed_tools_set
+        blocked_tools = policy._blocked_tools_set
+        if allowed_tools or blocked_tools:
+            # 只需第一个词；按任意空白切分，避免用制表符绕过检查
+            cmd_parts = command.split(None, 1)
+            tool_name = cmd_parts[0] if cmd_parts else None
+            if tool_name is not None:
+                if allowed_tools and tool_name not in allowed_tools:
+                    return {
+                        'success': False,
+                        'error': f'Tool {tool_name} is not in allowed tools list',
+                        'stdout': '',
+                        'stderr': ''
+                    }
+                if tool_name in blocked_tools:
+                    return {
+                        'success': False,
+                        'error': f'Tool {tool_name} is blocked',
+                        'stdout': '',
+                        'stderr': ''
+                    }
         
         try:
             # 设置环境变量
@@ -325,6 +530,10 @@ class SandboxManager:
         
         container = self.containers[agent_pid]
         
+        shell = self._shells.pop(agent_pid, None)
+        if shell is not None:
+            shell.close()
+        
         try:
             # Docker 沙箱
             if hasattr(container, 'stop'):
@@ -376,21 +585,20 @@ class SandboxManager:
         if mode == 'write' and policy.read_only:
             return False
         
-        # 规范化路径
-        abs_path = os.path.abspath(filepath)
+        # 规范化路径：相对路径以沙箱工作目录为基准，避免 getcwd 调用
+        if not os.path.isabs(filepath):
+            workspace = container.get('workspace') if isinstance(container, dict) \
+                else getattr(container, 'workspace', None)
+            filepath = os.path.join(workspace or f"/tmp/agent-os-{agent_pid}", filepath)
+        # 追加分隔符，使路径本身及其子路径都能匹配前缀
+        path = os.path.normpath(filepath) + os.sep
         
         # 检查禁止路径
-        for blocked in policy.blocked_paths:
-            if abs_path.startswith(blocked):
-                return False
-        
-        # 检查允许路径
-        for allowed in policy.allowed_paths:
-            if abs_path.startswith(allowed):
-                return True
+        if path.startswith(policy._blocked_prefixes):
+            return False
         
-        # 默认拒绝
-        return False
+        # 检查允许路径（默认拒绝）
+        return path.startswith(policy._allowed_prefixes)
     
     def get_sandbox_info(self, agent_pid: str) -> Optional[Dict[str, Any]]:
         """获取沙箱信息"""
@@ -441,10 +649,11 @@ class PermissionManager:
         """检查是否可以使用工具"""
         policy = self.get_policy(agent_pid)
         
-        if policy.allowed_tools is not None and tool_name not in policy.allowed_tools:
+        allowed_tools = policy._allowed_tools_set
+        if allowed_tools is not None and tool_name not in allowed_tools:
             return False
         
-        if tool_name in policy.blocked_tools:
+        if tool_name in policy._blocked_tools_set:
             return False
         
         return True
@@ -456,10 +665,11 @@ class PermissionManager:
         if not policy.network_enabled:
             return False
         
-        if policy.blocked_hosts and host in policy.blocked_hosts:
+        if host in policy._blocked_hosts_set:
             return False
         
-        if policy.allowed_hosts and host not in policy.allowed_hosts:
+        allowed_hosts = policy._allowed_hosts_set
+        if allowed_hosts and host not in allowed_hosts:
             return False
         
         return True
@@ -5,21 +5,62 @@ Service Mesh Module - Agent-OS-Kernel 服务网格模块
 提供服务发现、负载均衡、熔断器和服务间通信功能。
 """
 
-import asyncio
-import hashlib
-import json
+import bisect
+import itertools
 import logging
 import random
+import struct
 import time
 import uuid
+from collections import defaultdict
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Any, Callable, Dict, List, Optional, Tuple
-from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b, shake_128
+from operator import attrgetter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 import threading
 
+from .types import DATACLASS_SLOTS
+
 logger = logging.getLogger(__name__)
 
+_connection_count = attrgetter('connection_count')
+_weight = attrgetter('weight')
+
+# 一致性哈希环上每个实例的虚拟节点数
+HASH_RING_REPLICAS = 100
+_RING_TOKENS = struct.Struct(f'<{HASH_RING_REPLICAS}Q')
+
+
+def _hash64(key: str) -> int:
+    """计算 64 位哈希值（用于一致性哈希环）
+    
+    哈希环只需要分布均匀且跨进程稳定，不需要密码学强度：
+    blake2b 截取 8 字节比 MD5 更快，内置 hash() 则受 PYTHONHASHSEED 影响。
+    """
+    return int.from_bytes(blake2b(key.encode(), digest_size=8).digest(), 'little')
+
+
+def _ring_tokens(service_id: str) -> Tuple[int, ...]:
+    """计算实例的全部虚拟节点位置
+    
+    一次 SHAKE-128 输出 8 * HASH_RING_REPLICAS 字节再整体拆成 uint64，
+    代替逐个虚拟节点调用哈希函数。
+    """
+    digest = shake_128(service_id.encode()).digest(_RING_TOKENS.size)
+    return _RING_TOKENS.unpack(digest)
+
+
+def _jump_consistent_hash(key: int, num_buckets: int) -> int:
+    """Jump Consistent Hash (Lamping & Veach)：把 64 位 key 映射到 [0, num_buckets)"""
+    bucket, j = -1, 0
+    while j < num_buckets:
+        bucket = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
 
 class CircuitState(Enum):
     """熔断器状态"""
@@ -37,7 +78,13 @@ class LoadBalancingStrategy(Enum):
     CONSISTENT_HASH = "consistent_hash" # 一致性哈希
 
 
-@dataclass
+class ConsistentHashStrategy(Enum):
+    """一致性哈希算法"""
+    RING = "ring"   # 虚拟节点哈希环，任意实例下线只迁移其 key，O(log N) 查找
+    JUMP = "jump"   # Jump Consistent Hash，无需建环、O(1) 内存，只适合尾部增删
+
+
+@dataclass(**DATACLASS_SLOTS)
 class ServiceInstance:
     """服务实例"""
     service_id: str
@@ -60,7 +107,7 @@ class ServiceInstance:
         return self.status == "healthy"
 
 
-@dataclass
+@dataclass(**DATACLASS_SLOTS)
 class ServiceInfo:
     """服务信息"""
     name: str
@@ -68,6 +115,8 @@ class ServiceInfo:
     instances: List[ServiceInstance] = field(default_factory=list)
     description: str = ""
     tags: List[str] = field(default_factory=list)
+    # 健康实例（保持 instances 中的顺序），由注册中心在实例增删和状态变更时维护
+    healthy_instances: List[ServiceInstance] = field(default_factory=list)
 
 
 class CircuitBreaker:
@@ -90,53 +139,86 @@ class CircuitBreaker:
         self._state = CircuitState.CLOSED
         self._failure_count = 0
         self._success_count = 0
+        # 熔断打开的时刻（time.monotonic()，不受系统时间调整影响）
         self._last_failure_time: Optional[float] = None
         self._half_open_calls = 0
-        self._lock = threading.Lock()
+        # 状态转换与计数分开加锁：计数是高频路径，不应等待状态转换
+        # 锁顺序：_state_lock -> _count_lock；读取状态不加锁（属性读写在 GIL 下是原子的）
+        self._state_lock = threading.Lock()
+        self._count_lock = threading.Lock()
         
     @property
     def state(self) -> CircuitState:
         """获取当前状态"""
-        with self._lock:
-            if self._state == CircuitState.OPEN:
-                if time.time() - self._last_failure_time >= self.timeout_seconds:
-                    self._state = CircuitState.HALF_OPEN
+        state = self._state
+        if (state is CircuitState.OPEN
+                and time.monotonic() - self._last_failure_time >= self.timeout_seconds):
+            self._compare_and_set(CircuitState.OPEN, CircuitState.HALF_OPEN)
+            return self._state
+        return state
+    
+    def _compare_and_set(self, expected: CircuitState, new: CircuitState) -> bool:
+        """状态比较并交换，并发转换时只有一个调用方成功"""
+        with self._state_lock:
+            if self._state is not expected:
+                return False
+            with self._count_lock:
+                if new is CircuitState.HALF_OPEN:
                     self._half_open_calls = 0
                     self._success_count = 0
-            return self._state
+                elif new is CircuitState.CLOSED:
+                    self._failure_count = 0
+            if new is CircuitState.OPEN:
+                # 先写时间再发布状态，无锁读到 OPEN 时时间已就绪
+                self._last_failure_time = time.monotonic()
+            self._state = new
+            return True
     
     def record_success(self):
         """记录成功调用"""
-        with self._lock:
-            if self._state == CircuitState.HALF_OPEN:
+        state = self._state
+        if state is CircuitState.CLOSED:
+            # 快速路径：无失败计数时没有需要更新的状态
+            if not self._failure_count:
+                return
+            with self._count_lock:
+                self._failure_count = max(0, self._failure_count - 1)
+        elif state is CircuitState.HALF_OPEN:
+            with self._count_lock:
                 self._success_count += 1
                 self._half_open_calls += 1
-                if self._success_count >= self.success_threshold:
-                    self._state = CircuitState.CLOSED
-                    self._failure_count = 0
-                    logger.info(f"Circuit breaker {self.name} closed")
-            elif self._state == CircuitState.CLOSED:
-                self._failure_count = max(0, self._failure_count - 1)
+                should_close = self._success_count >= self.success_threshold
+            if should_close and self._compare_and_set(
+                CircuitState.HALF_OPEN, CircuitState.CLOSED
+            ):
+                logger.info(f"Circuit breaker {self.name} closed")
     
     def record_failure(self):
         """记录失败调用"""
-        with self._lock:
-            if self._state == CircuitState.HALF_OPEN:
+        state = self._state
+        if state is CircuitState.HALF_OPEN:
+            with self._count_lock:
                 self._half_open_calls += 1
-                if self._half_open_calls >= self.half_open_max_calls:
-                    self._state = CircuitState.OPEN
-                    self._last_failure_time = time.time()
-                    logger.warning(f"Circuit breaker {self.name} opened due to failure")
-            elif self._state == CircuitState.CLOSED:
+                should_open = self._half_open_calls >= self.half_open_max_calls
+            if should_open and self._compare_and_set(
+                CircuitState.HALF_OPEN, CircuitState.OPEN
+            ):
+                logger.warning(f"Circuit breaker {self.name} opened due to failure")
+        elif state is CircuitState.CLOSED:
+            with self._count_lock:
                 self._failure_count += 1
-                if self._failure_count >= self.failure_threshold:
-                    self._state = CircuitState.OPEN
-                    self._last_failure_time = time.time()
-                    logger.warning(f"Circuit breaker {self.name} opened")
+                should_open = self._failure_count >= self.failure_threshold
+            if should_open and self._compare_and_set(
+                CircuitState.CLOSED, CircuitState.OPEN
+            ):
+                logger.warning(f"Circuit breaker {self.name} opened")
     
     def allow_request(self) -> bool:
         """是否允许请求"""
-        return self.state != CircuitState.OPEN
+        # 关闭状态是绝大多数情况，直接放行，不读时钟
+        if self._state is CircuitState.CLOSED:
+            return True
+        return self.state is not CircuitState.OPEN
     
     def call_with_circuit(
         self,
@@ -163,10 +245,11 @@ class CircuitBreaker:
     
     def get_stats(self) -> Dict[str, Any]:
         """获取统计信息"""
-        with self._lock:
+        state = self.state
+        with self._count_lock:
             return {
                 "name": self.name,
-                "state": self.state.value,
+                "state": state.value,
                 "failure_count": self._failure_count,
                 "success_count": self._success_count,
                 "failure_threshold": self.failure_threshold,
@@ -180,88 +263,231 @@ class CircuitBreakerOpen(Exception):
     pass
 
 
+class _RWLock:
+    """读写锁 - 读者之间互不阻塞，写者独占
+    
+    有写者等待时新读者让路，避免写者饥饿。不可重入。
+    """
+    
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+    
+    @contextmanager
+    def read_lock(self):
+        """获取读锁"""
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+    
+    @contextmanager
+    def write_lock(self):
+        """获取写锁"""
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+# 注册表分片数（2 的幂，便于按位取模）
+REGISTRY_SHARDS = 16
+
+
+class _Shard:
+    """注册表分片 - 每个分片持有一部分服务及其独立的读写锁"""
+    
+    __slots__ = ('lock', 'services', 'instances')
+    
+    def __init__(self):
+        self.lock = _RWLock()
+        self.services: Dict[str, ServiceInfo] = {}
+        self.instances: Dict[str, ServiceInstance] = {}
+
+
 class ServiceRegistry:
-    """服务注册中心 - 服务发现"""
+    """服务注册中心 - 服务发现
+    
+    按 service_name 分片，不同服务的发现与状态更新互不阻塞。
+    """
     
     def __init__(self):
-        self._services: Dict[str, ServiceInfo] = {}
-        self._instances: Dict[str, ServiceInstance] = {}
-        self._lock = threading.RLock()
+        self._shards: List[_Shard] = [_Shard() for _ in range(REGISTRY_SHARDS)]
+        # service_id -> service_name，用于按实例 ID 定位分片
+        self._instance_index: Dict[str, str] = {}
+        # 只保护实例索引的增删（注册/注销），锁顺序：索引锁 -> 分片锁
+        self._index_lock = threading.Lock()
         self._event_callbacks: List[Callable] = []
+        # 注册表版本号：每次变更取一个新值（next 在 GIL 下是原子的）
+        self._version_counter = itertools.count(1)
+        self._version = 0
+        # service_name -> (版本号, 健康实例列表)
+        self._discover_cache: Dict[str, Tuple[int, List[ServiceInstance]]] = {}
+        # (版本号, 统计信息)
+        self._stats_cache: Optional[Tuple[int, Dict[str, Any]]] = None
+    
+    def _bump_version(self):
+        """注册表变更后调用，使所有 discover 缓存失效"""
+        self._version = next(self._version_counter)
+    
+    @property
+    def version(self) -> int:
+        """注册表版本号；实例增删、状态或权重变更后改变"""
+        return self._version
+    
+    def _shard_for(self, service_name: str) -> _Shard:
+        """获取服务所在分片"""
+        return self._shards[hash(service_name) & (REGISTRY_SHARDS - 1)]
+    
+    def _shard_for_instance(self, service_id: str) -> Optional[_Shard]:
+        """根据实例 ID 获取分片"""
+        service_name = self._instance_index.get(service_id)
+        if service_name is None:
+            return None
+        return self._shard_for(service_name)
         
     def register(self, instance: ServiceInstance) -> bool:
         """注册服务实例"""
-        with self._lock:
-            if instance.service_id in self._instances:
+        shard = self._shard_for(instance.service_name)
+        with self._index_lock:
+            if instance.service_id in self._instance_index:
                 logger.warning(f"Service {instance.service_id} already registered")
                 return False
             
-            self._instances[instance.service_id] = instance
-            
-            if instance.service_name not in self._services:
-                self._services[instance.service_name] = ServiceInfo(
-                    name=instance.service_name,
-                    version="1.0.0",
-                )
-            self._services[instance.service_name].instances.append(instance)
-            
-            self._notify_event("register", instance)
-            logger.info(f"Registered service: {instance.service_id} at {instance.address}")
-            return True
+            with shard.lock.write_lock():
+                self._instance_index[instance.service_id] = instance.service_name
+                shard.instances[instance.service_id] = instance
+                
+                if instance.service_name not in shard.services:
+                    shard.services[instance.service_name] = ServiceInfo(
+                        name=instance.service_name,
+                        version="1.0.0",
+                    )
+                service = shard.services[instance.service_name]
+                service.instances.append(instance)
+                if instance.is_healthy:
+                    service.healthy_instances.append(instance)
+                self._bump_version()
+        
+        # 写锁不可重入，回调在锁外执行，允许其中再调用 discover 等方法
+        self._notify_event("register", instance)
+        logger.info(f"Registered service: {instance.service_id} at {instance.address}")
+        return True
     
     def deregister(self, service_id: str) -> bool:
         """注销服务实例"""
-        with self._lock:
-            if service_id not in self._instances:
+        with self._index_lock:
+            shard = self._shard_for_instance(service_id)
+            if shard is None:
                 return False
             
-            instance = self._instances.pop(service_id)
-            if instance.service_name in self._services:
-                service = self._services[instance.service_name]
-                service.instances = [
-                    i for i in service.instances if i.service_id != service_id
-                ]
-            
-            self._notify_event("deregister", instance)
-            logger.info(f"Deregistered service: {service_id}")
-            return True
+            with shard.lock.write_lock():
+                del self._instance_index[service_id]
+                instance = shard.instances.pop(service_id)
+                if instance.service_name in shard.services:
+                    service = shard.services[instance.service_name]
+                    service.instances = [
+                        i for i in service.instances if i.service_id != service_id
+                    ]
+                    service.healthy_instances = [
+                        i for i in service.healthy_instances if i.service_id != service_id
+                    ]
+                self._bump_version()
+        
+        self._notify_event("deregister", instance)
+        logger.info(f"Deregistered service: {service_id}")
+        return True
     
     def discover(self, service_name: str) -> List[ServiceInstance]:
         """发现服务实例"""
-        with self._lock:
-            if service_name not in self._services:
+        # 版本号必须在读取注册表之前获取，这样并发变更一定会使本次结果失效
+        version = self._version
+        cached = self._discover_cache.get(service_name)
+        if cached is not None and cached[0] == version:
+            return list(cached[1])
+        
+        shard = self._shard_for(service_name)
+        with shard.lock.read_lock():
+            if service_name not in shard.services:
                 return []
-            return [
-                i for i in self._services[service_name].instances 
-                if i.is_healthy
-            ]
+            healthy = list(shard.services[service_name].healthy_instances)
+        self._discover_cache[service_name] = (version, healthy)
+        return list(healthy)
     
     def get_service_info(self, service_name: str) -> Optional[ServiceInfo]:
         """获取服务信息"""
-        with self._lock:
-            return self._services.get(service_name)
+        shard = self._shard_for(service_name)
+        with shard.lock.read_lock():
+            return shard.services.get(service_name)
     
     def get_all_services(self) -> List[str]:
         """获取所有服务名称"""
-        with self._lock:
-            return list(self._services.keys())
+        names: List[str] = []
+        for shard in self._shards:
+            with shard.lock.read_lock():
+                names.extend(shard.services)
+        return names
     
     def update_heartbeat(self, service_id: str) -> bool:
         """更新心跳"""
-        with self._lock:
-            if service_id not in self._instances:
+        shard = self._shard_for_instance(service_id)
+        if shard is None:
+            return False
+        # 只改写实例自身的时间戳，不改变注册表结构，读锁即可
+        with shard.lock.read_lock():
+            instance = shard.instances.get(service_id)
+            if instance is None:
                 return False
-            self._instances[service_id].last_heartbeat = time.time()
+            instance.last_heartbeat = time.time()
             return True
     
     def update_status(self, service_id: str, status: str) -> bool:
         """更新服务状态"""
-        with self._lock:
-            if service_id not in self._instances:
+        shard = self._shard_for_instance(service_id)
+        if shard is None:
+            return False
+        with shard.lock.write_lock():
+            instance = shard.instances.get(service_id)
+            if instance is None:
                 return False
-            self._instances[service_id].status = status
-            self._notify_event("status_change", self._instances[service_id], status)
-            return True
+            instance.status = status
+            service = shard.services[instance.service_name]
+            # 健康状态变化很少发生，按 instances 重建以保持顺序
+            service.healthy_instances = [i for i in service.instances if i.is_healthy]
+            self._bump_version()
+        
+        self._notify_event("status_change", instance, status)
+        return True
+    
+    def update_weight(self, service_id: str, weight: int) -> bool:
+        """更新实例权重（直接修改 instance.weight 不会使按版本号缓存的累计权重失效）"""
+        shard = self._shard_for_instance(service_id)
+        if shard is None:
+            return False
+        with shard.lock.write_lock():
+            instance = shard.instances.get(service_id)
+            if instance is None:
+                return False
+            instance.weight = weight
+            self._bump_version()
+        return True
     
     def on_event(self, callback: Callable):
         """注册事件回调"""
@@ -277,20 +503,36 @@ class ServiceRegistry:
     
     def get_stats(self) -> Dict[str, Any]:
         """获取统计信息"""
-        with self._lock:
-            return {
-                "total_services": len(self._services),
-                "total_instances": len(self._instances),
-                "services": {
-                    name: {
+        # 统计只随注册表变更而变化，版本号未变时直接复用（返回副本，调用方可自由修改）
+        version = self._version
+        cached = self._stats_cache
+        if cached is None or cached[0] != version:
+            cached = (version, self._collect_stats())
+            self._stats_cache = cached
+        stats = cached[1]
+        return {
+            "total_services": stats["total_services"],
+            "total_instances": stats["total_instances"],
+            "services": {name: dict(info) for name, info in stats["services"].items()},
+        }
+    
+    def _collect_stats(self) -> Dict[str, Any]:
+        """遍历所有分片收集统计信息"""
+        total_instances = 0
+        services: Dict[str, Dict[str, int]] = {}
+        for shard in self._shards:
+            with shard.lock.read_lock():
+                total_instances += len(shard.instances)
+                for name, info in shard.services.items():
+                    services[name] = {
                         "instance_count": len(info.instances),
-                        "healthy_count": sum(
-                            1 for i in info.instances if i.is_healthy
-                        ),
+                        "healthy_count": len(info.healthy_instances),
                     }
-                    for name, info in self._services.items()
-                },
-            }
+        return {
+            "total_services": len(services),
+            "total_instances": total_instances,
+            "services": services,
+        }
 
 
 class LoadBalancer:
@@ -299,18 +541,32 @@ class LoadBalancer:
     def __init__(
         self,
         strategy: LoadBalancingStrategy = LoadBalancingStrategy.ROUND_ROBIN,
+        hash_strategy: ConsistentHashStrategy = ConsistentHashStrategy.RING,
     ):
         self.strategy = strategy
-        self._round_robin_index: Dict[str, int] = {}
+        self.hash_strategy = hash_strategy
+        # 每个服务一个计数器；next() 在 GIL 下原子递增，并发调用不会拿到相同序号
+        self._round_robin_index: Dict[str, Iterator[int]] = defaultdict(itertools.count)
         self._connection_counts: Dict[str, int] = {}
-        self._hash_ring: Dict[str, List[Tuple[int, str]]] = {}
+        # service_name -> (实例 ID 元组, 有序虚拟节点哈希, 对应实例下标)
+        self._hash_ring: Dict[str, Tuple[Tuple[str, ...], List[int], List[int]]] = {}
+        # service_name -> (注册表版本号或权重序列, 累计权重, 总权重)
+        self._cum_weights: Dict[str, Tuple[Any, List[int], int]] = {}
         
     def select(
         self,
         instances: List[ServiceInstance],
         key: Optional[str] = None,
+        version: Optional[int] = None,
     ) -> Optional[ServiceInstance]:
-        """选择服务实例"""
+        """选择服务实例
+        
+        Args:
+            instances: 候选实例
+            key: 一致性哈希的键
+            version: 取得 instances 之前读取的注册表版本号；提供时加权选择按版本号
+                复用累计权重，不再逐个读取权重
+        """
         if not instances:
             return None
         
@@ -323,7 +579,7 @@ class LoadBalancer:
         elif self.strategy == LoadBalancingStrategy.RANDOM:
             return self._random_select(healthy_instances)
         elif self.strategy == LoadBalancingStrategy.WEIGHTED:
-            return self._weighted_select(healthy_instances)
+            return self._weighted_select(healthy_instances, version)
         elif self.strategy == LoadBalancingStrategy.LEAST_CONNECTIONS:
             return self._least_connections_select(healthy_instances)
         elif self.strategy == LoadBalancingStrategy.CONSISTENT_HASH:
@@ -335,12 +591,8 @@ class LoadBalancer:
         self, instances: List[ServiceInstance]
     ) -> ServiceInstance:
         """轮询选择"""
-        service_name = instances[0].service_name
-        if service_name not in self._round_robin_index:
-            self._round_robin_index[service_name] = 0
-        index = self._round_robin_index[service_name]
-        self._round_robin_index[service_name] = (index + 1) % len(instances)
-        return instances[index]
+        counter = self._round_robin_index[instances[0].service_name]
+        return instances[next(counter) % len(instances)]
     
     def _random_select(
         self, instances: List[ServiceInstance]
@@ -349,26 +601,35 @@ class LoadBalancer:
         return random.choice(instances)
     
     def _weighted_select(
-        self, instances: List[ServiceInstance]
+        self, instances: List[ServiceInstance], version: Optional[int] = None
     ) -> ServiceInstance:
         """加权选择"""
-        total_weight = sum(i.weight for i in instances)
+        # 累计权重只取决于权重序列，序列不变时复用缓存，选择变为一次二分查找。
+        # 给出注册表版本号时直接按版本号判断，避免每次 O(N) 地重建权重序列
+        service_name = instances[0].service_name
+        cached = self._cum_weights.get(service_name)
+        if version is not None:
+            cache_key: Any = version
+            stale = cached is None or cached[0] != version or len(cached[1]) != len(instances)
+        else:
+            cache_key = tuple(map(_weight, instances))
+            stale = cached is None or cached[0] != cache_key
+        if stale:
+            cumulative = list(itertools.accumulate(map(_weight, instances)))
+            cached = (cache_key, cumulative, cumulative[-1])
+            self._cum_weights[service_name] = cached
+        
+        _, cumulative, total_weight = cached
         if total_weight <= 0:
             return random.choice(instances)
         
-        random_value = random.randint(1, total_weight)
-        cumulative = 0
-        for instance in instances:
-            cumulative += instance.weight
-            if random_value <= cumulative:
-                return instance
-        return instances[-1]
+        return instances[bisect.bisect_left(cumulative, random.randint(1, total_weight))]
     
     def _least_connections_select(
         self, instances: List[ServiceInstance]
     ) -> ServiceInstance:
         """最少连接选择"""
-        return min(instances, key=lambda i: i.connection_count)
+        return min(instances, key=_connection_count)
     
     def _consistent_hash_select(
         self,
@@ -376,28 +637,41 @@ class LoadBalancer:
         key: Optional[str] = None,
     ) -> ServiceInstance:
         """一致性哈希选择"""
-        if not key:
-            key = str(uuid.uuid4())
-        
-        hash_value = int(hashlib.md5(key.encode()).hexdigest(), 16)
-        
         if not instances:
             return None
         
-        # 简单的一致性哈希实现
-        best_instance = instances[0]
-        best_distance = float('inf')
+        if not key:
+            # 没有路由 key 时一致性没有意义，任选一个实例即可
+            return random.choice(instances)
         
-        for instance in instances:
-            instance_hash = int(
-                hashlib.md5(f"{instance.service_id}".encode()).hexdigest(), 16
-            )
-            distance = (instance_hash - hash_value) % (2 ** 128)
-            if distance < best_distance:
-                best_distance = distance
-                best_instance = instance
+        if self.hash_strategy == ConsistentHashStrategy.JUMP:
+            return instances[_jump_consistent_hash(_hash64(key), len(instances))]
         
-        return best_instance
+        tokens, owners = self._get_hash_ring(instances)
+        index = bisect.bisect_left(tokens, _hash64(key))
+        if index == len(tokens):
+            index = 0
+        return instances[owners[index]]
+    
+    def _get_hash_ring(
+        self, instances: List[ServiceInstance]
+    ) -> Tuple[List[int], List[int]]:
+        """获取哈希环，实例集合变化时重建"""
+        service_name = instances[0].service_name
+        members = tuple(i.service_id for i in instances)
+        ring = self._hash_ring.get(service_name)
+        if ring is not None and ring[0] == members:
+            return ring[1], ring[2]
+        
+        points = sorted(
+            (token, index)
+            for index, service_id in enumerate(members)
+            for token in _ring_tokens(service_id)
+        )
+        tokens = [token for token, _ in points]
+        owners = [index for _, index in points]
+        self._hash_ring[service_name] = (members, tokens, owners)
+        return tokens, owners
     
     def record_connection(self, instance: ServiceInstance):
         """记录连接"""
@@ -422,7 +696,6 @@ class ServiceClient:
         self.load_balancer = load_balancer or LoadBalancer()
         self.default_timeout = default_timeout
         self._circuit_breakers: Dict[str, CircuitBreaker] = {}
-        self._executor = ThreadPoolExecutor(max_workers=10)
         
         if circuit_breaker:
             self._circuit_breakers["default"] = circuit_breaker
@@ -439,11 +712,12 @@ class ServiceClient:
         fallback: Optional[Callable] = None,
     ) -> Dict[str, Any]:
         """调用服务"""
+        version = self.registry.version
         instances = self.registry.discover(service_name)
         if not instances:
             raise ServiceNotFound(f"Service {service_name} not found")
         
-        instance = self.load_balancer.select(instances, key=path)
+        instance = self.load_balancer.select(instances, key=path, version=version)
         if not instance:
             raise NoHealthyInstance(f"No healthy instance for {service_name}")
         
@@ -479,11 +753,12 @@ class ServiceClient:
         timeout: Optional[float] = None,
     ) -> Dict[str, Any]:
         """异步调用服务"""
+        version = self.registry.version
         instances = self.registry.discover(service_name)
         if not instances:
             raise ServiceNotFound(f"Service {service_name} not found")
         
-        instance = self.load_balancer.select(instances, key=path)
+        instance = self.load_balancer.select(instances, key=path, version=version)
         if not instance:
             raise NoHealthyInstance(f"No healthy instance for {service_name}")
         
@@ -548,7 +823,7 @@ class ServiceClient:
         """获取客户端统计"""
         return {
             "registry_stats": self.registry.get_stats(),
-            "load_balancer_strategy": self.strategy.value if hasattr(self, 'strategy') else 'default',
+            "load_balancer_strategy": self.load_balancer.strategy.value,
             "circuit_breakers": {
                 name: cb.get_stats()
                 for name, cb in self._circuit_breakers.items()
@@ -655,9 +930,10 @@ def create_service_registry() -> ServiceRegistry:
 
 def create_load_balancer(
     strategy: LoadBalancingStrategy = LoadBalancingStrategy.ROUND_ROBIN,
+    hash_strategy: ConsistentHashStrategy = ConsistentHashStrategy.RING,
 ) -> LoadBalancer:
     """创建负载均衡器"""
-    return LoadBalancer(strategy)
+    return LoadBalancer(strategy, hash_strategy)
 
 
 def create_circuit_breaker(
@@ -11,15 +11,23 @@ State Management - 状态管理
 
 import asyncio
 import logging
-from typing import Dict, Any, Optional, List
+from collections import deque
+from itertools import islice
+from typing import Dict, Any, Optional, List, Deque
 from dataclasses import dataclass, field
-from datetime import datetime, timezone, timedelta
+from datetime import datetime
 from enum import Enum
-import json
-import copy
+
+from .types import DATACLASS_SLOTS
 
 logger = logging.getLogger(__name__)
 
+# 每个 Agent 保留的最近状态转换条数
+MAX_TRANSITIONS = 10_000
+
+# 增量持久化时，每追加这么多条转换写一次完整检查点，限制恢复时的回放量
+CHECKPOINT_INTERVAL = 100
+
 
 class AgentState(Enum):
     """Agent 状态"""
@@ -35,7 +43,7 @@ class AgentState(Enum):
     SUSPENDED = "suspended"   # 暂停
 
 
-@dataclass
+@dataclass(**DATACLASS_SLOTS)
 class StateTransition:
     """状态转换"""
     from_state: AgentState
@@ -45,20 +53,43 @@ class StateTransition:
     data: Dict = field(default_factory=dict)
 
 
-@dataclass
+def _transition_to_dict(t: StateTransition) -> Dict:
+    """序列化状态转换（检查点与增量记录共用）"""
+    return {
+        "from": t.from_state.value,
+        "to": t.to_state.value,
+        "time": t.timestamp.isoformat(),
+        "reason": t.reason
+    }
+
+
+def _transition_from_dict(t: Dict) -> StateTransition:
+    """反序列化状态转换"""
+    return StateTransition(
+        from_state=AgentState(t["from"]),
+        to_state=AgentState(t["to"]),
+        timestamp=datetime.fromisoformat(t["time"]),
+        reason=t["reason"]
+    )
+
+
+@dataclass(**DATACLASS_SLOTS)
 class AgentStateRecord:
     """Agent 状态记录"""
     agent_id: str
     current_state: AgentState
     created_at: datetime
     updated_at: datetime
-    transitions: List[StateTransition] = field(default_factory=list)
+    transitions: Deque[StateTransition] = field(
+        default_factory=lambda: deque(maxlen=MAX_TRANSITIONS)
+    )
     metadata: Dict = field(default_factory=dict)
     
     def __post_init__(self):
         if not self.created_at:
             self.created_at = datetime.now()
-        self.updated_at = self.created_at
+        if not self.updated_at:
+            self.updated_at = self.created_at
 
 
 class StateManager:
@@ -70,12 +101,32 @@ class StateManager:
     2. 状态转换
     3. 状态持久化
     4. 状态恢复
+    
+    存储约定：
+    - save_agent_state(agent_id, checkpoint) 写入完整检查点（已包含此前全部转换），
+      必须同时丢弃该 Agent 已存的增量，否则恢复时会重复回放
+    - append_transition(agent_id, transition) 可选；提供时每次转换只追加增量，
+      每 CHECKPOINT_INTERVAL 条转换改写一次完整检查点
+    - 恢复时取最近的检查点及其后追加的增量，按顺序传给 restore()
     """
     
     def __init__(self, storage=None):
         self._states: Dict[str, AgentStateRecord] = {}
         self._storage = storage
-        self._lock = asyncio.Lock()
+        # 每个 Agent 一把锁，不同 Agent 的创建/转换（含存储写入）互不阻塞
+        self._agent_locks: Dict[str, asyncio.Lock] = {}
+        # 存储支持 append_transition 时只追加增量，否则每次保存完整检查点
+        self._incremental = storage is not None and hasattr(storage, "append_transition")
+        # agent_id -> 自上次完整检查点以来追加的转换数
+        self._pending_deltas: Dict[str, int] = {}
+    
+    def _agent_lock(self, agent_id: str) -> asyncio.Lock:
+        """获取 Agent 的锁（按需创建）"""
+        lock = self._agent_locks.get(agent_id)
+        if lock is None:
+            # 查找与插入之间没有 await，在事件循环内是原子的，无需额外的引导锁
+            lock = self._agent_locks.setdefault(agent_id, asyncio.Lock())
+        return lock
     
     async def create_agent(
         self,
@@ -84,12 +135,13 @@ class StateManager:
         metadata: Dict = None
     ) -> AgentStateRecord:
         """创建 Agent 状态"""
-        async with self._lock:
+        async with self._agent_lock(agent_id):
+            now = datetime.now()
             record = AgentStateRecord(
                 agent_id=agent_id,
                 current_state=initial_state,
-                created_at=datetime.now(),
-                updated_at=datetime.now(),
+                created_at=now,
+                updated_at=now,
                 metadata=metadata or {}
             )
             self._states[agent_id] = record
@@ -108,29 +160,30 @@ class StateManager:
         data: Dict = None
     ) -> bool:
         """状态转换"""
-        async with self._lock:
-            if agent_id not in self._states:
-                logger.warning(f"Agent not found: {agent_id}")
-                return False
-            
+        if agent_id not in self._states:
+            logger.warning(f"Agent not found: {agent_id}")
+            return False
+        
+        async with self._agent_lock(agent_id):
             record = self._states[agent_id]
             from_state = record.current_state
+            now = datetime.now()
             
-            # 创建转换记录
+            # 创建转换记录（与 updated_at 共用同一次时钟读取）
             transition = StateTransition(
                 from_state=from_state,
                 to_state=to_state,
-                timestamp=datetime.now(),
+                timestamp=now,
                 reason=reason,
                 data=data or {}
             )
             
             record.transitions.append(transition)
             record.current_state = to_state
-            record.updated_at = datetime.now()
+            record.updated_at = now
             
             if self._storage:
-                await self._save_state(record)
+                await self._save_transition(record, transition)
             
             logger.info(
                 f"State transition: {agent_id} "
@@ -165,7 +218,9 @@ class StateManager:
         """获取转换历史"""
         record = self._states.get(agent_id)
         if record:
-            return record.transitions[-limit:]
+            if limit <= 0:
+                return list(record.transitions)
+            return list(islice(reversed(record.transitions), limit))[::-1]
         return []
     
     async def checkpoint(self, agent_id: str) -> Dict:
@@ -178,20 +233,23 @@ class StateManager:
                 "created_at": record.created_at.isoformat(),
                 "updated_at": record.updated_at.isoformat(),
                 "transitions": [
-                    {
-                        "from": t.from_state.value,
-                        "to": t.to_state.value,
-                        "time": t.timestamp.isoformat(),
-                        "reason": t.reason
-                    }
-                    for t in record.transitions
+                    _transition_to_dict(t) for t in record.transitions
                 ],
                 "metadata": record.metadata
             }
         return None
     
-    async def restore(self, checkpoint: Dict) -> bool:
-        """从检查点恢复"""
+    async def restore(
+        self,
+        checkpoint: Dict,
+        transitions: Optional[List[Dict]] = None
+    ) -> bool:
+        """从检查点恢复
+        
+        Args:
+            checkpoint: 完整检查点
+            transitions: 检查点之后通过 append_transition 追加的增量转换，按顺序回放
+        """
         try:
             record = AgentStateRecord(
                 agent_id=checkpoint["agent_id"],
@@ -201,17 +259,21 @@ class StateManager:
                 metadata=checkpoint.get("metadata", {})
             )
             
-            record.transitions = [
-                StateTransition(
-                    from_state=AgentState(t["from"]),
-                    to_state=AgentState(t["to"]),
-                    timestamp=datetime.fromisoformat(t["time"]),
-                    reason=t["reason"]
-                )
+            record.transitions.extend(
+                _transition_from_dict(t)
                 for t in checkpoint.get("transitions", [])
-            ]
+            )
+            
+            transitions = transitions or ()
+            for t in transitions:
+                transition = _transition_from_dict(t)
+                record.transitions.append(transition)
+                record.current_state = transition.to_state
+                record.updated_at = transition.timestamp
             
             self._states[record.agent_id] = record
+            # 回放的增量仍在存储中，计入计数，下一次完整检查点按原节奏写入
+            self._pending_deltas[record.agent_id] = len(transitions)
             return True
         except Exception as e:
             logger.error(f"Restore failed: {e}")
@@ -222,6 +284,23 @@ class StateManager:
         if self._storage:
             checkpoint = await self.checkpoint(record.agent_id)
             await self._storage.save_agent_state(record.agent_id, checkpoint)
+            self._pending_deltas[record.agent_id] = 0
+    
+    async def _save_transition(
+        self,
+        record: AgentStateRecord,
+        transition: StateTransition
+    ):
+        """持久化一次状态转换：优先追加增量，定期写完整检查点"""
+        pending = self._pending_deltas.get(record.agent_id, 0) + 1
+        if not self._incremental or pending >= CHECKPOINT_INTERVAL:
+            await self._save_state(record)
+            return
+        
+        await self._storage.append_transition(
+            record.agent_id, _transition_to_dict(transition)
+        )
+        self._pending_deltas[record.agent_id] = pending
     
     def get_stats(self) -> Dict:
         """获取统计"""
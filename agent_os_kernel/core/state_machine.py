@@ -8,12 +8,25 @@
 - 状态回调
 """
 
-from typing import Dict, List, Callable, Any, Optional, Set
+from typing import (
+    Dict, List, Callable, Any, Optional, Set, FrozenSet, Tuple, Deque, Mapping, Iterable
+)
+from collections import deque
+from contextlib import nullcontext
+from types import MappingProxyType
 from enum import Enum
 from dataclasses import dataclass, field
 from functools import wraps
+import sys
 import threading
 
+from .types import DATACLASS_SLOTS
+
+
+# 查找缺省值：共享的只读空表和空元组，避免每次分发都分配新对象
+_NO_EVENTS: Mapping[str, tuple] = MappingProxyType({})
+_EMPTY: tuple = ()
+
 
 class TransitionType(Enum):
     """转换类型"""
@@ -21,7 +34,7 @@ class TransitionType(Enum):
     ASYNCHRONOUS = "asynchronous"
 
 
-@dataclass
+@dataclass(**DATACLASS_SLOTS)
 class Transition:
     """状态转换定义"""
     from_state: str
@@ -30,9 +43,14 @@ class Transition:
     guard: Optional[Callable[[], bool]] = None
     action: Optional[Callable[[Any], None]] = None
     transition_type: TransitionType = TransitionType.SYNCHRONOUS
+    # 无守卫且无动作的转换，trigger_event 走快速路径
+    _fast: bool = field(default=False, init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        self._fast = self.guard is None and self.action is None
 
 
-@dataclass
+@dataclass(**DATACLASS_SLOTS)
 class StateCallbacks:
     """状态回调"""
     on_enter: Optional[Callable[[], None]] = None
@@ -40,6 +58,44 @@ class StateCallbacks:
     on_update: Optional[Callable[[float], None]] = None
 
 
+class StateMachineSchema:
+    """
+    状态机拓扑快照
+    
+    由 StateMachine.export_schema() 生成，包含转换表、回调表和预编译分发表。
+    多个状态机实例可以共享同一份拓扑，各自只保存当前状态等运行时数据；
+    任一实例修改拓扑前会先复制自己的表（写时复制），快照本身保持不变。
+    
+    示例:
+        template = StateMachine(initial_state="idle")
+        template.add_transition("idle", "running", "start")
+        schema = template.export_schema()
+        
+        agents = [StateMachine("idle", schema=schema) for _ in range(1000)]
+    """
+    
+    __slots__ = ('transitions', 'on_enter', 'on_exit', 'on_update', 'dispatch')
+    
+    def __init__(
+        self,
+        transitions: Dict[str, Dict[str, Tuple[Transition, ...]]],
+        on_enter: Dict[str, Callable[[], None]],
+        on_exit: Dict[str, Callable[[], None]],
+        on_update: Dict[str, Callable[[float], None]],
+        dispatch: Optional[Dict[str, Dict[str, Tuple[tuple, ...]]]] = None
+    ):
+        self.transitions = transitions
+        self.on_enter = on_enter
+        self.on_exit = on_exit
+        self.on_update = on_update
+        self.dispatch = dispatch
+    
+    @property
+    def states(self) -> Set[str]:
+        """获取所有状态"""
+        return set(self.transitions)
+
+
 class StateMachine:
     """
     状态机实现
@@ -59,7 +115,9 @@ class StateMachine:
     def __init__(
         self,
         initial_state: str,
-        name: str = "StateMachine"
+        name: str = "StateMachine",
+        schema: Optional[StateMachineSchema] = None,
+        single_producer: bool = False
     ):
         """
         初始化状态机
@@ -67,20 +125,43 @@ class StateMachine:
         Args:
             initial_state: 初始状态名称
             name: 状态机名称
+            schema: 共享的拓扑快照，为 None 时使用独立的空拓扑
+            single_producer: 仅由单个线程驱动时设为 True，省去每次操作的加锁开销
         """
         self.name = name
+        initial_state = sys.intern(initial_state)
         self._initial_state = initial_state
         self._current_state = initial_state
         self._previous_state: Optional[str] = None
-        self._states: Set[str] = set()
-        self._transitions: Dict[str, List[Transition]] = {}
-        self._callbacks: Dict[str, StateCallbacks] = {}
-        self._event_queue: List[tuple] = []
+        # 状态 -> 事件 -> 转换元组（同一事件按添加顺序尝试守卫），键集合即已注册状态
+        # 写时复制：写者在锁内替换整个内层字典，读者无锁读取也不会看到修改中的结构
+        self._transitions: Dict[str, Dict[str, Tuple[Transition, ...]]] = {}
+        # 回调按类型分表存放，未注册的状态不占条目
+        self._on_enter: Dict[str, Callable[[], None]] = {}
+        self._on_exit: Dict[str, Callable[[], None]] = {}
+        self._on_update: Dict[str, Callable[[float], None]] = {}
+        # 预编译分发表（见 compile()），配置变化后失效为 None
+        self._dispatch: Optional[Dict[str, Dict[str, Tuple[tuple, ...]]]] = None
+        # states 属性的缓存，注册新状态时失效
+        self._states_view: Optional[FrozenSet[str]] = None
+        # 拓扑表是否与其他实例共享，共享时写入前先复制
+        self._shared = False
+        if schema is not None:
+            self._transitions = schema.transitions
+            self._on_enter = schema.on_enter
+            self._on_exit = schema.on_exit
+            self._on_update = schema.on_update
+            self._dispatch = schema.dispatch
+            self._shared = True
+        self._event_queue: Deque[Tuple[str, Any]] = deque()
         self._is_running = False
-        self._lock = threading.RLock()
+        # 可重入：回调中可以再触发事件。内部方法之间不嵌套加锁，每个公开操作只进入一次
+        # 单生产者模式下没有并发写者，用空上下文代替锁
+        self._lock = nullcontext() if single_producer else threading.RLock()
         
-        # 注册初始状态
-        self.add_state(initial_state)
+        # 注册初始状态（共享拓扑中已有时保留其回调）
+        if initial_state not in self._transitions:
+            self.add_state(initial_state)
     
     @property
     def current_state(self) -> str:
@@ -98,9 +179,12 @@ class StateMachine:
         return self._initial_state
     
     @property
-    def states(self) -> Set[str]:
-        """获取所有状态"""
-        return self._states.copy()
+    def states(self) -> FrozenSet[str]:
+        """获取所有状态（只读集合，添加新状态前复用同一对象）"""
+        states = self._states_view
+        if states is None:
+            states = self._states_view = frozenset(self._transitions)
+        return states
     
     def add_state(
         self,
@@ -119,13 +203,32 @@ class StateMachine:
             on_update: 状态更新时的回调（dt为时间增量）
         """
         with self._lock:
-            self._states.add(state)
-            self._transitions[state] = []
-            self._callbacks[state] = StateCallbacks(
-                on_enter=on_enter,
-                on_exit=on_exit,
-                on_update=on_update
-            )
+            self._add_state_locked(state, on_enter, on_exit, on_update)
+    
+    def _add_state_locked(
+        self,
+        state: str,
+        on_enter: Optional[Callable[[], None]] = None,
+        on_exit: Optional[Callable[[], None]] = None,
+        on_update: Optional[Callable[[float], None]] = None
+    ) -> None:
+        """添加状态（调用方已持有锁）"""
+        self._detach_schema()
+        # 状态名驻留，转换表查找和状态比较可走指针比较
+        state = sys.intern(state)
+        self._dispatch = None
+        if state not in self._transitions:
+            self._transitions[state] = {}
+            self._states_view = None
+        for table, callback in (
+            (self._on_enter, on_enter),
+            (self._on_exit, on_exit),
+            (self._on_update, on_update),
+        ):
+            if callback is None:
+                table.pop(state, None)
+            else:
+                table[state] = callback
     
     def add_transition(
         self,
@@ -147,21 +250,16 @@ class StateMachine:
             action: 转换动作函数
             transition_type: 转换类型
         """
+        transition = Transition(
+            from_state=sys.intern(from_state),
+            to_state=sys.intern(to_state),
+            event=sys.intern(event),
+            guard=guard,
+            action=action,
+            transition_type=transition_type
+        )
         with self._lock:
-            if from_state not in self._states:
-                self.add_state(from_state)
-            if to_state not in self._states:
-                self.add_state(to_state)
-            
-            transition = Transition(
-                from_state=from_state,
-                to_state=to_state,
-                event=event,
-                guard=guard,
-                action=action,
-                transition_type=transition_type
-            )
-            self._transitions[from_state].append(transition)
+            self._add_transitions_locked((transition,))
     
     def add_transitions(
         self,
@@ -173,19 +271,102 @@ class StateMachine:
         Args:
             transitions: 转换配置列表
         """
-        for t in transitions:
-            self.add_transition(
-                from_state=t.get('from_state'),
-                to_state=t.get('to_state'),
-                event=t.get('event'),
+        batch = [
+            Transition(
+                from_state=sys.intern(t.get('from_state')),
+                to_state=sys.intern(t.get('to_state')),
+                event=sys.intern(t.get('event')),
                 guard=t.get('guard'),
                 action=t.get('action'),
                 transition_type=t.get('transition_type', TransitionType.SYNCHRONOUS)
             )
+            for t in transitions
+        ]
+        with self._lock:
+            self._add_transitions_locked(batch)
+    
+    def _add_transitions_locked(self, transitions: Iterable[Transition]) -> None:
+        """
+        添加一批转换（调用方已持有锁）
+        
+        每个源状态只复制一次事件表，全部写入后再发布。
+        """
+        self._detach_schema()
+        updated: Dict[str, Dict[str, Tuple[Transition, ...]]] = {}
+        for transition in transitions:
+            from_state = transition.from_state
+            if from_state not in self._transitions:
+                self._add_state_locked(from_state)
+            if transition.to_state not in self._transitions:
+                self._add_state_locked(transition.to_state)
+            
+            events = updated.get(from_state)
+            if events is None:
+                events = updated[from_state] = dict(self._transitions[from_state])
+            events[transition.event] = events.get(transition.event, _EMPTY) + (transition,)
+        self._transitions.update(updated)
+        self._dispatch = None
+    
+    def _detach_schema(self) -> None:
+        """与共享拓扑脱离：复制外层表（内层事件表本身写时复制，可继续共享）"""
+        if self._shared:
+            self._transitions = dict(self._transitions)
+            self._on_enter = dict(self._on_enter)
+            self._on_exit = dict(self._on_exit)
+            self._on_update = dict(self._on_update)
+            self._shared = False
+    
+    def export_schema(self) -> StateMachineSchema:
+        """
+        导出当前拓扑，供其他状态机实例共享
+        
+        导出后本实例再修改拓扑也会先复制，不影响已导出的快照。
+        """
+        with self._lock:
+            self._shared = True
+            return StateMachineSchema(
+                self._transitions,
+                self._on_enter,
+                self._on_exit,
+                self._on_update,
+                self._dispatch
+            )
+    
+    @property
+    def is_compiled(self) -> bool:
+        """分发表是否已预编译且仍然有效"""
+        return self._dispatch is not None
+    
+    def compile(self) -> None:
+        """
+        预编译分发表
+        
+        在状态、转换和回调配置完成后调用。每个 (状态, 事件) 直接映射到
+        解析好的 (守卫, 动作, 目标状态, 退出回调, 进入回调) 元组，
+        trigger_event 不再逐次查找回调对象。之后再添加状态或转换会使
+        分发表失效，自动回退到解释执行；直接修改回调表后需重新编译。
+        """
+        with self._lock:
+            enter_callbacks = self._on_enter
+            dispatch = {}
+            for state, events in self._transitions.items():
+                on_exit = self._on_exit.get(state)
+                dispatch[state] = {
+                    event: tuple(
+                        (t.guard, t.action, t.to_state, on_exit, enter_callbacks.get(t.to_state))
+                        for t in transitions
+                    )
+                    for event, transitions in events.items()
+                }
+            self._dispatch = dispatch
     
     def get_transitions(self, state: str) -> List[Transition]:
         """获取指定状态的所有转换"""
-        return self._transitions.get(state, [])
+        return [
+            transition
+            for transitions in self._transitions.get(state, _NO_EVENTS).values()
+            for transition in transitions
+        ]
     
     def can_transition(self, event: str) -> bool:
         """
@@ -197,12 +378,31 @@ class StateMachine:
         Returns:
             是否可以转换
         """
-        with self._lock:
-            for transition in self._transitions.get(self._current_state, []):
-                if transition.event == event:
-                    if transition.guard is None or transition.guard():
-                        return True
-            return False
+        # 只读查询无需加锁（转换表写时复制），守卫也不在锁内执行
+        guard_cache: Dict[int, bool] = {}
+        for transition in self._transitions.get(self._current_state, _NO_EVENTS).get(event, _EMPTY):
+            if self._check_guard(transition.guard, guard_cache):
+                return True
+        return False
+    
+    @staticmethod
+    def _check_guard(
+        guard: Optional[Callable[[], bool]],
+        cache: Dict[int, bool]
+    ) -> bool:
+        """
+        检查条件守卫
+        
+        同一次分发中多个转换共用的守卫只调用一次，结果按守卫对象记在 cache 中，
+        避免有副作用的守卫被重复触发。
+        """
+        if guard is None:
+            return True
+        key = id(guard)
+        result = cache.get(key)
+        if result is None:
+            result = cache[key] = bool(guard())
+        return result
     
     def trigger_event(self, event: str, data: Any = None) -> bool:
         """
@@ -216,59 +416,135 @@ class StateMachine:
             是否成功触发转换
         """
         with self._lock:
-            # 查找匹配的转换
-            for transition in self._transitions.get(self._current_state, []):
-                if transition.event == event:
-                    # 检查条件守卫
-                    if transition.guard is not None and not transition.guard():
-                        return False
-                    
-                    # 执行状态退出回调
-                    self._execute_callback(self._current_state, 'on_exit')
-                    
-                    # 记录前一个状态
+            guard_cache: Dict[int, bool] = {}
+            dispatch = self._dispatch
+            if dispatch is not None:
+                # 已编译：回调已预先解析，直接执行
+                for guard, action, to_state, on_exit, on_enter in (
+                    dispatch.get(self._current_state, _NO_EVENTS).get(event, _EMPTY)
+                ):
+                    if not self._check_guard(guard, guard_cache):
+                        continue
+                    if on_exit:
+                        on_exit()
                     self._previous_state = self._current_state
-                    
-                    # 执行转换动作
-                    if transition.action:
-                        transition.action(data)
-                    
-                    # 更新当前状态
+                    if action:
+                        action(data)
+                    self._current_state = to_state
+                    if on_enter:
+                        on_enter()
+                    return True
+                return False
+            
+            # 查找匹配的转换：第一个守卫通过的转换生效
+            events = self._transitions.get(self._current_state, _NO_EVENTS)
+            for transition in events.get(event, _EMPTY):
+                if transition._fast:
+                    # 无守卫无动作：直接切换状态
+                    current = self._current_state
+                    self._fire_exit(current)
+                    self._previous_state = current
                     self._current_state = transition.to_state
-                    
-                    # 执行状态进入回调
-                    self._execute_callback(self._current_state, 'on_enter')
-                    
+                    self._fire_enter(transition.to_state)
                     return True
+                
+                # 检查条件守卫
+                if not self._check_guard(transition.guard, guard_cache):
+                    continue
+                
+                # 执行状态退出回调
+                self._fire_exit(self._current_state)
+                
+                # 记录前一个状态
+                self._previous_state = self._current_state
+                
+                # 执行转换动作
+                if transition.action:
+                    transition.action(data)
+                
+                # 更新当前状态
+                self._current_state = transition.to_state
+                
+                # 执行状态进入回调
+                self._fire_enter(self._current_state)
+                
+                return True
             return False
     
-    def _execute_callback(self, state: str, callback_type: str) -> None:
-        """执行状态回调"""
-        callbacks = self._callbacks.get(state)
-        if callbacks:
-            callback = getattr(callbacks, callback_type, None)
-            if callback:
-                callback()
+    def enqueue_event(self, event: str, data: Any = None) -> None:
+        """
+        将事件加入队列，稍后由 process_queue 按先进先出顺序处理
+        
+        Args:
+            event: 事件名称
+            data: 事件数据
+        """
+        self._event_queue.append((event, data))
+    
+    def process_queue(self) -> int:
+        """
+        处理队列中的所有事件
+        
+        回调中新入队的事件也会在本次调用中处理。
+        
+        Returns:
+            成功触发转换的事件数量
+        """
+        queue = self._event_queue
+        fired = 0
+        while queue:
+            try:
+                event, data = queue.popleft()
+            except IndexError:
+                # 其他线程已取走最后一个事件
+                break
+            if self.trigger_event(event, data):
+                fired += 1
+        return fired
+    
+    def _fire_enter(self, state: str) -> None:
+        """执行状态进入回调"""
+        callback = self._on_enter.get(state)
+        if callback:
+            callback()
+    
+    def _fire_exit(self, state: str) -> None:
+        """执行状态退出回调"""
+        callback = self._on_exit.get(state)
+        if callback:
+            callback()
+    
+    def get_callbacks(self, state: str) -> Optional[StateCallbacks]:
+        """获取指定状态的回调（快照），状态不存在时返回 None"""
+        if state not in self._transitions:
+            return None
+        return StateCallbacks(
+            on_enter=self._on_enter.get(state),
+            on_exit=self._on_exit.get(state),
+            on_update=self._on_update.get(state)
+        )
     
     def start(self) -> None:
         """启动状态机"""
         with self._lock:
             self._is_running = True
-            self._execute_callback(self._current_state, 'on_enter')
+            self._fire_enter(self._current_state)
     
     def stop(self) -> None:
         """停止状态机"""
         with self._lock:
             self._is_running = False
-            self._execute_callback(self._current_state, 'on_exit')
+            self._fire_exit(self._current_state)
     
     def reset(self) -> None:
         """重置状态机"""
         with self._lock:
-            self.stop()
+            self._is_running = False
+            self._fire_exit(self._current_state)
             self._current_state = self._initial_state
             self._previous_state = None
-            self.start()
+            self._is_running = True
+            self._fire_enter(self._current_state)
     
     def update(self, dt: float = 0.0) -> None:
         """
@@ -279,7 +555,9 @@ class StateMachine:
         """
         with self._lock:
             if self._is_running:
-                self._execute_callback(self._current_state, 'on_update')
+                callback = self._on_update.get(self._current_state)
+                if callback:
+                    callback(dt)
     
     def is_in_state(self, state: str) -> bool:
         """
@@ -303,14 +581,17 @@ class StateMachine:
         Returns:
             状态是否存在
         """
-        return state in self._states
+        return state in self._transitions
     
     def get_possible_events(self) -> List[str]:
         """获取当前状态下所有可能的事件"""
         events = []
-        for transition in self._transitions.get(self._current_state, []):
-            if transition.guard is None or transition.guard():
-                events.append(transition.event)
+        guard_cache: Dict[int, bool] = {}
+        for event, transitions in self._transitions.get(self._current_state, _NO_EVENTS).items():
+            for transition in transitions:
+                if self._check_guard(transition.guard, guard_cache):
+                    events.append(event)
+                    break
         return events
     
     def __repr__(self) -> str:
@@ -327,9 +608,11 @@ class HierarchicalStateMachine(StateMachine):
     def __init__(
         self,
         initial_state: str,
-        name: str = "HierarchicalStateMachine"
+        name: str = "HierarchicalStateMachine",
+        schema: Optional[StateMachineSchema] = None,
+        single_producer: bool = False
     ):
-        super().__init__(initial_state, name)
+        super().__init__(initial_state, name, schema, single_producer)
         self._parent_map: Dict[str, str] = {}
         self._history_state: Optional[str] = None
     
@@ -361,21 +644,21 @@ class HierarchicalStateMachine(StateMachine):
         Returns:
             是否成功进入
         """
-        if parent_state not in self._states:
+        if parent_state not in self._transitions:
             return False
         
         # 执行父状态进入回调
-        self._execute_callback(parent_state, 'on_exit')
+        self._fire_exit(parent_state)
         self._previous_state = self._current_state
         
         # 查找初始子状态
         initial_substate = f"{parent_state}_initial"
-        if initial_substate in self._states:
+        if initial_substate in self._transitions:
             self._current_state = initial_substate
         else:
             self._current_state = parent_state
         
-        self._execute_callback(self._current_state, 'on_enter')
+        self._fire_enter(self._current_state)
         return True
 
 
@@ -389,25 +672,33 @@ class ParallelStateMachine(StateMachine):
     def __init__(
         self,
         initial_states: List[str],
-        name: str = "ParallelStateMachine"
+        name: str = "ParallelStateMachine",
+        schema: Optional[StateMachineSchema] = None,
+        single_producer: bool = False
     ):
-        super().__init__(initial_states[0] if initial_states else "", name)
+        # 基类构造时会注册初始状态并回调 _add_state_locked，需先就绪
         self._active_states: Set[str] = set(initial_states)
         self._initial_states = initial_states
+        # 回调中重入触发的事件，待当前事件的状态变化应用后依次处理
+        self._reentrant_events: Deque[Tuple[str, Any]] = deque()
+        self._dispatching = False
+        super().__init__(
+            initial_states[0] if initial_states else "", name, schema, single_producer
+        )
     
     @property
     def current_states(self) -> Set[str]:
         """获取所有当前状态"""
         return self._active_states.copy()
     
-    def add_state(
+    def _add_state_locked(
         self,
         state: str,
         on_enter: Optional[Callable[[], None]] = None,
         on_exit: Optional[Callable[[], None]] = None,
         on_update: Optional[Callable[[float], None]] = None
     ) -> None:
-        super().add_state(state, on_enter, on_exit, on_update)
+        super()._add_state_locked(state, on_enter, on_exit, on_update)
         if state in self._initial_states:
             self._active_states.add(state)
     
@@ -415,6 +706,9 @@ class ParallelStateMachine(StateMachine):
         """
         触发事件（所有匹配的状态都会尝试转换）
         
+        回调中重入触发的事件不会立即执行，而是排队到当前事件的状态变化
+        应用之后再处理，这次重入调用返回 False。
+        
         Args:
             event: 事件名称
             data: 事件数据
@@ -423,30 +717,55 @@ class ParallelStateMachine(StateMachine):
             是否有任何状态成功转换
         """
         with self._lock:
-            success = False
-            for state in list(self._active_states):
-                for transition in self._transitions.get(state, []):
-                    if transition.event == event:
-                        if transition.guard is None or transition.guard():
-                            # 执行状态退出回调
-                            self._execute_callback(state, 'on_exit')
-                            
-                            # 记录前一个状态
-                            self._previous_state = state
-                            
-                            # 执行转换动作
-                            if transition.action:
-                                transition.action(data)
-                            
-                            # 更新当前状态
-                            self._active_states.remove(state)
-                            self._active_states.add(transition.to_state)
-                            
-                            # 执行状态进入回调
-                            self._execute_callback(transition.to_state, 'on_enter')
-                            
-                            success = True
-            return success
+            if self._dispatching:
+                self._reentrant_events.append((event, data))
+                return False
+            self._dispatching = True
+            try:
+                changed = self._trigger_locked(event, data)
+                pending = self._reentrant_events
+                while pending:
+                    self._trigger_locked(*pending.popleft())
+                return changed
+            finally:
+                self._dispatching = False
+                self._reentrant_events.clear()
+    
+    def _trigger_locked(self, event: str, data: Any) -> bool:
+        """按当前活动状态处理一个事件（调用方持有锁）"""
+        guard_cache: Dict[int, bool] = {}
+        # 扫描期间不修改活动状态集合，结束后统一应用增量
+        to_remove: List[str] = []
+        to_add: List[str] = []
+        for state in self._active_states:
+            for transition in self._transitions.get(state, _NO_EVENTS).get(event, _EMPTY):
+                if self._check_guard(transition.guard, guard_cache):
+                    # 执行状态退出回调
+                    self._fire_exit(state)
+                    
+                    # 记录前一个状态
+                    self._previous_state = state
+                    
+                    # 执行转换动作
+                    if transition.action:
+                        transition.action(data)
+                    
+                    # 记录状态变化
+                    to_remove.append(state)
+                    to_add.append(transition.to_state)
+                    
+                    # 执行状态进入回调
+                    self._fire_enter(transition.to_state)
+                    break
+        if not to_remove:
+            return False
+        self._active_states.difference_update(to_remove)
+        self._active_states.update(to_add)
+        return True
+
+
+# 装饰器识别的回调方法前缀 -> add_state 参数名
+_CALLBACK_PREFIXES = (('on_enter_', 'on_enter'), ('on_exit_', 'on_exit'))
 
 
 def state_machine(
@@ -467,20 +786,19 @@ def state_machine(
     def decorator(cls: type) -> type:
         sm = StateMachine(initial_state, name)
         
-        # 自动发现状态方法
+        # 自动发现状态方法：一次扫描按状态归类，每个状态只注册一次
+        found: Dict[str, Dict[str, Callable[[], None]]] = {}
         for attr_name in dir(cls):
-            if attr_name.startswith('on_enter_'):
-                state = attr_name[9:]
-                method = getattr(cls, attr_name)
-                if callable(method):
-                    sm.add_state(state, on_enter=method)
-            elif attr_name.startswith('on_exit_'):
-                state = attr_name[8:]
-                method = getattr(cls, attr_name)
-                if callable(method):
-                    if state not in sm._callbacks:
-                        sm.add_state(state)
-                    sm._callbacks[state].on_exit = method
+            if not attr_name.startswith('on_'):
+                continue
+            for prefix, kind in _CALLBACK_PREFIXES:
+                if attr_name.startswith(prefix):
+                    method = getattr(cls, attr_name)
+                    if callable(method):
+                        found.setdefault(attr_name[len(prefix):], {})[kind] = method
+                    break
+        for state, callbacks in found.items():
+            sm.add_state(state, **callbacks)
         
         # 存储状态机实例
         setattr(cls, '_state_machine', sm)
@@ -503,6 +821,7 @@ def state_machine(
 
 __all__ = [
     'StateMachine',
+    'StateMachineSchema',
     'HierarchicalStateMachine',
     'ParallelStateMachine',
     'Transition',
@@ -18,20 +18,115 @@
 import json
 import pickle
 import hashlib
+import heapq
+import io
+import itertools
+import math
+import os
+import queue
+import sys
 import time
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional, TypeVar, Generic, Type
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+from operator import mul
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar, Generic, Type
 from dataclasses import dataclass, field
 from datetime import datetime, timezone, timedelta
 from enum import Enum
 import threading
+import weakref
 
+from .exceptions import StorageOperationError
 from .types import StorageBackend
 
+try:
+    import orjson
+    _HAS_ORJSON = True
+except ImportError:
+    _HAS_ORJSON = False
+
+try:
+    import numpy as np
+    _HAS_NUMPY = True
+except ImportError:
+    _HAS_NUMPY = False
+
+try:
+    import hnswlib
+    _HAS_HNSWLIB = _HAS_NUMPY
+except ImportError:
+    _HAS_HNSWLIB = False
+
 
 T = TypeVar('T')
 
 
+# JSON 编解码：安装了 orjson 时使用 orjson，否则退回标准库 json
+if _HAS_ORJSON:
+    def _json_dumps_bytes(value: Any, pretty: bool = False) -> bytes:
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(value, option=option)
+    
+    def _json_dumps(value: Any) -> str:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    
+    _json_loads = orjson.loads
+else:
+    def _json_dumps_bytes(value: Any, pretty: bool = False) -> bytes:
+        return json.dumps(
+            value, ensure_ascii=False, indent=2 if pretty else None
+        ).encode('utf-8')
+    
+    def _json_dumps(value: Any) -> str:
+        return json.dumps(value, ensure_ascii=False)
+    
+    _json_loads = json.loads
+
+
+# 按类型估算值占用的字节数；容器递归累加元素，其余类型退化为 sys.getsizeof
+_SIZE_ESTIMATORS = {
+    bytes: len,
+    bytearray: len,
+    memoryview: lambda v: v.nbytes,
+    str: len,
+}
+
+_CONTAINER_TYPES = (dict, list, tuple, set, frozenset)
+
+
+def _estimate_size(value: Any) -> int:
+    """估算值大小，不做序列化；dict/list 等容器递归累加键和元素的大小"""
+    estimator = _SIZE_ESTIMATORS.get(type(value))
+    if estimator is not None:
+        return estimator(value)
+    total = 0
+    stack = [value]
+    # 已计入的容器 id，避免共享或自引用的容器重复计数、无限递归
+    seen = set()
+    while stack:
+        item = stack.pop()
+        estimator = _SIZE_ESTIMATORS.get(type(item))
+        if estimator is not None:
+            total += estimator(item)
+            continue
+        if isinstance(item, _CONTAINER_TYPES):
+            if id(item) in seen:
+                continue
+            seen.add(id(item))
+            if isinstance(item, dict):
+                stack.extend(item.keys())
+                stack.extend(item.values())
+            else:
+                stack.extend(item)
+        total += sys.getsizeof(item)
+    return total
+
+
 @dataclass
 class StorageStats:
     """存储统计信息"""
@@ -72,147 +167,377 @@ class StorageInterface(ABC):
         pass
 
 
-class MemoryStorage(StorageInterface):
-    """内存存储后端"""
+# 内存存储分片数（2 的幂，便于按位取模）
+MEMORY_STORAGE_SHARDS = 16
+
+
+class EvictionPolicy(Enum):
+    """内存存储容量满时的淘汰策略"""
+    LRU = "lru"      # 最近最少使用
+    LFU = "lfu"      # 最不经常使用
+    FIFO = "fifo"    # 先进先出
+
+
+class _Counter:
+    """
+    无锁计数器
+    
+    increment 基于 itertools.count，next() 在 GIL 下是原子的；
+    读取较少，用一把小锁记录已读取次数并从计数中扣除。
+    """
+    
+    __slots__ = ('_count', '_reads', '_lock')
     
     def __init__(self):
-        self._data: Dict[str, Any] = {}
-        self._metadata: Dict[str, Dict] = {}
-        self._lock = threading.RLock()
+        self._count = itertools.count()
+        self._reads = 0
+        self._lock = threading.Lock()
+    
+    def increment(self) -> None:
+        next(self._count)
+    
+    @property
+    def value(self) -> int:
+        with self._lock:
+            value = next(self._count) - self._reads
+            self._reads += 1
+            return value
+
+
+class _MemoryShard:
+    """内存存储分片 - 持有一部分键值、其总大小及独立的写锁"""
+    
+    __slots__ = ('lock', 'data', 'metadata', 'size')
+    
+    def __init__(self, ordered: bool = False):
+        self.lock = threading.Lock()
+        # 有容量上限时按访问/写入顺序排列，队首即淘汰候选
+        self.data: Dict[str, Any] = OrderedDict() if ordered else {}
+        self.metadata: Dict[str, Dict] = {}
+        self.size = 0
+
+
+# 区分“键不存在”与“值为 None”
+_MISSING = object()
+
+
+class MemoryStorage(StorageInterface):
+    """
+    内存存储后端
+    
+    按键分片，写操作只锁所在分片；读操作不加锁（dict 读取在 GIL 下是原子的）。
+    设置 max_entries / max_bytes 后按 policy 淘汰旧数据；此时使用单个分片，
+    保证淘汰顺序在全局范围内准确。
+    """
+    
+    def __init__(
+        self,
+        exact_sizing: bool = False,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        policy: EvictionPolicy = EvictionPolicy.LRU
+    ):
+        """
+        Args:
+            exact_sizing: 为 True 时用 pickle 序列化长度统计大小（精确但每次写入多一次序列化），
+                默认按类型估算
+            max_entries: 最大键数量，None 表示不限
+            max_bytes: 最大总大小（字节），None 表示不限
+            policy: 超出上限时的淘汰策略；LRU/FIFO 为 O(1)，LFU 需扫描分片，为 O(n)
+        """
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._policy = policy
+        self._bounded = max_entries is not None or max_bytes is not None
+        self._shard_count = 1 if self._bounded else MEMORY_STORAGE_SHARDS
+        self._shards: List[_MemoryShard] = [
+            _MemoryShard(ordered=self._bounded) for _ in range(self._shard_count)
+        ]
         self._stats = StorageStats(backend="memory")
+        self._hits = _Counter()
+        self._misses = _Counter()
+        self._evictions = 0
+        self._last_access: Optional[float] = None
+        # 键首次写入的序号，list_keys 据此保持写入顺序
+        self._sequence = itertools.count()
+        self._exact_sizing = exact_sizing
+    
+    def _shard_for(self, key: str) -> _MemoryShard:
+        """获取键所在分片"""
+        return self._shards[hash(key) & (self._shard_count - 1)]
     
     def save(self, key: str, value: Any) -> bool:
-        with self._lock:
-            try:
+        try:
+            if self._exact_sizing:
                 size = len(pickle.dumps(value))
-                self._data[key] = value
-                self._metadata[key] = {
-                    'size': size,
-                    'created': time.time(),
-                    'modified': time.time(),
-                    'access': time.time()
-                }
-                self._stats.last_modify = datetime.now()
-                self._stats.total_keys = len(self._data)
-                # 逻辑风险提示：total_size_bytes 这里是累加。
-                # - 若同一个 key 被反复覆盖写入，旧值占用的 size 并未扣除，会导致统计不断膨胀。
-                # - 如果该统计用于“资源配额/监控告警”，会产生误报。
-                self._stats.total_size_bytes += size
-                return True
-            except Exception:
-                # 逻辑风险提示：这里吞掉所有异常并返回 False，会让上层只能看到“失败”但不知道原因。
-                # 对关键路径（持久化/审计/检查点）建议至少记录日志或抛出更明确异常。
-                return False
+            else:
+                size = _estimate_size(value)
+        except Exception:
+            # 逻辑风险提示：这里吞掉所有异常并返回 False，会让上层只能看到“失败”但不知道原因。
+            # 对关键路径（持久化/审计/检查点）建议至少记录日志或抛出更明确异常。
+            return False
+        shard = self._shard_for(key)
+        now = time.time()
+        self._last_access = now
+        with shard.lock:
+            old = shard.metadata.get(key)
+            shard.metadata[key] = {
+                'size': size,
+                'created': now,
+                'modified': now,
+                'access': now,
+                'seq': old['seq'] if old else next(self._sequence),
+                'hits': old['hits'] if old else 0
+            }
+            shard.data[key] = value
+            shard.size += size - (old['size'] if old else 0)
+            if self._bounded:
+                if self._policy is EvictionPolicy.LRU:
+                    shard.data.move_to_end(key)
+                self._evict_locked(shard, key)
+        self._stats.last_modify = datetime.now()
+        return True
+    
+    def _evict_locked(self, shard: _MemoryShard, keep: str) -> None:
+        """淘汰直到满足容量上限（调用方已持有分片锁）；刚写入的键不淘汰"""
+        max_entries = self._max_entries
+        max_bytes = self._max_bytes
+        while len(shard.data) > 1 and (
+            (max_entries is not None and len(shard.data) > max_entries)
+            or (max_bytes is not None and shard.size > max_bytes)
+        ):
+            if self._policy is EvictionPolicy.LFU:
+                victim = min(
+                    (k for k in shard.data if k != keep),
+                    key=lambda k: shard.metadata[k]['hits']
+                )
+            else:
+                # LRU 与 FIFO 的淘汰候选都在队首
+                victim = next(iter(shard.data))
+                if victim == keep:
+                    break
+            del shard.data[victim]
+            shard.size -= shard.metadata.pop(victim)['size']
+            self._evictions += 1
     
     def retrieve(self, key: str) -> Optional[Any]:
-        with self._lock:
-            self._stats.last_access = datetime.now()
-            if key in self._data:
-                self._stats.hit_count += 1
-                self._metadata[key]['access'] = time.time()
-                return self._data[key]
-            self._stats.miss_count += 1
+        shard = self._shard_for(key)
+        value = shard.data.get(key, _MISSING)
+        if value is _MISSING:
+            self._misses.increment()
             return None
+        now = time.time()
+        self._last_access = now
+        metadata = shard.metadata.get(key)
+        if metadata is not None:
+            metadata['access'] = now
+            if self._policy is EvictionPolicy.LFU:
+                metadata['hits'] += 1
+        if self._bounded and self._policy is EvictionPolicy.LRU:
+            try:
+                shard.data.move_to_end(key)
+            except KeyError:
+                # 读取期间已被其他线程删除或淘汰
+                pass
+        self._hits.increment()
+        return value
     
     def delete(self, key: str) -> bool:
-        with self._lock:
-            if key in self._data:
-                size = self._metadata[key]['size']
-                del self._data[key]
-                del self._metadata[key]
-                self._stats.total_keys = len(self._data)
-                self._stats.total_size_bytes -= size
+        shard = self._shard_for(key)
+        with shard.lock:
+            if key in shard.data:
+                del shard.data[key]
+                shard.size -= shard.metadata.pop(key)['size']
                 return True
             return False
     
     def exists(self, key: str) -> bool:
-        with self._lock:
-            return key in self._data
+        return key in self._shard_for(key).data
     
     def list_keys(self, prefix: str = "") -> List[str]:
-        with self._lock:
-            if not prefix:
-                return list(self._data.keys())
-            return [k for k in self._data.keys() if k.startswith(prefix)]
+        # 不加锁遍历各分片（并发写入时结果为近似快照），按首次写入顺序返回
+        entries = []
+        for shard in self._shards:
+            for key, metadata in list(shard.metadata.items()):
+                if key.startswith(prefix):
+                    entries.append((metadata['seq'], key))
+        entries.sort()
+        return [key for _, key in entries]
     
     def clear(self) -> bool:
-        with self._lock:
-            self._data.clear()
-            self._metadata.clear()
-            self._stats = StorageStats(backend="memory")
-            return True
+        for shard in self._shards:
+            with shard.lock:
+                shard.data.clear()
+                shard.metadata.clear()
+                shard.size = 0
+        self._stats = StorageStats(backend="memory")
+        self._hits = _Counter()
+        self._misses = _Counter()
+        self._last_access = None
+        return True
+    
+    @property
+    def evictions(self) -> int:
+        """累计淘汰的键数量"""
+        return self._evictions
     
     def get_stats(self) -> StorageStats:
-        with self._lock:
-            return StorageStats(
-                backend="memory",
-                total_keys=len(self._data),
-                total_size_bytes=sum(m['size'] for m in self._metadata.values()),
-                last_access=datetime.fromtimestamp(
-                    max(m['access'] for m in self._metadata.values())
-                ) if self._metadata else None,
-                last_modify=self._stats.last_modify,
-                hit_count=self._stats.hit_count,
-                miss_count=self._stats.miss_count
-            )
+        # 各分片维护总大小，统计只需汇总分片，不扫描全部键
+        last_access = self._last_access
+        return StorageStats(
+            backend="memory",
+            total_keys=sum(len(shard.data) for shard in self._shards),
+            total_size_bytes=sum(shard.size for shard in self._shards),
+            last_access=datetime.fromtimestamp(last_access) if last_access else None,
+            last_modify=self._stats.last_modify,
+            hit_count=self._hits.value,
+            miss_count=self._misses.value
+        )
+
+
+@lru_cache(maxsize=4096)
+def _file_path(base_path: str, key: str) -> str:
+    """键 -> 文件路径（热点键命中缓存，免去重复哈希和拼接）"""
+    # 使用 hash 防止目录过深；16 字节 blake2b 与旧的 md5 一样是 32 位十六进制
+    key_hash = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+    return os.path.join(base_path, key_hash[:2], key_hash[2:] + ".json")
+
+
+@lru_cache(maxsize=4096)
+def _legacy_file_path(base_path: str, key: str) -> str:
+    """旧版本按 md5 命名的文件路径，仅用于读取迁移前写入的数据"""
+    key_hash = hashlib.md5(key.encode()).hexdigest()
+    return os.path.join(base_path, key_hash[:2], key_hash[2:] + ".json")
 
 
 class FileStorage(StorageInterface):
     """文件存储后端"""
     
-    def __init__(self, base_path: str = "./data"):
-        import os
+    def __init__(self, base_path: str = "./data", pretty: bool = False):
+        """
+        Args:
+            base_path: 存储目录
+            pretty: 是否以缩进格式写入文件（便于人工查看，文件更大、写入更慢）
+        """
         self._base_path = base_path
-        os.makedirs(base_path, exist_ok=True)
+        self._pretty = pretty
+        self._create_subdirs()
         self._lock = threading.RLock()
         self._stats = StorageStats(backend="file")
     
+    def _create_subdirs(self) -> None:
+        """一次性创建 256 个两位十六进制子目录，读写路径上不再调用 makedirs"""
+        for i in range(256):
+            os.makedirs(os.path.join(self._base_path, f'{i:02x}'), exist_ok=True)
+    
     def _get_path(self, key: str) -> str:
-        import os
-        # 使用 hash 防止目录过深
-        key_hash = hashlib.md5(key.encode()).hexdigest()
-        subdir = key_hash[:2]
-        filename = key_hash[2:] + ".json"
-        path = os.path.join(self._base_path, subdir)
-        os.makedirs(path, exist_ok=True)
-        return os.path.join(path, filename)
+        return _file_path(self._base_path, key)
+    
+    def _migrate_legacy(self, key: str) -> bool:
+        """把旧版 md5 路径下的文件移动到新路径，返回是否存在旧文件"""
+        try:
+            os.replace(_legacy_file_path(self._base_path, key), self._get_path(key))
+        except FileNotFoundError:
+            return False
+        return True
+    
+    def _write_locked(self, key: str, value: Any) -> bool:
+        """写入单个键（调用方已持有锁）"""
+        try:
+            data = _json_dumps_bytes(value, self._pretty)
+            with open(self._get_path(key), 'wb') as f:
+                f.write(data)
+        except Exception:
+            return False
+        # 逻辑风险提示：total_keys 这里简单 +1。
+        # - 若 key 对应文件已存在（覆盖写），该统计会偏大。
+        self._stats.total_keys += 1
+        return True
+    
+    def _read_locked(self, key: str) -> Any:
+        """读取单个键（调用方已持有锁），不存在时返回 _MISSING"""
+        # 直接打开文件，不存在时捕获异常，省去一次 exists 的 stat 调用
+        path = self._get_path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = _json_loads(f.read())
+        except FileNotFoundError:
+            if not self._migrate_legacy(key):
+                self._stats.miss_count += 1
+                return _MISSING
+            with open(path, 'rb') as f:
+                value = _json_loads(f.read())
+        self._stats.hit_count += 1
+        return value
     
     def save(self, key: str, value: Any) -> bool:
         with self._lock:
-            try:
-                path = self._get_path(key)
-                with open(path, 'w', encoding='utf-8') as f:
-                    json.dump(value, f, ensure_ascii=False, indent=2)
-                self._stats.last_modify = datetime.now()
-                # 逻辑风险提示：total_keys 这里简单 +1。
-                # - 若 key 对应文件已存在（覆盖写），该统计会偏大。
-                self._stats.total_keys += 1
-                return True
-            except Exception:
+            if not self._write_locked(key, value):
                 return False
+            self._stats.last_modify = datetime.now()
+            return True
+    
+    def save_many(self, items: Dict[str, Any]) -> int:
+        """
+        批量保存
+        
+        整批只加一次锁，适合一次性刷写大量记忆。
+        
+        Returns:
+            成功写入的数量
+        """
+        with self._lock:
+            saved = 0
+            for key, value in items.items():
+                if self._write_locked(key, value):
+                    saved += 1
+            if saved:
+                self._stats.last_modify = datetime.now()
+            return saved
     
     def retrieve(self, key: str) -> Optional[Any]:
         with self._lock:
             try:
-                path = self._get_path(key)
-                if os.path.exists(path):
-                    self._stats.last_access = datetime.now()
-                    self._stats.hit_count += 1
-                    with open(path, 'r', encoding='utf-8') as f:
-                        return json.load(f)
-                self._stats.miss_count += 1
-                return None
+                value = self._read_locked(key)
             except Exception:
                 # 逻辑风险提示：这里返回 None 既可能表示“没找到 key”，也可能表示“数据库异常”。
                 # 会让上层逻辑无法区分，导致错误处理分支混乱。
                 return None
+            if value is _MISSING:
+                return None
+            self._stats.last_access = datetime.now()
+            return value
+    
+    def retrieve_many(self, keys: List[str]) -> Dict[str, Any]:
+        """
+        批量读取
+        
+        整批只加一次锁；不存在或读取失败的键不出现在结果中。
+        """
+        with self._lock:
+            results = {}
+            for key in keys:
+                try:
+                    value = self._read_locked(key)
+                except Exception:
+                    continue
+                if value is not _MISSING:
+                    results[key] = value
+            if results:
+                self._stats.last_access = datetime.now()
+            return results
     
     def delete(self, key: str) -> bool:
         with self._lock:
             try:
                 path = self._get_path(key)
-                if os.path.exists(path):
+                if os.path.exists(path) or self._migrate_legacy(key):
                     os.remove(path)
+                    # 覆盖写入过的键可能仍残留旧路径文件，一并删除以免之后被迁移回来
+                    try:
+                        os.remove(_legacy_file_path(self._base_path, key))
+                    except FileNotFoundError:
+                        pass
                     self._stats.total_keys -= 1
                     return True
                 return False
@@ -220,12 +545,10 @@ class FileStorage(StorageInterface):
                 return False
     
     def exists(self, key: str) -> bool:
-        import os
         with self._lock:
-            return os.path.exists(self._get_path(key))
+            return os.path.exists(self._get_path(key)) or self._migrate_legacy(key)
     
     def list_keys(self, prefix: str = "") -> List[str]:
-        import os
         with self._lock:
             keys = []
             for root, dirs, files in os.walk(self._base_path):
@@ -249,15 +572,97 @@ class FileStorage(StorageInterface):
         with self._lock:
             try:
                 shutil.rmtree(self._base_path)
-                os.makedirs(self._base_path, exist_ok=True)
+                self._create_subdirs()
                 self._stats = StorageStats(backend="file")
                 return True
             except Exception:
                 return False
 
 
+# 批量写入时每条 INSERT 语句携带的行数
+PG_BATCH_PAGE_SIZE = 500
+
+# 写回队列：后台线程每批最多合并的条目数，以及收到首条后最多等待的秒数
+PG_WRITE_BEHIND_BATCH = 500
+PG_WRITE_BEHIND_INTERVAL = 0.01
+
+# COPY 文本格式的转义规则，None 写为 \N
+_PG_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _pg_copy_field(value: Any) -> str:
+    """把单个值编码为 COPY 文本格式的字段"""
+    if value is None:
+        return '\\N'
+    return str(value).translate(_PG_COPY_ESCAPES)
+
+
+# 流式读取审计日志时服务端游标每次传输的行数
+PG_STREAM_ITERSIZE = 2000
+
+# 审计日志查询的列，与 PostgreSQLStorage._audit_log 的解包顺序一致
+_PG_AUDIT_COLUMNS = "agent_pid, action, resource, details, result, duration_ms"
+
+# 建表时持有的 advisory lock 键 ('AOSK')，多个进程同时启动时只有一个执行 DDL
+PG_SCHEMA_LOCK_KEY = 0x414F534B
+
+# 建表迁移产生的全部关系，{p} 为表名前缀；都已存在时跳过 DDL
+_PG_SCHEMA_RELATIONS = (
+    '{p}data', '{p}checkpoints', '{p}audit', '{p}vectors',
+    '{p}checkpoints_agent_idx', '{p}audit_agent_idx',
+)
+
+# 本进程内已确认 schema 就绪的 (host, port, database, table_prefix)
+_pg_schema_ready: set = set()
+
+# 热点语句：每个连接首次使用时 PREPARE 一次，之后按名称 EXECUTE，免去服务端重复解析和规划
+# {p} 为表名前缀
+_PG_PREPARED_STATEMENTS = {
+    'aosk_save': """(text, text) AS
+        INSERT INTO {p}data (key, value, modified_at)
+        VALUES ($1, $2, NOW())
+        ON CONFLICT (key) DO UPDATE SET value = $2, modified_at = NOW()""",
+    'aosk_retrieve': """(text) AS
+        UPDATE {p}data SET access_at = NOW() WHERE key = $1
+        RETURNING value""",
+    'aosk_delete': """(text) AS
+        DELETE FROM {p}data WHERE key = $1""",
+    'aosk_exists': """(text) AS
+        SELECT 1 FROM {p}data WHERE key = $1""",
+    'aosk_save_checkpoint': """(text, text, text, text, text, text, text) AS
+        INSERT INTO {p}checkpoints
+        (checkpoint_id, agent_pid, agent_name, description, state, context, metadata)
+        VALUES ($1, $2, $3, $4, $5, $6, $7)
+        ON CONFLICT (checkpoint_id) DO UPDATE SET
+            state = EXCLUDED.state,
+            context = EXCLUDED.context,
+            metadata = EXCLUDED.metadata""",
+    'aosk_save_audit_log': """(text, text, text, text, text, real) AS
+        INSERT INTO {p}audit
+        (agent_pid, action, resource, details, result, duration_ms)
+        VALUES ($1, $2, $3, $4, $5, $6)""",
+    'aosk_save_vector': """(text, text, bytea, text) AS
+        INSERT INTO {p}vectors (key, content, embedding, metadata)
+        VALUES ($1, $2, $3, $4)""",
+}
+
+
 class PostgreSQLStorage(StorageInterface):
-    """PostgreSQL 存储后端"""
+    """PostgreSQL 存储后端
+    
+    write_behind=True 时 save/save_audit_log 只入队并立即返回 True，
+    后台线程把 PG_WRITE_BEHIND_INTERVAL 内的写入合并为一个事务提交。
+    读操作前会先 flush()，保证读到自己的写入；批次写入失败时整批丢弃。
+    
+    每个操作从 ThreadedConnectionPool 借出独立连接，并发调用可同时进行；
+    max_connections 即并发数据库操作的上限。
+    
+    transaction() 内的操作共用一个连接，退出时只提交一次；其中任一操作失败时
+    整个事务回滚并抛出 StorageOperationError。
+    audit_synchronous_commit=False 时审计写入不等待 WAL 落盘
+    (数据库崩溃可能丢失最近的少量审计日志)；transaction() 内的审计写入
+    仍随事务同步提交。
+    """
     
     def __init__(self,
                  host: str = "localhost",
@@ -265,16 +670,41 @@ class PostgreSQLStorage(StorageInterface):
                  database: str = "aosk",
                  user: str = "aosk",
                  password: str = "secret",
-                 table_prefix: str = "aosk_"):
+                 table_prefix: str = "aosk_",
+                 write_behind: bool = False,
+                 min_connections: int = 2,
+                 max_connections: int = 20,
+                 audit_synchronous_commit: bool = True):
         self._host = host
         self._port = port
         self._database = database
         self._user = user
         self._password = password
         self._table_prefix = table_prefix
+        self._min_connections = min_connections
+        self._max_connections = max_connections
+        self._audit_synchronous_commit = audit_synchronous_commit
+        # 当前线程 transaction() 持有的连接
+        self._tx = threading.local()
+        # ThreadedConnectionPool 本身线程安全，各连接的游标互不影响，不再需要实例级锁
         self._pool = None
-        self._lock = threading.RLock()
+        # 已 PREPARE 过热点语句的连接；连接被连接池丢弃后自动移除
+        self._prepared: "weakref.WeakKeyDictionary[Any, bool]" = weakref.WeakKeyDictionary()
+        # 写回队列条目: ('data', (key, value_json)) 或 ('audit', 审计行)
+        self._write_behind = write_behind
+        self._write_q: "queue.SimpleQueue[Tuple[str, tuple]]" = queue.SimpleQueue()
+        # 入队后置位，唤醒后台线程；出队只在持有 _flush_lock 时进行，
+        # 保证条目按入队顺序写出，flush() 返回时不存在已出队未写出的旧条目
+        self._write_pending = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self._running = False
         self._connect()
+        if write_behind and self._pool is not None:
+            self._running = True
+            self._flusher = threading.Thread(target=self._flush_loop)
+            self._flusher.daemon = True
+            self._flusher.start()
     
     def _connect(self):
         """建立数据库连接"""
@@ -282,8 +712,8 @@ class PostgreSQLStorage(StorageInterface):
             import psycopg2
             from psycopg2 import pool
             self._pool = pool.ThreadedConnectionPool(
-                minconn=2,
-                maxconn=20,
+                minconn=self._min_connections,
+                maxconn=self._max_connections,
                 host=self._host,
                 port=self._port,
                 database=self._database,
@@ -297,13 +727,32 @@ class PostgreSQLStorage(StorageInterface):
             self._pool = None
     
     def _init_schema(self):
-        """初始化数据库 schema"""
+        """
+        初始化数据库 schema
+        
+        同一进程内每个库只检查一次；表和索引都已存在时只做一次 to_regclass 查询，
+        否则在事务级 advisory lock 下于单个事务内完成全部 DDL。
+        """
         if self._pool is None:
             return
+        ready_key = (self._host, self._port, self._database, self._table_prefix)
+        if ready_key in _pg_schema_ready:
+            return
         
         conn = self._pool.getconn()
         try:
             cur = conn.cursor()
+            relations = [name.format(p=self._table_prefix) for name in _PG_SCHEMA_RELATIONS]
+            cur.execute(
+                "SELECT " + ", ".join(["to_regclass(%s) IS NOT NULL"] * len(relations)),
+                relations
+            )
+            if all(cur.fetchone()):
+                conn.commit()
+                _pg_schema_ready.add(ready_key)
+                return
+            # 事务结束时自动释放；等待锁的进程随后执行的 IF NOT EXISTS 均为空操作
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (PG_SCHEMA_LOCK_KEY,))
             # 主数据表
             cur.execute(f"""
                 CREATE TABLE IF NOT EXISTS {self._table_prefix}data (
@@ -327,6 +776,10 @@ class PostgreSQLStorage(StorageInterface):
                     created_at TIMESTAMP DEFAULT NOW()
                 )
             """)
+            cur.execute(f"""
+                CREATE INDEX IF NOT EXISTS {self._table_prefix}checkpoints_agent_idx
+                ON {self._table_prefix}checkpoints (agent_pid, created_at)
+            """)
             # 审计日志表
             cur.execute(f"""
                 CREATE TABLE IF NOT EXISTS {self._table_prefix}audit (
@@ -340,6 +793,10 @@ class PostgreSQLStorage(StorageInterface):
                     created_at TIMESTAMP DEFAULT NOW()
                 )
             """)
+            cur.execute(f"""
+                CREATE INDEX IF NOT EXISTS {self._table_prefix}audit_agent_idx
+                ON {self._table_prefix}audit (agent_pid, id)
+            """)
             # 向量索引表
             cur.execute(f"""
                 CREATE TABLE IF NOT EXISTS {self._table_prefix}vectors (
@@ -352,87 +809,290 @@ class PostgreSQLStorage(StorageInterface):
                 )
             """)
             conn.commit()
+            _pg_schema_ready.add(ready_key)
         finally:
             self._pool.putconn(conn)
     
+    def _getconn(self):
+        """从连接池取连接，首次使用的连接先准备热点语句"""
+        conn = self._pool.getconn()
+        if conn.closed:
+            # 空闲期间被服务端断开的连接直接丢弃，重新取一个
+            self._pool.putconn(conn, close=True)
+            conn = self._pool.getconn()
+        if conn not in self._prepared:
+            try:
+                cur = conn.cursor()
+                for name, body in _PG_PREPARED_STATEMENTS.items():
+                    cur.execute(f"PREPARE {name} {body.format(p=self._table_prefix)}")
+                conn.commit()
+            except Exception:
+                # 准备失败的连接可能只准备了部分语句，关闭而不放回连接池
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+                self._pool.putconn(conn, close=True)
+                raise
+            self._prepared[conn] = True
+        return conn
+    
+    @contextmanager
+    def _connection(self):
+        """借出连接；出错时回滚，已断开的连接关闭而不放回连接池"""
+        tx_conn = getattr(self._tx, 'conn', None)
+        if tx_conn is not None:
+            # 处于 transaction() 中：复用事务连接，由外层负责提交和归还
+            try:
+                yield tx_conn
+            except Exception as e:
+                # 语句失败后 PostgreSQL 中止整个事务，记录下来由 transaction() 回滚并报错
+                self._tx.error = e
+                raise
+            return
+        conn = self._getconn()
+        try:
+            yield conn
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            self._pool.putconn(conn, close=bool(conn.closed))
+            raise
+        self._pool.putconn(conn)
+    
+    def _commit(self, conn):
+        """提交；处于 transaction() 中时推迟到事务结束"""
+        if getattr(self._tx, 'conn', None) is not conn:
+            conn.commit()
+    
+    def _relax_audit_commit(self, conn, cur):
+        """
+        按配置让审计写入异步提交
+        
+        SET LOCAL 作用于整个事务，transaction() 内跳过，避免同一事务中的其他写入也变为异步提交。
+        """
+        if not self._audit_synchronous_commit and getattr(self._tx, 'conn', None) is not conn:
+            cur.execute("SET LOCAL synchronous_commit TO OFF")
+    
+    @contextmanager
+    def transaction(self):
+        """
+        在同一连接、同一事务中执行多次操作，退出时提交一次
+        
+        块内抛出异常时整体回滚；嵌套调用并入外层事务。
+        各操作自身的失败仍以返回值表示，但失败的语句会中止整个事务：
+        退出时回滚并抛出 StorageOperationError，之前返回 True 的写入也不会生效。
+        写回模式下，进入事务前先写出队列，块内的写入直接走事务连接。
+        """
+        if self._pool is None or getattr(self._tx, 'conn', None) is not None:
+            yield
+            return
+        if self._write_behind:
+            self.flush()
+        with self._connection() as conn:
+            self._tx.conn = conn
+            self._tx.error = None
+            try:
+                yield
+                error = self._tx.error
+                if error is not None:
+                    raise StorageOperationError(
+                        f"Transaction rolled back: {error}", {'error': repr(error)}
+                    ) from error
+                conn.commit()
+            finally:
+                self._tx.conn = None
+                self._tx.error = None
+    
+    @contextmanager
+    def _outside_transaction(self):
+        """暂时脱离当前线程的 transaction()，块内操作使用连接池中的独立连接"""
+        tx_conn = getattr(self._tx, 'conn', None)
+        tx_error = getattr(self._tx, 'error', None)
+        self._tx.conn = None
+        try:
+            yield
+        finally:
+            self._tx.conn = tx_conn
+            self._tx.error = tx_error
+    
+    def _enqueue(self, entry: Tuple[str, tuple]):
+        """加入写回队列并唤醒后台线程"""
+        self._write_q.put(entry)
+        self._write_pending.set()
+    
+    def _flush_loop(self):
+        """后台合并写入"""
+        while self._running:
+            if not self._write_pending.wait(timeout=1.0):
+                continue
+            # 出队、收集和写出都在锁内完成，flush() 不会越过已出队的旧条目先写新值
+            with self._flush_lock:
+                # 先清除再出队：之后入队的条目会重新置位，不会遗漏
+                self._write_pending.clear()
+                try:
+                    first = self._write_q.get_nowait()
+                except queue.Empty:
+                    continue
+                batch = [first]
+                deadline = time.monotonic() + PG_WRITE_BEHIND_INTERVAL
+                while len(batch) < PG_WRITE_BEHIND_BATCH:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._write_q.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                self._write_batch(batch)
+                if not self._write_q.empty():
+                    # 批次已满，剩余条目在下一轮继续写出
+                    self._write_pending.set()
+    
+    def _write_batch(self, batch: List[Tuple[str, tuple]]):
+        data: Dict[str, str] = {}
+        audit = []
+        for kind, row in batch:
+            if kind == 'data':
+                # 同一批内同一个 key 只保留最后一次写入
+                data[row[0]] = row[1]
+            else:
+                audit.append(row)
+        if data:
+            self._write_data_rows(list(data.items()))
+        if audit:
+            self._write_audit_rows(audit)
+    
+    def flush(self):
+        """同步写出写回队列中的全部条目"""
+        with self._flush_lock:
+            batch = []
+            while True:
+                try:
+                    batch.append(self._write_q.get_nowait())
+                except queue.Empty:
+                    break
+            if batch:
+                # 队列中是所有线程的条目，不属于调用方的事务，用独立连接写出
+                with self._outside_transaction():
+                    self._write_batch(batch)
+    
     def save(self, key: str, value: Any) -> bool:
         if self._pool is None:
             return False
-        with self._lock:
+        if self._write_behind and getattr(self._tx, 'conn', None) is None:
             try:
-                conn = self._pool.getconn()
-                cur = conn.cursor()
-                value_json = json.dumps(value, ensure_ascii=False)
-                cur.execute(f"""
-                    INSERT INTO {self._table_prefix}data (key, value, modified_at)
-                    VALUES (%s, %s, NOW())
-                    ON CONFLICT (key) DO UPDATE SET value = %s, modified_at = NOW()
-                """, (key, value_json, value_json))
-                conn.commit()
-                self._pool.putconn(conn)
+                self._enqueue(('data', (key, _json_dumps(value))))
                 return True
             except Exception:
-                # 逻辑风险提示：这里吞掉所有异常并返回 False。
-                # - 上层无法区分“写入失败原因”（连接断开/权限/序列化失败/SQL 错误）。
-                # - 如果该写入承担检查点/审计等关键职责，静默失败会造成“看似运行但无法恢复/无法追溯”。
                 return False
+        try:
+            # 先序列化再取连接，缩短占用连接的时间
+            value_json = _json_dumps(value)
+            with self._connection() as conn:
+                cur = conn.cursor()
+                cur.execute("EXECUTE aosk_save (%s, %s)", (key, value_json))
+                self._commit(conn)
+            return True
+        except Exception:
+            # 逻辑风险提示：这里吞掉所有异常并返回 False。
+            # - 上层无法区分“写入失败原因”（连接断开/权限/序列化失败/SQL 错误）。
+            # - 如果该写入承担检查点/审计等关键职责，静默失败会造成“看似运行但无法恢复/无法追溯”。
+            return False
+    
+    def _execute_values(self, sql: str, rows: List[tuple], template: Optional[str] = None) -> bool:
+        """
+        多行写入：每 PG_BATCH_PAGE_SIZE 行合成一条 INSERT，整批一次提交
+        
+        失败时回滚整批并返回 False。
+        """
+        from psycopg2.extras import execute_values
+        try:
+            with self._connection() as conn:
+                cur = conn.cursor()
+                execute_values(cur, sql, rows, template=template, page_size=PG_BATCH_PAGE_SIZE)
+                self._commit(conn)
+            return True
+        except Exception:
+            return False
+    
+    def save_many(self, items: Dict[str, Any]) -> int:
+        """
+        批量保存
+        
+        Returns:
+            成功写入的数量（整批成功或整批失败）
+        """
+        if self._pool is None or not items:
+            return 0
+        rows = [(key, _json_dumps(value)) for key, value in items.items()]
+        return len(rows) if self._write_data_rows(rows) else 0
+    
+    def _write_data_rows(self, rows: List[Tuple[str, str]]) -> bool:
+        return self._execute_values(f"""
+            INSERT INTO {self._table_prefix}data (key, value, modified_at)
+            VALUES %s
+            ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, modified_at = NOW()
+        """, rows, template="(%s, %s, NOW())")
     
     def retrieve(self, key: str) -> Optional[Any]:
         if self._pool is None:
             return None
-        with self._lock:
-            try:
-                conn = self._pool.getconn()
+        if self._write_behind:
+            self.flush()
+        try:
+            with self._connection() as conn:
                 cur = conn.cursor()
-                cur.execute(f"""
-                    UPDATE {self._table_prefix}data SET access_at = NOW() WHERE key = %s
-                """, (key,))
-                cur.execute(f"SELECT value FROM {self._table_prefix}data WHERE key = %s", (key,))
+                # 更新访问时间并取值合并为一条语句，一次往返
+                cur.execute("EXECUTE aosk_retrieve (%s)", (key,))
                 row = cur.fetchone()
-                self._pool.putconn(conn)
-                if row:
-                    return json.loads(row[0])
-                return None
-            except Exception:
-                # 逻辑风险提示：返回 None 既可能表示“key 不存在”，也可能是“数据库异常”。
-                # 如果上层用 exists/retrieve 组合实现逻辑判断，可能会误判并进入错误分支。
-                return None
+                self._commit(conn)
+            if row:
+                return _json_loads(row[0])
+            return None
+        except Exception:
+            # 逻辑风险提示：返回 None 既可能表示“key 不存在”，也可能是“数据库异常”。
+            # 如果上层用 exists/retrieve 组合实现逻辑判断，可能会误判并进入错误分支。
+            return None
     
     def delete(self, key: str) -> bool:
         if self._pool is None:
             return False
-        with self._lock:
-            try:
-                conn = self._pool.getconn()
+        if self._write_behind:
+            self.flush()
+        try:
+            with self._connection() as conn:
                 cur = conn.cursor()
-                cur.execute(f"DELETE FROM {self._table_prefix}data WHERE key = %s", (key,))
+                cur.execute("EXECUTE aosk_delete (%s)", (key,))
                 deleted = cur.rowcount > 0
-                conn.commit()
-                self._pool.putconn(conn)
-                return deleted
-            except Exception:
-                return False
+                self._commit(conn)
+            return deleted
+        except Exception:
+            return False
     
     def exists(self, key: str) -> bool:
         if self._pool is None:
             return False
-        with self._lock:
-            try:
-                conn = self._pool.getconn()
+        if self._write_behind:
+            self.flush()
+        try:
+            with self._connection() as conn:
                 cur = conn.cursor()
-                cur.execute(f"SELECT 1 FROM {self._table_prefix}data WHERE key = %s", (key,))
+                cur.execute("EXECUTE aosk_exists (%s)", (key,))
                 exists = cur.fetchone() is not None
-                self._pool.putconn(conn)
-                return exists
-            except Exception:
-                return False
+            return exists
+        except Exception:
+            return False
     
     def list_keys(self, prefix: str = "") -> List[str]:
         if self._pool is None:
             return []
-        with self._lock:
-            try:
-                conn = self._pool.getconn()
+        if self._write_behind:
+            self.flush()
+        try:
+            with self._connection() as conn:
                 cur = conn.cursor()
                 if prefix:
                     cur.execute(f"SELECT key FROM {self._table_prefix}data WHERE key LIKE %s", 
@@ -440,151 +1100,404 @@ class PostgreSQLStorage(StorageInterface):
                 else:
                     cur.execute(f"SELECT key FROM {self._table_prefix}data")
                 keys = [row[0] for row in cur.fetchall()]
-                self._pool.putconn(conn)
-                return keys
-            except Exception:
-                return []
+            return keys
+        except Exception:
+            return []
     
     def clear(self) -> bool:
         if self._pool is None:
             return False
-        with self._lock:
-            try:
-                conn = self._pool.getconn()
+        if self._write_behind:
+            self.flush()
+        try:
+            with self._connection() as conn:
                 cur = conn.cursor()
                 cur.execute(f"TRUNCATE {self._table_prefix}data CASCADE")
-                conn.commit()
-                self._pool.putconn(conn)
-                return True
-            except Exception:
-                return False
+                self._commit(conn)
+            return True
+        except Exception:
+            return False
     
     def save_checkpoint(self, checkpoint_data: dict) -> bool:
         """保存检查点"""
         if self._pool is None:
             return False
         try:
-            conn = self._pool.getconn()
-            cur = conn.cursor()
-            cur.execute(f"""
-                INSERT INTO {self._table_prefix}checkpoints 
-                (checkpoint_id, agent_pid, agent_name, description, state, context, metadata)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (checkpoint_id) DO UPDATE SET
-                    state = EXCLUDED.state,
-                    context = EXCLUDED.context,
-                    metadata = EXCLUDED.metadata
-            """, (
+            params = (
                 checkpoint_data['checkpoint_id'],
                 checkpoint_data.get('agent_pid', ''),
                 checkpoint_data.get('agent_name', ''),
                 checkpoint_data.get('description', ''),
-                json.dumps(checkpoint_data.get('state', {})),
-                json.dumps(checkpoint_data.get('context_pages', [])),
-                json.dumps(checkpoint_data.get('metadata', {}))
-            ))
-            conn.commit()
-            self._pool.putconn(conn)
+                _json_dumps(checkpoint_data.get('state', {})),
+                _json_dumps(checkpoint_data.get('context_pages', [])),
+                _json_dumps(checkpoint_data.get('metadata', {}))
+            )
+            with self._connection() as conn:
+                cur = conn.cursor()
+                cur.execute("EXECUTE aosk_save_checkpoint (%s, %s, %s, %s, %s, %s, %s)", params)
+                self._commit(conn)
             return True
         except Exception:
             # 逻辑风险提示：检查点保存失败会直接返回 False；
             # 若上层未显式处理该 False，可能导致“已创建检查点”的假象，最终无法恢复。
             return False
     
+    def list_checkpoints(self, agent_pid: str = None) -> List[dict]:
+        """按创建时间列出检查点，指定 agent_pid 时走 (agent_pid, created_at) 索引"""
+        if self._pool is None:
+            return []
+        columns = "checkpoint_id, agent_pid, agent_name, description, state, context, metadata"
+        try:
+            with self._connection() as conn:
+                cur = conn.cursor()
+                if agent_pid is None:
+                    cur.execute(f"""
+                        SELECT {columns} FROM {self._table_prefix}checkpoints
+                        ORDER BY created_at
+                    """)
+                else:
+                    cur.execute(f"""
+                        SELECT {columns} FROM {self._table_prefix}checkpoints
+                        WHERE agent_pid = %s ORDER BY created_at
+                    """, (agent_pid,))
+                rows = cur.fetchall()
+        except Exception:
+            return []
+        return [
+            {
+                'checkpoint_id': row[0],
+                'agent_pid': row[1],
+                'agent_name': row[2],
+                'description': row[3],
+                'state': _json_loads(row[4]),
+                'context_pages': _json_loads(row[5]) if row[5] else [],
+                'metadata': _json_loads(row[6]) if row[6] else {},
+            }
+            for row in rows
+        ]
+    
+    def get_audit_logs(self, agent_pid: str = None, limit: int = 100) -> List[dict]:
+        """取最近 limit 条审计日志，按写入顺序返回"""
+        if self._pool is None:
+            return []
+        if self._write_behind:
+            self.flush()
+        try:
+            with self._connection() as conn:
+                cur = conn.cursor()
+                if agent_pid is None:
+                    cur.execute(f"""
+                        SELECT {_PG_AUDIT_COLUMNS} FROM {self._table_prefix}audit
+                        ORDER BY id DESC LIMIT %s
+                    """, (limit,))
+                else:
+                    cur.execute(f"""
+                        SELECT {_PG_AUDIT_COLUMNS} FROM {self._table_prefix}audit
+                        WHERE agent_pid = %s ORDER BY id DESC LIMIT %s
+                    """, (agent_pid, limit))
+                rows = cur.fetchall()
+        except Exception:
+            return []
+        return list(map(self._audit_log, reversed(rows)))
+    
+    def iter_audit_logs(self, agent_pid: str = None) -> Iterator[dict]:
+        """
+        按写入顺序流式读取全部审计日志
+        
+        使用服务端命名游标，每次只传输 PG_STREAM_ITERSIZE 行，
+        导出大量日志时内存占用与总行数无关。
+        """
+        if self._pool is None:
+            return
+        if self._write_behind:
+            self.flush()
+        conn = self._getconn()
+        try:
+            cur = conn.cursor(name=f"{self._table_prefix}audit_stream")
+            cur.itersize = PG_STREAM_ITERSIZE
+            if agent_pid is None:
+                cur.execute(f"""
+                    SELECT {_PG_AUDIT_COLUMNS} FROM {self._table_prefix}audit ORDER BY id
+                """)
+            else:
+                cur.execute(f"""
+                    SELECT {_PG_AUDIT_COLUMNS} FROM {self._table_prefix}audit
+                    WHERE agent_pid = %s ORDER BY id
+                """, (agent_pid,))
+            yield from map(self._audit_log, cur)
+            cur.close()
+        finally:
+            # 命名游标绑定在只读事务上，结束事务后再归还连接
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            self._pool.putconn(conn, close=bool(conn.closed))
+    
+    @staticmethod
+    def _audit_log(row: tuple) -> dict:
+        agent_pid, action, resource, details, result, duration_ms = row
+        return {
+            'agent_pid': agent_pid,
+            'action': action,
+            'resource': resource,
+            'details': _json_loads(details) if details else {},
+            'result': result,
+            'duration_ms': duration_ms,
+        }
+    
+    @staticmethod
+    def _audit_row(log_data: dict) -> tuple:
+        return (
+            log_data.get('agent_pid', ''),
+            log_data.get('action', ''),
+            log_data.get('resource', ''),
+            _json_dumps(log_data.get('details', {})),
+            log_data.get('result', ''),
+            log_data.get('duration_ms', 0)
+        )
+    
     def save_audit_log(self, log_data: dict) -> bool:
         """保存审计日志"""
         if self._pool is None:
             return False
         try:
-            conn = self._pool.getconn()
-            cur = conn.cursor()
-            cur.execute(f"""
-                INSERT INTO {self._table_prefix}audit 
-                (agent_pid, action, resource, details, result, duration_ms)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (
-                log_data.get('agent_pid', ''),
-                log_data.get('action', ''),
-                log_data.get('resource', ''),
-                json.dumps(log_data.get('details', {})),
-                log_data.get('result', ''),
-                log_data.get('duration_ms', 0)
-            ))
-            conn.commit()
-            self._pool.putconn(conn)
+            row = self._audit_row(log_data)
+            if self._write_behind and getattr(self._tx, 'conn', None) is None:
+                self._enqueue(('audit', row))
+                return True
+            with self._connection() as conn:
+                cur = conn.cursor()
+                self._relax_audit_commit(conn, cur)
+                cur.execute("EXECUTE aosk_save_audit_log (%s, %s, %s, %s, %s, %s)", row)
+                self._commit(conn)
             return True
         except Exception:
             # 逻辑风险提示：审计日志写入失败被静默吞掉，会让“可观测性/审计”形同虚设。
             return False
     
+    def save_audit_logs(self, logs: List[dict]) -> int:
+        """
+        批量保存审计日志
+        
+        Returns:
+            成功写入的数量（整批成功或整批失败）
+        """
+        if self._pool is None or not logs:
+            return 0
+        rows = [self._audit_row(log_data) for log_data in logs]
+        return len(rows) if self._write_audit_rows(rows) else 0
+    
+    def _write_audit_rows(self, rows: List[tuple]) -> bool:
+        """审计日志只追加、没有冲突处理，用 COPY FROM STDIN 整批写入"""
+        buf = io.StringIO()
+        for row in rows:
+            buf.write('\t'.join(map(_pg_copy_field, row)))
+            buf.write('\n')
+        buf.seek(0)
+        try:
+            with self._connection() as conn:
+                cur = conn.cursor()
+                self._relax_audit_commit(conn, cur)
+                cur.copy_expert(f"""
+                    COPY {self._table_prefix}audit
+                    (agent_pid, action, resource, details, result, duration_ms)
+                    FROM STDIN
+                """, buf)
+                self._commit(conn)
+            return True
+        except Exception:
+            return False
+    
     def save_vector(self, key: str, content: str, embedding: bytes, metadata: dict = None) -> bool:
         """保存向量"""
         if self._pool is None:
             return False
         try:
-            conn = self._pool.getconn()
-            cur = conn.cursor()
-            cur.execute(f"""
-                INSERT INTO {self._table_prefix}vectors (key, content, embedding, metadata)
-                VALUES (%s, %s, %s, %s)
-            """, (key, content, embedding, json.dumps(metadata or {})))
-            conn.commit()
-            self._pool.putconn(conn)
+            metadata_json = _json_dumps(metadata or {})
+            with self._connection() as conn:
+                cur = conn.cursor()
+                cur.execute(
+                    "EXECUTE aosk_save_vector (%s, %s, %s, %s)",
+                    (key, content, embedding, metadata_json)
+                )
+                self._commit(conn)
             return True
         except Exception:
             # 逻辑风险提示：向量写入失败同样被吞掉。
             # 如果上层依赖语义检索作为关键能力，需确保失败可被观测并触发降级策略。
             return False
     
+    def save_vectors(self, vectors: List[dict]) -> int:
+        """
+        批量保存向量
+        
+        Args:
+            vectors: 每项包含 key、content、embedding，可选 metadata
+        
+        Returns:
+            成功写入的数量（整批成功或整批失败）
+        """
+        if self._pool is None or not vectors:
+            return 0
+        rows = [
+            (v['key'], v['content'], v['embedding'], _json_dumps(v.get('metadata') or {}))
+            for v in vectors
+        ]
+        ok = self._execute_values(f"""
+            INSERT INTO {self._table_prefix}vectors (key, content, embedding, metadata)
+            VALUES %s
+        """, rows)
+        return len(rows) if ok else 0
+    
     def search_vectors(self, query_embedding: bytes, limit: int = 10) -> List[dict]:
         """搜索向量 (简化版 - 实际应使用 pgvector)"""
         if self._pool is None:
             return []
         try:
-            conn = self._pool.getconn()
-            cur = conn.cursor()
-            # 这里使用简化的相似度计算
-            # 实际应该使用 pgvector 扩展的向量操作
-            cur.execute(f"""
-                SELECT id, key, content, metadata, 
-                       (embedding <=> %s) as similarity
-                FROM {self._table_prefix}vectors
-                ORDER BY similarity ASC
-                LIMIT %s
-            """, (query_embedding, limit))
-            results = []
-            for row in cur.fetchall():
-                results.append({
-                    'id': row[0],
-                    'key': row[1],
-                    'content': row[2],
-                    'metadata': json.loads(row[3]) if row[3] else {},
-                    'similarity': row[4]
-                })
-            self._pool.putconn(conn)
+            with self._connection() as conn:
+                cur = conn.cursor()
+                # 这里使用简化的相似度计算
+                # 实际应该使用 pgvector 扩展的向量操作
+                cur.execute(f"""
+                    SELECT id, key, content, metadata, 
+                           (embedding <=> %s) as similarity
+                    FROM {self._table_prefix}vectors
+                    ORDER BY similarity ASC
+                    LIMIT %s
+                """, (query_embedding, limit))
+                results = []
+                for row in cur.fetchall():
+                    results.append({
+                        'id': row[0],
+                        'key': row[1],
+                        'content': row[2],
+                        'metadata': _json_loads(row[3]) if row[3] else {},
+                        'similarity': row[4]
+                    })
             return results
         except Exception:
             return []
     
     def close(self):
-        """关闭连接池"""
+        """关闭连接池，先写出写回队列中的剩余条目"""
+        if self._flusher:
+            self._running = False
+            self._flusher.join(timeout=2.0)
+            self._flusher = None
         if self._pool:
+            if self._write_behind:
+                self.flush()
             self._pool.closeall()
 
 
+# 向量搜索矩阵支持的元素类型
+VECTOR_DTYPES = ('float32', 'float16', 'int8')
+
+# 窄类型矩阵按块升位计算，单块控制在 L2 缓存量级
+VECTOR_SEARCH_CHUNK_ROWS = 4096
+
+# 向量索引类型：auto 在数据量达到阈值后自动切换到 HNSW
+VECTOR_INDEX_TYPES = ('auto', 'flat', 'hnsw')
+VECTOR_ANN_MIN_SIZE = 10000
+
+# 余弦相似度分母上的极小量：零向量得到 0.0，无需单独分支
+_COSINE_EPS = 1e-12
+
+
 class VectorStorage(StorageInterface):
-    """向量存储后端 (简化实现)"""
+    """向量存储后端 (简化实现)
+
+    向量以 float32 原始字节保存。写入时解码一次并缓存范数；
+    安装了 numpy 时，搜索把同维度向量拼成矩阵 (按版本号缓存)，
+    一次矩阵乘法算出全部相似度，否则退回纯 Python 逐行计算。
+
+    dtype 为 'float16' 或 'int8' 时，搜索矩阵以窄类型保存以减少内存带宽；
+    int8 按每行最大绝对值对称量化。余弦相似度与缩放无关，因此无需保存
+    每行的 scale。纯 Python 路径始终按 float32 计算。
+
+    安装了 hnswlib 时，维度等于 embedding_dim 的向量可以走 HNSW 近似索引：
+    index='hnsw' 立即启用，index='auto' 在向量数达到 VECTOR_ANN_MIN_SIZE
+    后启用，index='flat' 始终暴力计算。未安装 hnswlib 时静默退回暴力计算。
+    """
     
-    def __init__(self, embedding_dim: int = 384):
+    def __init__(self, embedding_dim: int = 384, dtype: str = 'float32',
+                 index: str = 'auto'):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unknown vector dtype: {dtype}")
+        if index not in VECTOR_INDEX_TYPES:
+            raise ValueError(f"Unknown vector index: {index}")
         self._embedding_dim = embedding_dim
+        self._dtype = dtype
+        self._index_type = index
+        # HNSW 索引及 key <-> label 映射，删除的 label 在 _ann_keys 中置为 None
+        self._ann = None
+        self._ann_labels: Dict[str, int] = {}
+        self._ann_keys: List[Optional[str]] = []
         self._vectors: Dict[str, bytes] = {}
         self._metadata: Dict[str, Dict] = {}
         self._content: Dict[str, str] = {}
+        # key -> (解码后的向量, 范数)
+        self._decoded: Dict[str, Tuple[Sequence[float], float]] = {}
+        # 每次增删改递增，用于判断矩阵缓存是否失效
+        self._version = 0
+        # (版本号, 字节长度, 键列表, 矩阵, 范数)
+        self._matrix_cache: Optional[Tuple[int, int, List[str], Any, Any]] = None
         self._lock = threading.RLock()
     
+    @staticmethod
+    def _decode(embedding: bytes) -> Tuple[Sequence[float], float]:
+        """把字节解码为 float32 向量并计算范数"""
+        if len(embedding) % 4:
+            return (), 0.0
+        vec = array('f')
+        vec.frombytes(embedding)
+        return vec, math.sqrt(sum(map(mul, vec, vec)))
+    
+    def _put_locked(self, key: str, embedding: bytes):
+        self._vectors[key] = embedding
+        self._decoded[key] = self._decode(embedding)
+        self._version += 1
+        if self._ann is not None:
+            self._ann_put_locked(key, embedding)
+    
+    def _ann_ready_locked(self) -> bool:
+        """判断是否使用 HNSW 索引，必要时从现有向量构建"""
+        if self._ann is not None:
+            return True
+        if not _HAS_HNSWLIB or self._index_type == 'flat':
+            return False
+        if self._index_type == 'auto' and len(self._vectors) < VECTOR_ANN_MIN_SIZE:
+            return False
+        ann = hnswlib.Index(space='cosine', dim=self._embedding_dim)
+        ann.init_index(max_elements=max(2 * len(self._vectors), 1024),
+                       ef_construction=200, M=16)
+        self._ann = ann
+        for key, embedding in self._vectors.items():
+            self._ann_put_locked(key, embedding)
+        return True
+    
+    def _ann_put_locked(self, key: str, embedding: bytes):
+        if len(embedding) != self._embedding_dim * 4:
+            return
+        label = self._ann_labels.get(key)
+        if label is None:
+            label = len(self._ann_keys)
+            if label >= self._ann.get_max_elements():
+                self._ann.resize_index(2 * label)
+            self._ann_labels[key] = label
+            self._ann_keys.append(key)
+        self._ann.add_items(np.frombuffer(embedding, dtype=np.float32).reshape(1, -1), [label])
+    
+    def _ann_delete_locked(self, key: str):
+        label = self._ann_labels.pop(key, None)
+        if label is not None:
+            self._ann.mark_deleted(label)
+            self._ann_keys[label] = None
+    
     def save(self, key: str, embedding: bytes) -> bool:
         with self._lock:
-            self._vectors[key] = embedding
+            self._put_locked(key, embedding)
             return True
     
     def retrieve(self, key: str) -> Optional[bytes]:
@@ -595,6 +1508,10 @@ class VectorStorage(StorageInterface):
         with self._lock:
             if key in self._vectors:
                 del self._vectors[key]
+                del self._decoded[key]
+                self._version += 1
+                if self._ann is not None:
+                    self._ann_delete_locked(key)
                 if key in self._metadata:
                     del self._metadata[key]
                 return True
@@ -613,52 +1530,139 @@ class VectorStorage(StorageInterface):
     def clear(self) -> bool:
         with self._lock:
             self._vectors.clear()
+            self._decoded.clear()
             self._metadata.clear()
+            self._version += 1
+            self._matrix_cache = None
+            self._ann = None
+            self._ann_labels.clear()
+            self._ann_keys.clear()
             return True
     
+    def get_entry(self, key: str) -> Optional[dict]:
+        """获取向量对应的内容和元数据"""
+        with self._lock:
+            if key not in self._vectors:
+                return None
+            return {'content': self._content.get(key, ''), 'metadata': self._metadata.get(key, {})}
+    
     def add(self, key: str, content: str, embedding: bytes, metadata: Dict = None) -> bool:
         """添加向量和内容"""
         with self._lock:
-            self._vectors[key] = embedding
+            self._put_locked(key, embedding)
             self._content[key] = content
             self._metadata[key] = metadata or {}
             return True
     
     def search(self, query_embedding: bytes, top_k: int = 10) -> List[dict]:
-        """搜索相似向量 (暴力计算 - 生产环境应使用索引)"""
-        import math
+        """搜索相似向量 (暴力计算 - 生产环境应使用索引)
+
+        只比较与查询向量维度相同的向量，结果按相似度降序，
+        相似度相同时按插入顺序。
+        """
+        if top_k <= 0:
+            return []
         with self._lock:
-            results = []
-            for key, emb in self._vectors.items():
-                # 计算余弦相似度
-                similarity = self._cosine_similarity(query_embedding, emb)
-                results.append({
+            if (len(query_embedding) == self._embedding_dim * 4
+                    and self._ann_ready_locked()):
+                scored = self._search_ann(query_embedding, top_k)
+            elif _HAS_NUMPY:
+                scored = self._search_numpy(query_embedding, top_k)
+            else:
+                scored = self._search_python(query_embedding, top_k)
+            return [
+                {
                     'key': key,
                     'content': self._content.get(key, ''),
                     'metadata': self._metadata.get(key, {}),
                     'similarity': similarity
-                })
-            # 排序并返回 top_k
-            results.sort(key=lambda x: x['similarity'], reverse=True)
-            return results[:top_k]
+                }
+                for key, similarity in scored
+            ]
+    
+    def _search_ann(self, query_embedding: bytes, top_k: int) -> List[Tuple[str, float]]:
+        k = min(top_k, len(self._ann_labels))
+        if not k:
+            return []
+        self._ann.set_ef(max(2 * k, 50))
+        labels, distances = self._ann.knn_query(
+            np.frombuffer(query_embedding, dtype=np.float32).reshape(1, -1), k=k
+        )
+        # cosine 空间的距离为 1 - 相似度，结果已按距离升序
+        return [
+            (self._ann_keys[label], 1.0 - float(distance))
+            for label, distance in zip(labels[0], distances[0])
+        ]
+    
+    def _search_python(self, query_embedding: bytes, top_k: int) -> List[Tuple[str, float]]:
+        query, query_norm = self._decode(query_embedding)
+        if not query:
+            return []
+        dim = len(query)
+        scored = [
+            (key, sum(map(mul, vec, query)) / (norm * query_norm + _COSINE_EPS))
+            for key, (vec, norm) in self._decoded.items()
+            if len(vec) == dim
+        ]
+        # nlargest 与 sorted(..., reverse=True)[:n] 等价，保持插入顺序的稳定性
+        return heapq.nlargest(top_k, scored, key=lambda item: item[1])
+    
+    def _matrix_locked(self, size: int):
+        """返回 (键列表, 矩阵, 范数)，只在数据变化后重建"""
+        cache = self._matrix_cache
+        if cache is None or cache[0] != self._version or cache[1] != size:
+            keys = [k for k, emb in self._vectors.items() if len(emb) == size]
+            matrix = self._narrow(np.frombuffer(
+                b''.join(self._vectors[k] for k in keys), dtype=np.float32
+            ).reshape(len(keys), size // 4))
+            norms = np.linalg.norm(matrix.astype(np.float32, copy=False), axis=1)
+            cache = self._matrix_cache = (self._version, size, keys, matrix, norms)
+        return cache[2], cache[3], cache[4]
+    
+    def _narrow(self, matrix):
+        """把 float32 矩阵转换为搜索用的元素类型"""
+        if self._dtype == 'int8':
+            peak = np.abs(matrix).max(axis=1, keepdims=True)
+            scale = np.divide(127.0, peak, out=np.zeros_like(peak), where=peak != 0)
+            return np.rint(matrix * scale).astype(np.int8)
+        if self._dtype == 'float16':
+            return matrix.astype(np.float16)
+        return matrix
+    
+    def _search_numpy(self, query_embedding: bytes, top_k: int) -> List[Tuple[str, float]]:
+        size = len(query_embedding)
+        if not size or size % 4:
+            return []
+        keys, matrix, norms = self._matrix_locked(size)
+        if not keys:
+            return []
+        work = np.int32 if self._dtype == 'int8' else np.float32
+        query = self._narrow(
+            np.frombuffer(query_embedding, dtype=np.float32).reshape(1, -1)
+        )[0].astype(work)
+        if matrix.dtype == work:
+            dots = matrix @ query
+        else:
+            dots = np.empty(len(keys), dtype=np.float64)
+            for start in range(0, len(keys), VECTOR_SEARCH_CHUNK_ROWS):
+                block = matrix[start:start + VECTOR_SEARCH_CHUNK_ROWS]
+                dots[start:start + len(block)] = block.astype(work) @ query
+        sims = dots / (norms * np.linalg.norm(query.astype(np.float32)) + _COSINE_EPS)
+        if top_k < len(keys):
+            rows = np.argpartition(-sims, top_k - 1)[:top_k]
+        else:
+            rows = np.arange(len(keys))
+        # 相似度降序，相同时按行号 (即插入顺序)
+        rows = rows[np.lexsort((rows, -sims[rows]))]
+        return [(keys[i], float(sims[i])) for i in rows]
     
     def _cosine_similarity(self, a: bytes, b: bytes) -> float:
         """计算余弦相似度"""
-        import struct
         if len(a) != len(b):
             return 0.0
-        # 将 bytes 转换为浮点数列表
-        try:
-            vec_a = struct.unpack(f'{len(a)//8}f', a)
-            vec_b = struct.unpack(f'{len(b)//8}f', b)
-            dot = sum(x * y for x, y in zip(vec_a, vec_b))
-            norm_a = math.sqrt(sum(x * x for x in vec_a))
-            norm_b = math.sqrt(sum(x * x for x in vec_b))
-            if norm_a * norm_b == 0:
-                return 0.0
-            return dot / (norm_a * norm_b)
-        except Exception:
-            return 0.0
+        vec_a, norm_a = self._decode(a)
+        vec_b, norm_b = self._decode(b)
+        return sum(map(mul, vec_a, vec_b)) / (norm_a * norm_b + _COSINE_EPS)
 
 
 class StorageManager:
@@ -685,12 +1689,33 @@ class StorageManager:
         
         # 向量存储 (用于语义搜索)
         self._vector = VectorStorage()
+        # 内存后端不再为向量内容另存副本，retrieve/exists/list_keys 直接回落到向量存储
+        self._vectors_inline = isinstance(self._data, MemoryStorage)
         
         # 检查点存储
         self._checkpoint = self._create_storage(StorageBackend.MEMORY, kwargs)
         
         # 审计日志存储
         self._audit = self._create_storage(StorageBackend.MEMORY, kwargs)
+        
+        # 二级索引：按写入顺序记录键，列表查询只读取命中的键
+        # agent_pid -> {checkpoint_id: None}；_checkpoint_owner 记录检查点所属 agent_pid
+        self._checkpoint_index: Dict[str, Dict[str, None]] = {}
+        self._checkpoint_owner: Dict[str, str] = {}
+        # 审计日志键；_audit_index 按 agent_pid 分组，序号保证同一时刻写入的键不冲突
+        self._audit_keys: List[str] = []
+        self._audit_index: Dict[str, List[str]] = {}
+        self._audit_seq = itertools.count()
+        self._index_lock = threading.Lock()
+        
+        # PostgreSQL 后端的检查点与审计日志直接绑定到后端方法，调用时不再判断后端类型
+        if isinstance(self._data, PostgreSQLStorage):
+            self.save_checkpoint = self._data.save_checkpoint
+            self.get_checkpoint = self._data.retrieve
+            self.list_checkpoints = self._data.list_checkpoints
+            self.log_audit = self._data.save_audit_log
+            self.get_audit_logs = self._data.get_audit_logs
+            self.iter_audit_logs = self._data.iter_audit_logs
     
     def _create_storage(self, backend: StorageBackend, kwargs: Dict) -> StorageInterface:
         """创建存储后端实例"""
@@ -705,7 +1730,11 @@ class StorageManager:
                 database=kwargs.get('postgresql_database', 'aosk'),
                 user=kwargs.get('postgresql_user', 'aosk'),
                 password=kwargs.get('postgresql_password', 'secret'),
-                table_prefix=kwargs.get('table_prefix', 'aosk_')
+                table_prefix=kwargs.get('table_prefix', 'aosk_'),
+                write_behind=kwargs.get('postgresql_write_behind', False),
+                min_connections=kwargs.get('postgresql_min_connections', 2),
+                max_connections=kwargs.get('postgresql_max_connections', 20),
+                audit_synchronous_commit=kwargs.get('postgresql_audit_synchronous_commit', True)
             )
         else:
             return MemoryStorage()
@@ -718,7 +1747,10 @@ class StorageManager:
     
     def retrieve(self, key: str) -> Optional[Any]:
         """检索数据"""
-        return self._data.retrieve(key)
+        value = self._data.retrieve(key)
+        if value is None and self._vectors_inline:
+            return self._vector.get_entry(key)
+        return value
     
     def delete(self, key: str) -> bool:
         """删除数据"""
@@ -728,41 +1760,61 @@ class StorageManager:
     
     def exists(self, key: str) -> bool:
         """检查键是否存在"""
-        return self._data.exists(key)
+        return self._data.exists(key) or (self._vectors_inline and self._vector.exists(key))
     
     def list_keys(self, prefix: str = "") -> List[str]:
         """列出所有键"""
-        return self._data.list_keys(prefix)
+        keys = self._data.list_keys(prefix)
+        if self._vectors_inline:
+            keys += [k for k in self._vector.list_keys(prefix) if not self._data.exists(k)]
+        return keys
     
     def clear(self) -> bool:
         """清空存储"""
+        self._vector.clear()
         return self._data.clear()
     
+    def transaction(self):
+        """
+        把多次写入合并为一个事务 (PostgreSQL 后端)，退出时提交一次
+        
+        块内任一操作失败时整体回滚并抛出 StorageOperationError。
+        其他后端没有事务语义，返回空上下文。
+        """
+        if isinstance(self._data, PostgreSQLStorage):
+            return self._data.transaction()
+        return nullcontext()
+    
     # ========== 检查点管理 ==========
     
     def save_checkpoint(self, checkpoint_data: dict) -> bool:
         """保存检查点"""
         checkpoint_id = checkpoint_data.get('checkpoint_id', '')
-        if self._backend == StorageBackend.POSTGRESQL:
-            if isinstance(self._data, PostgreSQLStorage):
-                return self._data.save_checkpoint(checkpoint_data)
-        return self._checkpoint.save(checkpoint_id, checkpoint_data)
+        if not self._checkpoint.save(checkpoint_id, checkpoint_data):
+            return False
+        agent_pid = checkpoint_data.get('agent_pid')
+        with self._index_lock:
+            if checkpoint_id in self._checkpoint_owner:
+                self._checkpoint_index[self._checkpoint_owner[checkpoint_id]].pop(checkpoint_id)
+            self._checkpoint_owner[checkpoint_id] = agent_pid
+            self._checkpoint_index.setdefault(agent_pid, {})[checkpoint_id] = None
+        return True
     
     def get_checkpoint(self, checkpoint_id: str) -> Optional[dict]:
         """获取检查点"""
-        if self._backend == StorageBackend.POSTGRESQL:
-            if isinstance(self._data, PostgreSQLStorage):
-                # 从 PostgreSQL 获取
-                return self._data.retrieve(checkpoint_id)
         return self._checkpoint.retrieve(checkpoint_id)
     
     def list_checkpoints(self, agent_pid: str = None) -> List[dict]:
         """列出检查点"""
-        keys = self._checkpoint.list_keys()
+        if agent_pid is None:
+            keys = self._checkpoint.list_keys()
+        else:
+            with self._index_lock:
+                keys = list(self._checkpoint_index.get(agent_pid, ()))
         checkpoints = []
         for key in keys:
             cp = self._checkpoint.retrieve(key)
-            if cp and (agent_pid is None or cp.get('agent_pid') == agent_pid):
+            if cp:
                 checkpoints.append(cp)
         return checkpoints
     
@@ -770,21 +1822,53 @@ class StorageManager:
     
     def log_audit(self, log_data: dict) -> bool:
         """记录审计日志"""
-        if self._backend == StorageBackend.POSTGRESQL:
-            if isinstance(self._data, PostgreSQLStorage):
-                return self._data.save_audit_log(log_data)
-        return self._audit.save(
-            f"{log_data.get('action', 'unknown')}_{log_data.get('agent_pid', 'unknown')}_{time.time()}",
-            log_data
-        )
+        key = (f"{log_data.get('action', 'unknown')}_{log_data.get('agent_pid', 'unknown')}"
+               f"_{time.time()}_{next(self._audit_seq)}")
+        if not self._audit.save(key, log_data):
+            return False
+        with self._index_lock:
+            self._audit_keys.append(key)
+            self._audit_index.setdefault(log_data.get('agent_pid'), []).append(key)
+        return True
+    
+    def log_action(self,
+                   agent_pid: str,
+                   action_type: str,
+                   input_data: Any = None,
+                   output_data: Any = None,
+                   reasoning: str = "",
+                   duration_ms: float = 0) -> bool:
+        """记录一次 Agent 动作（内核主循环使用），写入审计日志"""
+        return self.log_audit({
+            'agent_pid': agent_pid,
+            'action': action_type,
+            'details': {'input': input_data, 'output': output_data, 'reasoning': reasoning},
+            'duration_ms': duration_ms,
+        })
+    
+    def iter_audit_logs(self, agent_pid: str = None) -> Iterator[dict]:
+        """按写入顺序逐条返回全部审计日志"""
+        with self._index_lock:
+            keys = list(self._audit_keys if agent_pid is None
+                        else self._audit_index.get(agent_pid, ()))
+        for key in keys:
+            log = self._audit.retrieve(key)
+            if log:
+                yield log
     
     def get_audit_logs(self, agent_pid: str = None, limit: int = 100) -> List[dict]:
-        """获取审计日志"""
-        keys = self._audit.list_keys()
+        """获取最近 limit 条审计日志，按写入顺序返回"""
+        if limit <= 0:
+            return []
+        with self._index_lock:
+            if agent_pid is None:
+                keys = self._audit_keys[-limit:]
+            else:
+                keys = self._audit_index.get(agent_pid, [])[-limit:]
         logs = []
-        for key in keys[-limit:]:
+        for key in keys:
             log = self._audit.retrieve(key)
-            if log and (agent_pid is None or log.get('agent_pid') == agent_pid):
+            if log:
                 logs.append(log)
         return logs
     
@@ -792,7 +1876,13 @@ class StorageManager:
     
     def save_vector(self, key: str, content: str, embedding: bytes, metadata: Dict = None) -> bool:
         """保存向量"""
-        self._data.save(key, {'content': content, 'metadata': metadata or {}})
+        if self._vectors_inline:
+            # 内存后端由向量存储回答 retrieve；先删除同名旧数据，避免它遮住新向量
+            # （retrieve 先查数据存储，之后再 save 同名键则以新数据为准）
+            self._data.delete(key)
+        else:
+            # 持久化后端需要一份内容副本，进程重启后仍可检索
+            self._data.save(key, {'content': content, 'metadata': metadata or {}})
         return self._vector.add(key, content, embedding, metadata)
     
     def search_vectors(self, query_embedding: bytes, top_k: int = 10) -> List[dict]:
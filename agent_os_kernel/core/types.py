@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 """核心类型定义"""
 
+import sys
 from enum import Enum
 from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional
@@ -8,6 +9,10 @@ from datetime import datetime, timezone, timedelta
 import uuid
 
 
+# @dataclass(**DATACLASS_SLOTS)：Python 3.10+ 生成 __slots__，旧版本退化为普通 dataclass
+DATACLASS_SLOTS: Dict[str, Any] = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+
 class AgentState(Enum):
     """Agent 状态"""
     CREATED = "created"      # 创建
@@ -257,7 +257,7 @@ class AgentOSKernel:
             self.security.create_sandbox(process.pid, policy)
         
         # 7. 保存到存储（长期记忆）
-        self.storage.save(f"process:{process.pid}", process.__dict__)
+        self.storage.save(f"process:{process.pid}", process.to_dict())
         
         # 8. 加入调度队列
         self.scheduler.add_process(process)
@@ -27,3 +27,222 @@ class TestSchedulerBasic:
         """测试调度器存在"""
         from agent_os_kernel.core.scheduler import AgentScheduler
         assert AgentScheduler is not None
+    
+    def test_schedule_skips_terminated(self):
+        """测试调度时跳过已终止的进程"""
+        from agent_os_kernel.core.scheduler import AgentScheduler, AgentProcess
+        scheduler = AgentScheduler()
+        for i in range(2000):
+            scheduler.add_process(AgentProcess(pid=f"dead-{i}", name=f"dead-{i}"))
+            scheduler.terminate_process(f"dead-{i}")
+        scheduler.add_process(AgentProcess(pid="alive", name="alive", priority=99))
+        
+        process = scheduler.schedule()
+        assert process is not None
+        assert process.pid == "alive"
+        assert scheduler.get_process_stats()['ready_queue_size'] == 0
+    
+    def test_waiting_process_wakes_after_timeout(self):
+        """测试等待进程超时后被唤醒"""
+        from agent_os_kernel.core.scheduler import AgentScheduler, AgentProcess
+        scheduler = AgentScheduler()
+        scheduler.add_process(AgentProcess(pid="p1", name="p1"))
+        scheduler.wait_process("p1", "io")
+        assert scheduler.schedule() is None
+        assert "p1" in scheduler.waiting_queue
+        
+        scheduler.wakeup_process("p1")
+        scheduler.schedule()
+        scheduler.wait_process("p1", "io", timeout=-1.0)
+        process = scheduler.schedule()
+        assert process is not None and process.pid == "p1"
+        assert "p1" not in scheduler.waiting_queue
+    
+    def test_signal_checks_ready_fn(self):
+        """测试 signal 仅在就绪条件满足时唤醒进程"""
+        from agent_os_kernel.core.scheduler import AgentScheduler, AgentProcess
+        scheduler = AgentScheduler()
+        scheduler.add_process(AgentProcess(pid="p1", name="p1"))
+        ready = [False]
+        scheduler.wait_process("p1", "event", timeout=None, ready_fn=lambda: ready[0])
+        
+        assert not scheduler.signal("p1")
+        assert scheduler.schedule() is None
+        
+        ready[0] = True
+        assert scheduler.signal("p1")
+        assert scheduler.schedule().pid == "p1"
+        assert not scheduler.signal("p1")
+    
+    def test_quota_waiter_woken_on_window_reset(self, monkeypatch):
+        """测试配额窗口重置后唤醒等待配额的进程"""
+        from agent_os_kernel.core import scheduler as sched
+        clock = [1000.0]
+        monkeypatch.setattr(sched, "_now", lambda: clock[0])
+        scheduler = sched.AgentScheduler(
+            quota=sched.ResourceQuota(max_tokens_per_window=1000, window_seconds=10)
+        )
+        scheduler.add_process(sched.AgentProcess(pid="p1", name="p1"))
+        scheduler.schedule()
+        
+        assert scheduler.request_resources("p1", 250)
+        assert not scheduler.request_resources("p1", 100)
+        assert scheduler.schedule() is None
+        
+        clock[0] += 5
+        assert scheduler.schedule() is None
+        
+        clock[0] += 5
+        assert scheduler.schedule().pid == "p1"
+    
+    def test_quota_waiter_woken_when_acquire_resets_window(self, monkeypatch):
+        """测试由 acquire 触发窗口重置时也能唤醒等待配额的进程"""
+        from agent_os_kernel.core import scheduler as sched
+        clock = [1000.0]
+        monkeypatch.setattr(sched, "_now", lambda: clock[0])
+        scheduler = sched.AgentScheduler(
+            quota=sched.ResourceQuota(max_tokens_per_window=1000, window_seconds=10)
+        )
+        scheduler.add_process(sched.AgentProcess(pid="p1", name="p1"))
+        scheduler.schedule()
+        
+        assert scheduler.request_resources("p1", 250)
+        assert not scheduler.request_resources("p1", 100)
+        assert scheduler.schedule() is None
+        
+        # 窗口到期后先由其他调用方的 acquire 完成重置
+        clock[0] += 10
+        assert scheduler.quota_manager.acquire("other", 10) == 0
+        assert scheduler.schedule().pid == "p1"
+    
+    def test_priority_then_fifo_order(self):
+        """测试按优先级调度，同优先级先进先出"""
+        from agent_os_kernel.core.scheduler import AgentScheduler, AgentProcess
+        scheduler = AgentScheduler()
+        for pid, priority in (("low", 80), ("a", 20), ("b", 20), ("high", 5)):
+            scheduler.add_process(AgentProcess(pid=pid, name=pid, priority=priority))
+        
+        order = []
+        while True:
+            process = scheduler.schedule()
+            if process is None:
+                break
+            order.append(process.pid)
+            scheduler.terminate_process(process.pid)
+        assert order == ["high", "a", "b", "low"]
+    
+    def test_higher_priority_preempts(self, monkeypatch):
+        """测试更高优先级的进程就绪时抢占当前进程"""
+        from agent_os_kernel.core import scheduler as sched
+        clock = [1000.0]
+        monkeypatch.setattr(sched, "_now", lambda: clock[0])
+        scheduler = sched.AgentScheduler()
+        scheduler.add_process(sched.AgentProcess(pid="bg", name="bg", priority=50))
+        assert scheduler.schedule().pid == "bg"
+        
+        scheduler.add_process(sched.AgentProcess(pid="near", name="near", priority=45))
+        scheduler.add_process(sched.AgentProcess(pid="urgent", name="urgent", priority=10))
+        # 未运行满最小时间片时不抢占
+        assert scheduler.schedule().pid == "bg"
+        
+        clock[0] += sched.MIN_TIME_SLICE
+        assert scheduler.schedule().pid == "urgent"
+        assert scheduler.stats['total_preempted'] == 1
+    
+    def test_vruntime_weighted_by_priority(self, monkeypatch):
+        """测试虚拟运行时间按优先级加权累计"""
+        from agent_os_kernel.core import scheduler as sched
+        clock = [1000.0]
+        monkeypatch.setattr(sched, "_now", lambda: clock[0])
+        scheduler = sched.AgentScheduler()
+        high = sched.AgentProcess(pid="high", name="high", priority=10)
+        low = sched.AgentProcess(pid="low", name="low", priority=90)
+        
+        for process in (high, low):
+            scheduler.add_process(process)
+            assert scheduler.schedule() is process
+            clock[0] += 10
+            scheduler.wait_process(process.pid, "io")
+        
+        assert high.vruntime < 10 < low.vruntime
+    
+    def test_process_stats_state_distribution(self):
+        """测试进程状态分布统计"""
+        from agent_os_kernel.core.scheduler import AgentScheduler, AgentProcess
+        scheduler = AgentScheduler()
+        for pid in ("a", "b", "c", "d"):
+            scheduler.add_process(AgentProcess(pid=pid, name=pid))
+        scheduler.schedule()
+        scheduler.wait_process("b", "io")
+        scheduler.suspend_process("c")
+        scheduler.terminate_process("d")
+        
+        stats = scheduler.get_process_stats()
+        assert stats['total_processes'] == 4
+        assert stats['active_processes'] == 3
+        assert stats['state_distribution'] == {
+            'running': 1, 'waiting': 1, 'suspended': 1, 'terminated': 1,
+        }
+
+
+class TestResourceQuotaManager:
+    """测试资源配额管理器"""
+    
+    def test_per_agent_limit(self):
+        """测试单个 Agent 配额上限"""
+        from agent_os_kernel.core.scheduler import ResourceQuota, ResourceQuotaManager
+        manager = ResourceQuotaManager(ResourceQuota(max_tokens_per_window=1000))
+        
+        approved, _ = manager.request_quota("a", 300)
+        assert approved
+        approved, reason = manager.request_quota("a", 1)
+        assert not approved
+        assert "Agent token quota" in reason
+    
+    def test_acquire_status_codes(self):
+        """测试 acquire 返回配额状态码"""
+        from agent_os_kernel.core import scheduler as sched
+        manager = sched.ResourceQuotaManager(sched.ResourceQuota(max_tokens_per_window=1000))
+        
+        assert manager.acquire("a", 200) == sched.QUOTA_OK
+        assert manager.acquire("a", 200) == sched.QUOTA_AGENT_TOKENS
+        assert manager.acquire("b", 2000) == sched.QUOTA_GLOBAL_TOKENS
+        assert sched.QUOTA_REASONS[sched.QUOTA_AGENT_TOKENS].startswith("Agent token quota")
+        assert manager.request_quota("b", 100) == (True, "Approved")
+    
+    def test_replace_quota_updates_limits(self):
+        """测试替换配额后单 Agent 上限随之更新"""
+        from agent_os_kernel.core.scheduler import ResourceQuota, ResourceQuotaManager
+        manager = ResourceQuotaManager(ResourceQuota(max_tokens_per_window=1000))
+        manager.quota = ResourceQuota(max_tokens_per_window=10000)
+        
+        approved, _ = manager.request_quota("a", 2000)
+        assert approved
+    
+    def test_preempt_check_skips_usage_stats(self, monkeypatch):
+        """测试抢占检查不再构建完整的使用统计"""
+        from agent_os_kernel.core.scheduler import AgentScheduler, AgentProcess, ResourceQuota
+        scheduler = AgentScheduler(quota=ResourceQuota(max_tokens_per_window=1000))
+        scheduler.add_process(AgentProcess(pid="p1", name="p1"))
+        scheduler.schedule()
+        scheduler.request_resources("p1", 300)
+        
+        def fail():
+            raise AssertionError("get_usage_stats called in preempt path")
+        monkeypatch.setattr(scheduler.quota_manager, "get_usage_stats", fail)
+        
+        assert not scheduler._should_preempt(scheduler.running, scheduler.running.last_run)
+        scheduler.quota_manager.per_agent_usage["p1"][0] += 1
+        assert scheduler._should_preempt(scheduler.running, scheduler.running.last_run)
+    
+    def test_usage_stats(self):
+        """测试使用统计"""
+        from agent_os_kernel.core.scheduler import ResourceQuota, ResourceQuotaManager
+        manager = ResourceQuotaManager(ResourceQuota(max_tokens_per_window=1000))
+        manager.request_quota("a", 100)
+        manager.request_quota("b", 200, api_calls=2)
+        
+        stats = manager.get_usage_stats()
+        assert stats['global_usage'] == {'tokens': 300, 'api_calls': 3}
+        assert stats['usage_percent']['tokens'] == 30
+        assert stats['per_agent_count'] == 2
@@ -13,3 +13,243 @@ class TestSecurityPolicyExists:
     def test_permission_import(self):
         from agent_os_kernel.core.security import PermissionLevel
         assert PermissionLevel is not None
+
+
+class TestSecurityPolicy:
+    """测试安全策略"""
+    
+    def test_to_dict_is_cached(self):
+        from agent_os_kernel.core.security import SecurityPolicy
+        policy = SecurityPolicy(read_only=True)
+        data = policy.to_dict()
+        assert data['read_only'] is True
+        assert data['permission_level'] == 'standard'
+        assert policy.to_dict() is data
+    
+    def test_policy_is_immutable(self):
+        import dataclasses
+        from agent_os_kernel.core.security import SecurityPolicy
+        policy = SecurityPolicy()
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            policy.read_only = True
+        
+        updated = dataclasses.replace(policy, read_only=True, blocked_tools=["rm"])
+        assert updated.to_dict()['read_only'] is True
+        assert "rm" in updated._blocked_tools_set
+        assert policy.to_dict()['read_only'] is False
+
+
+class TestSandboxManager:
+    """测试沙箱管理器"""
+    
+    def test_docker_probe_is_cached(self, monkeypatch):
+        from agent_os_kernel.core import security
+        calls = []
+        
+        def fake_run(*args, **kwargs):
+            calls.append(args)
+            raise FileNotFoundError("docker")
+        
+        monkeypatch.setattr(security, "_DOCKER_AVAILABLE", None)
+        monkeypatch.setattr(security, "_DOCKER_CLIENT", None)
+        monkeypatch.setattr(security.subprocess, "run", fake_run)
+        
+        first = security.SandboxManager()
+        second = security.SandboxManager()
+        assert not first.docker_available and not second.docker_available
+        assert second.docker_client is None
+        assert len(calls) == 1
+
+
+class TestFileAccess:
+    """测试文件访问校验"""
+    
+    def _manager(self, **policy_kwargs):
+        from agent_os_kernel.core.security import SandboxManager, SecurityPolicy
+        manager = SandboxManager.__new__(SandboxManager)
+        manager.containers = {
+            "agent": {
+                'type': 'process',
+                'workspace': '/tmp/agent-os-agent',
+                'policy': SecurityPolicy(**policy_kwargs),
+            }
+        }
+        return manager
+    
+    def test_allowed_and_blocked_paths(self):
+        manager = self._manager()
+        assert manager.validate_file_access("agent", "/tmp/data.txt")
+        assert manager.validate_file_access("agent", "/tmp")
+        assert not manager.validate_file_access("agent", "/etc/passwd")
+        assert not manager.validate_file_access("agent", "/tmpfoo/data.txt")
+        assert not manager.validate_file_access("agent", "/tmp/../etc/passwd")
+    
+    def test_relative_path_resolves_to_workspace(self):
+        manager = self._manager()
+        assert manager.validate_file_access("agent", "notes.txt")
+        assert not manager.validate_file_access("agent", "../../etc/passwd")
+    
+    def test_read_only(self):
+        manager = self._manager(read_only=True)
+        assert manager.validate_file_access("agent", "/tmp/data.txt", mode='read')
+        assert not manager.validate_file_access("agent", "/tmp/data.txt", mode='write')
+
+    def test_process_tool_policy(self):
+        manager = self._manager(blocked_tools=["rm"])
+        container = manager.containers["agent"]
+        for command in ("rm -rf /tmp/x", "rm\t-rf /tmp/x", "  rm"):
+            result = manager._execute_in_process(container, command, timeout=5)
+            assert result['error'] == 'Tool rm is blocked'
+        
+        manager = self._manager(allowed_tools=["echo"])
+        result = manager._execute_in_process(manager.containers["agent"], "ls /", timeout=5)
+        assert result['error'] == 'Tool ls is not in allowed tools list'
+
+
+class TestPermissionManager:
+    """测试权限管理"""
+    
+    def test_tool_lists(self):
+        from agent_os_kernel.core.security import PermissionManager, SecurityPolicy
+        manager = PermissionManager()
+        manager.set_policy("a", SecurityPolicy(allowed_tools=["ls", "cat"], blocked_tools=["cat"]))
+        manager.set_policy("b", SecurityPolicy(allowed_tools=[]))
+        
+        assert manager.can_use_tool("a", "ls")
+        assert not manager.can_use_tool("a", "cat")
+        assert not manager.can_use_tool("a", "rm")
+        assert not manager.can_use_tool("b", "ls")
+        assert manager.can_use_tool("default", "anything")
+    
+    def test_host_lists(self):
+        from agent_os_kernel.core.security import PermissionManager, SecurityPolicy
+        manager = PermissionManager()
+        manager.set_policy("a", SecurityPolicy(allowed_hosts=["api.example.com"]))
+        manager.set_policy("b", SecurityPolicy(blocked_hosts=["evil.example.com"]))
+        manager.set_policy("c", SecurityPolicy(network_enabled=False))
+        
+        assert manager.can_access_network("a", "api.example.com")
+        assert not manager.can_access_network("a", "other.example.com")
+        assert not manager.can_access_network("b", "evil.example.com")
+        assert manager.can_access_network("b", "api.example.com")
+        assert not manager.can_access_network("c", "api.example.com")
+
+
+class TestPersistentShell:
+    """测试容器常驻 shell 的输出解析"""
+    
+    class _FakeSocket:
+        def __init__(self, frames):
+            self.sent = b''
+            self.send_error = None
+            self.buffer = b''.join(
+                bytes([stream, 0, 0, 0]) + len(data).to_bytes(4, 'big') + data
+                for stream, data in frames
+            )
+        
+        def settimeout(self, timeout):
+            pass
+        
+        def sendall(self, data):
+            if self.send_error is not None:
+                raise self.send_error
+            self.sent += data
+        
+        def recv(self, size):
+            chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+            return chunk
+        
+        def close(self):
+            pass
+    
+    def _shell(self, frames):
+        from agent_os_kernel.core.security import _PersistentShell
+        shell = _PersistentShell.__new__(_PersistentShell)
+        shell._marker = b"__END__"
+        shell._sock = self._FakeSocket(frames)
+        shell.alive = True
+        return shell
+    
+    def test_run_parses_output_and_exit_code(self):
+        shell = self._shell([
+            (1, b"hello\n__EN"),
+            (2, b"warn\n"),
+            (1, b"D__ 3\n"),
+        ])
+        result = shell.run("echo hello", timeout=5)
+        assert result == {'success': False, 'stdout': 'hello\n', 'stderr': 'warn\n', 'exit_code': 3}
+        assert b"echo hello" in shell._sock.sent
+    
+    def test_closed_stream_raises(self):
+        shell = self._shell([(1, b"partial")])
+        with pytest.raises(EOFError):
+            shell.run("sleep 1", timeout=5)
+    
+    def test_non_utf8_output_replaced(self):
+        shell = self._shell([(1, b"caf\xe9\n__END__ 0\n")])
+        result = shell.run("cat latin1.txt", timeout=5)
+        assert result['stdout'] == "caf\ufffd\n"
+        assert result['exit_code'] == 0
+    
+    def _manager(self, shell):
+        from agent_os_kernel.core.security import SandboxManager
+        
+        class FakeContainer:
+            def __init__(self):
+                self.commands = []
+            
+            def exec_run(self, command, demux, timeout):
+                self.commands.append(command)
+                return type("ExecResult", (), {"exit_code": 0, "output": (b"fallback", None)})()
+        
+        manager = SandboxManager.__new__(SandboxManager)
+        manager.containers = {"a": FakeContainer()}
+        manager._shells = {"a": shell}
+        return manager
+    
+    def test_failure_after_send_does_not_rerun(self):
+        """测试命令发出后 shell 失效时返回错误结果，不再通过 exec_run 重复执行"""
+        shell = self._shell([(1, b"partial")])
+        manager = self._manager(shell)
+        result = manager.execute_in_sandbox("a", "rm -rf /workspace/x")
+        assert result['success'] is False
+        assert 'Persistent shell failed' in result['error']
+        assert manager.containers["a"].commands == []
+        assert "a" not in manager._shells
+    
+    def test_failure_before_send_falls_back(self):
+        """测试命令发出前 shell 已失效时回退到 exec_run"""
+        shell = self._shell([])
+        shell._sock.send_error = BrokenPipeError("closed")
+        manager = self._manager(shell)
+        result = manager.execute_in_sandbox("a", "ls")
+        assert result['stdout'] == "fallback"
+        assert manager.containers["a"].commands == ["ls"]
+        assert "a" not in manager._shells
+    
+    def test_command_keeps_argv_semantics(self):
+        """测试命令按 exec_run 的规则拆分参数，shell 元字符不被解释"""
+        shell = self._shell([(1, b"__END__ 0\n")])
+        shell.run("echo 'a b' ; $HOME", timeout=5)
+        assert b"( echo 'a b' ';' '$HOME'\n)" in shell._sock.sent
+        
+        assert shell.run("echo 'unclosed", timeout=5)['success'] is False
+    
+    def test_timeout_bounds_whole_command(self, monkeypatch):
+        """测试持续输出的命令在总时限到达后超时"""
+        import socket
+        import types
+        from agent_os_kernel.core import security
+        clock = [0.0]
+        monkeypatch.setattr(security, "time", types.SimpleNamespace(monotonic=lambda: clock[0]))
+        shell = self._shell([(1, b"tick\n")] * 100)
+        recv = shell._sock.recv
+        
+        def slow_recv(size):
+            clock[0] += 1
+            return recv(size)
+        
+        shell._sock.recv = slow_recv
+        with pytest.raises(socket.timeout):
+            shell.run("yes", timeout=5)
+        assert clock[0] == 5
@@ -9,6 +9,7 @@ import threading
 from agent_os_kernel.core.service_mesh import (
     CircuitState,
     LoadBalancingStrategy,
+    ConsistentHashStrategy,
     ServiceInstance,
     ServiceInfo,
     CircuitBreaker,
@@ -73,6 +74,22 @@ class TestServiceInstance:
         instance.status = "unhealthy"
         assert instance.is_healthy is False
 
+    
+    def test_service_instance_has_slots(self):
+        """测试服务实例使用 __slots__（Python 3.10+）"""
+        import sys
+        if sys.version_info < (3, 10):
+            pytest.skip("dataclass slots requires Python 3.10+")
+        instance = ServiceInstance(
+            service_id="test-service-4",
+            service_name="test-service",
+            host="localhost",
+            port=8080,
+        )
+        assert not hasattr(instance, "__dict__")
+        assert not hasattr(ServiceInfo(name="test-service", version="1.0.0"), "__dict__")
+        instance.connection_count += 1
+        assert instance.connection_count == 1
 
 class TestCircuitBreaker:
     """熔断器测试"""
@@ -107,6 +124,24 @@ class TestCircuitBreaker:
         time.sleep(0.2)
         assert cb.state == CircuitState.HALF_OPEN
     
+    def test_circuit_breaker_uses_monotonic_clock(self, monkeypatch):
+        """测试熔断超时使用单调时钟，关闭状态不读时钟"""
+        clock = [1000.0]
+        monkeypatch.setattr(time, "monotonic", lambda: clock[0])
+        # 墙上时间回拨不影响熔断恢复
+        monkeypatch.setattr(time, "time", lambda: 0.0)
+        cb = CircuitBreaker(name="test", failure_threshold=1, timeout_seconds=5)
+        
+        monkeypatch.setattr(time, "monotonic", lambda: pytest.fail("clock read"))
+        assert cb.allow_request() is True
+        
+        monkeypatch.setattr(time, "monotonic", lambda: clock[0])
+        cb.record_failure()
+        assert cb.allow_request() is False
+        clock[0] += 5
+        assert cb.allow_request() is True
+        assert cb.state == CircuitState.HALF_OPEN
+    
     def test_circuit_breaker_closes_on_success(self):
         """测试熔断器半开状态下成功后关闭"""
         cb = CircuitBreaker(
@@ -178,6 +213,49 @@ class TestCircuitBreaker:
         assert stats["failure_count"] == 0
         assert stats["failure_threshold"] == 5
 
+    
+    def test_circuit_breaker_open_to_half_open_once(self):
+        """测试超时后只有一个并发调用完成打开到半开的转换"""
+        cb = CircuitBreaker(name="test", failure_threshold=1, timeout_seconds=0.05)
+        cb.record_failure()
+        assert cb.get_stats()["state"] == "open"
+        time.sleep(0.1)
+        
+        results = []
+        original = cb._compare_and_set
+        
+        def tracking_cas(expected, new):
+            ok = original(expected, new)
+            results.append(ok)
+            return ok
+        
+        cb._compare_and_set = tracking_cas
+        threads = [threading.Thread(target=cb.allow_request) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        assert results.count(True) == 1
+        assert cb.state == CircuitState.HALF_OPEN
+        assert cb._compare_and_set(CircuitState.OPEN, CircuitState.HALF_OPEN) is False
+    
+    def test_circuit_breaker_concurrent_counting(self):
+        """测试并发记录失败时计数不丢失"""
+        cb = CircuitBreaker(name="test", failure_threshold=10_000)
+        
+        def fail():
+            for _ in range(500):
+                cb.record_failure()
+        
+        threads = [threading.Thread(target=fail) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        assert cb.get_stats()["failure_count"] == 4000
+        assert cb.state == CircuitState.CLOSED
 
 class TestServiceDiscovery:
     """服务发现测试"""
@@ -334,6 +412,125 @@ class TestServiceDiscovery:
         stats = registry.get_stats()
         assert stats["total_services"] == 1
         assert stats["total_instances"] == 1
+    
+    def test_sharded_registry(self):
+        """测试分片注册表的跨服务操作"""
+        registry = create_service_registry()
+        for i in range(40):
+            registry.register(ServiceInstance(
+                service_id=f"svc-{i}",
+                service_name=f"service-{i}",
+                host="localhost",
+                port=8000 + i,
+            ))
+        
+        # 同一实例 ID 不能注册到另一个服务下
+        assert registry.register(ServiceInstance(
+            service_id="svc-0",
+            service_name="other-service",
+            host="localhost",
+            port=9000,
+        )) is False
+        
+        assert sorted(registry.get_all_services()) == sorted(
+            f"service-{i}" for i in range(40)
+        )
+        assert registry.update_status("svc-7", "unhealthy") is True
+        assert registry.discover("service-7") == []
+        assert registry.deregister("svc-3") is True
+        assert registry.update_heartbeat("svc-3") is False
+        
+        stats = registry.get_stats()
+        assert stats["total_services"] == 40
+        assert stats["total_instances"] == 39
+        assert stats["services"]["service-7"]["healthy_count"] == 0
+    
+    def test_discover_cache(self, monkeypatch):
+        """测试发现结果缓存及其失效"""
+        registry = create_service_registry()
+        registry.register(ServiceInstance(
+            service_id="test-1",
+            service_name="test-service",
+            host="localhost",
+            port=8080,
+        ))
+        
+        lookups = []
+        shard_for = registry._shard_for
+        monkeypatch.setattr(
+            registry, "_shard_for", lambda name: lookups.append(name) or shard_for(name)
+        )
+        
+        first = registry.discover("test-service")
+        second = registry.discover("test-service")
+        assert first == second and first is not second
+        assert len(lookups) == 1
+        
+        # 注册表变更立即失效
+        registry.update_status("test-1", "unhealthy")
+        assert registry.discover("test-service") == []
+        info = registry.get_service_info("test-service")
+        assert info.healthy_instances == []
+        assert len(info.instances) == 1
+        
+        registry.update_status("test-1", "healthy")
+        assert [i.service_id for i in registry.discover("test-service")] == ["test-1"]
+    
+    def test_event_callback_can_query_registry(self):
+        """测试事件回调中可以再查询注册中心"""
+        registry = create_service_registry()
+        seen = []
+        registry.on_event(
+            lambda event, instance, *args: seen.append(
+                (event, len(registry.discover(instance.service_name)))
+            )
+        )
+        
+        registry.register(ServiceInstance(
+            service_id="test-1",
+            service_name="test-service",
+            host="localhost",
+            port=8080,
+        ))
+        registry.update_status("test-1", "unhealthy")
+        registry.deregister("test-1")
+        
+        assert seen == [("register", 1), ("status_change", 0), ("deregister", 0)]
+    
+    def test_concurrent_discover_with_writers(self):
+        """测试并发发现与注册互不干扰"""
+        registry = create_service_registry()
+        errors = []
+        
+        def writer(n):
+            for i in range(50):
+                sid = f"svc-{n}-{i}"
+                registry.register(ServiceInstance(
+                    service_id=sid,
+                    service_name="test-service",
+                    host="localhost",
+                    port=8080 + i,
+                ))
+                registry.deregister(sid)
+        
+        def reader():
+            try:
+                for _ in range(200):
+                    registry.discover("test-service")
+                    registry.get_stats()
+            except Exception as e:  # pragma: no cover
+                errors.append(e)
+        
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(2)]
+        threads += [threading.Thread(target=reader) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=10)
+        
+        assert not errors
+        assert not any(t.is_alive() for t in threads)
+        assert registry.discover("test-service") == []
 
 
 class TestLoadBalancing:
@@ -357,6 +554,35 @@ class TestLoadBalancing:
         ids = [i.service_id for i in selected]
         assert ids == ["test-0", "test-1", "test-2", "test-0"]
     
+    def test_round_robin_concurrent(self):
+        """测试并发轮询时每个实例被选中次数相同"""
+        lb = LoadBalancer(LoadBalancingStrategy.ROUND_ROBIN)
+        instances = [
+            ServiceInstance(
+                service_id=f"test-{i}",
+                service_name="test-service",
+                host=f"192.168.1.{i}",
+                port=8080,
+            )
+            for i in range(3)
+        ]
+        counts = {i.service_id: 0 for i in instances}
+        lock = threading.Lock()
+        
+        def worker():
+            for _ in range(300):
+                selected = lb.select(instances)
+                with lock:
+                    counts[selected.service_id] += 1
+        
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        assert counts == {"test-0": 400, "test-1": 400, "test-2": 400}
+    
     def test_random_selection(self):
         """测试随机选择"""
         lb = LoadBalancer(LoadBalancingStrategy.RANDOM)
@@ -410,6 +636,72 @@ class TestLoadBalancing:
         
         assert high_weight_count > 80  # 高权重应该被选中超过80%
     
+    def test_weighted_selection_cache(self, monkeypatch):
+        """测试加权选择复用累计权重并在权重变化时重建"""
+        import random
+        lb = LoadBalancer(LoadBalancingStrategy.WEIGHTED)
+        instances = [
+            ServiceInstance(
+                service_id=f"test-{i}",
+                service_name="test-service",
+                host="localhost",
+                port=8080 + i,
+                weight=w,
+            )
+            for i, w in enumerate((10, 0, 30))
+        ]
+        
+        picks = iter([1, 10, 11, 40])
+        monkeypatch.setattr(random, "randint", lambda a, b: next(picks))
+        assert [lb.select(instances).service_id for _ in range(4)] == [
+            "test-0", "test-0", "test-2", "test-2"
+        ]
+        cached = lb._cum_weights["test-service"]
+        assert cached[1] == [10, 10, 40]
+        
+        instances[1].weight = 20
+        monkeypatch.setattr(random, "randint", lambda a, b: 25)
+        assert lb.select(instances).service_id == "test-1"
+        assert lb._cum_weights["test-service"][2] == 60
+    
+    def test_weighted_selection_cache_by_registry_version(self, monkeypatch):
+        """测试按注册表版本号复用累计权重，权重或实例变更后重建"""
+        import random
+        from agent_os_kernel.core import service_mesh
+        registry = create_service_registry()
+        for i, w in enumerate((10, 30)):
+            registry.register(ServiceInstance(
+                service_id=f"test-{i}",
+                service_name="test-service",
+                host="localhost",
+                port=8080 + i,
+                weight=w,
+            ))
+        lb = LoadBalancer(LoadBalancingStrategy.WEIGHTED)
+        monkeypatch.setattr(random, "randint", lambda a, b: b)
+        
+        version = registry.version
+        assert lb.select(registry.discover("test-service"), version=version).service_id == "test-1"
+        assert lb._cum_weights["test-service"][1] == [10, 40]
+        
+        # 版本号不变时不再读取各实例权重
+        def fail(_):
+            raise AssertionError("weights rebuilt")
+        monkeypatch.setattr(service_mesh, "_weight", fail)
+        assert lb.select(registry.discover("test-service"), version=version).service_id == "test-1"
+        monkeypatch.undo()
+        monkeypatch.setattr(random, "randint", lambda a, b: b)
+        
+        assert registry.update_weight("test-1", 50)
+        assert not registry.update_weight("missing", 50)
+        assert registry.version != version
+        lb.select(registry.discover("test-service"), version=registry.version)
+        assert lb._cum_weights["test-service"][1] == [10, 60]
+        
+        registry.deregister("test-0")
+        lb.select(registry.discover("test-service"), version=registry.version)
+        assert lb._cum_weights["test-service"][1] == [50]
+    
     def test_least_connections_selection(self):
         """测试最少连接选择"""
         lb = LoadBalancer(LoadBalancingStrategy.LEAST_CONNECTIONS)
@@ -457,6 +749,66 @@ class TestLoadBalancing:
         selected1 = lb.select(instances, key="user:123")
         selected2 = lb.select(instances, key="user:123")
         assert selected1.service_id == selected2.service_id
+        
+        # 没有 key 时任选一个实例，不需要建环
+        lb = LoadBalancer(LoadBalancingStrategy.CONSISTENT_HASH)
+        assert lb.select(instances) in instances
+        assert not lb._hash_ring
+    
+    def test_consistent_hash_ring_cached_and_stable(self):
+        """测试哈希环缓存以及实例下线时的最小迁移"""
+        lb = LoadBalancer(LoadBalancingStrategy.CONSISTENT_HASH)
+        instances = [
+            ServiceInstance(
+                service_id=f"test-{i}",
+                service_name="test-service",
+                host="localhost",
+                port=8080 + i,
+            )
+            for i in range(4)
+        ]
+        keys = [f"user:{n}" for n in range(400)]
+        
+        before = {k: lb.select(instances, key=k).service_id for k in keys}
+        ring = lb._hash_ring["test-service"]
+        lb.select(instances, key="user:0")
+        assert lb._hash_ring["test-service"] is ring
+        
+        # 每个实例都应分到一部分 key
+        assert len(set(before.values())) == 4
+        
+        remaining = instances[:2] + instances[3:]
+        after = {k: lb.select(remaining, key=k).service_id for k in keys}
+        for k in keys:
+            if before[k] != "test-2":
+                assert after[k] == before[k]
+    
+    def test_jump_consistent_hash_selection(self):
+        """测试 Jump 一致性哈希：扩容时 key 只迁移到新实例"""
+        lb = create_load_balancer(
+            LoadBalancingStrategy.CONSISTENT_HASH,
+            hash_strategy=ConsistentHashStrategy.JUMP,
+        )
+        instances = [
+            ServiceInstance(
+                service_id=f"test-{i}",
+                service_name="test-service",
+                host="localhost",
+                port=8080 + i,
+            )
+            for i in range(5)
+        ]
+        keys = [f"user:{n}" for n in range(400)]
+        
+        before = {k: lb.select(instances[:4], key=k).service_id for k in keys}
+        assert len(set(before.values())) == 4
+        assert lb.select(instances[:4], key="user:1") is lb.select(instances[:4], key="user:1")
+        
+        after = {k: lb.select(instances, key=k).service_id for k in keys}
+        for k in keys:
+            assert after[k] in (before[k], "test-4")
+        assert "test-4" in after.values()
+        assert not lb._hash_ring
     
     def test_select_returns_none_for_empty_instances(self):
         """测试空实例列表返回 None"""
@@ -501,6 +853,20 @@ class TestServiceCommunication:
         assert result["status_code"] == 200
         assert result["instance"] == "test-1"
     
+    def test_service_client_starts_no_threads(self):
+        """测试创建客户端不会启动线程"""
+        before = threading.active_count()
+        clients = [ServiceClient() for _ in range(20)]
+        for client in clients:
+            client.registry.register(ServiceInstance(
+                service_id="test-1",
+                service_name="test-service",
+                host="localhost",
+                port=8080,
+            ))
+            client.call("test-service")
+        assert threading.active_count() == before
+    
     def test_service_client_call_not_found(self):
         """测试服务未找到"""
         registry = create_service_registry()
@@ -559,11 +925,39 @@ class TestServiceCommunication:
             port=8080,
         ))
         
-        client = ServiceClient(registry=registry)
+        client = ServiceClient(
+            registry=registry,
+            load_balancer=LoadBalancer(LoadBalancingStrategy.LEAST_CONNECTIONS),
+        )
         stats = client.get_stats()
         
         assert "registry_stats" in stats
         assert stats["registry_stats"]["total_services"] == 1
+        assert stats["load_balancer_strategy"] == "least_connections"
+    
+    def test_registry_stats_track_changes(self):
+        """测试注册中心统计随变更更新且返回独立副本"""
+        registry = create_service_registry()
+        registry.register(ServiceInstance(
+            service_id="test-1",
+            service_name="test-service",
+            host="localhost",
+            port=8080,
+        ))
+        
+        stats = registry.get_stats()
+        stats["services"]["test-service"]["healthy_count"] = 99
+        assert registry.get_stats()["services"]["test-service"]["healthy_count"] == 1
+        
+        registry.update_status("test-1", "unhealthy")
+        assert registry.get_stats()["services"]["test-service"]["healthy_count"] == 0
+        registry.register(ServiceInstance(
+            service_id="test-2",
+            service_name="test-service",
+            host="localhost",
+            port=8081,
+        ))
+        assert registry.get_stats()["total_instances"] == 2
 
 
 class TestServiceMesh:
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for State Management - 状态管理测试
+"""
+
+import pytest
+from agent_os_kernel.core.state import (
+    AgentState,
+    StateManager,
+    create_state_manager,
+)
+
+
+class _DeltaStorage:
+    """支持增量追加的内存存储：写完整检查点时丢弃该 Agent 已存的增量"""
+    
+    def __init__(self):
+        self.checkpoints = {}
+        self.deltas = {}
+    
+    async def save_agent_state(self, agent_id, checkpoint):
+        self.checkpoints[agent_id] = checkpoint
+        self.deltas[agent_id] = []
+    
+    async def append_transition(self, agent_id, transition):
+        self.deltas[agent_id].append(transition)
+
+
+class TestStateManager:
+    """状态管理器测试"""
+    
+    async def test_create_and_transition(self):
+        """测试创建与状态转换"""
+        manager = create_state_manager()
+        record = await manager.create_agent("agent-1")
+        assert record.current_state == AgentState.CREATED
+        assert record.updated_at == record.created_at
+        
+        assert await manager.transition("agent-1", AgentState.RUNNING, "start")
+        assert record.current_state == AgentState.RUNNING
+        assert record.updated_at == record.transitions[-1].timestamp
+        assert record.updated_at >= record.created_at
+        
+        assert not await manager.transition("missing", AgentState.RUNNING)
+    
+    async def test_checkpoint_restore_keeps_updated_at(self):
+        """测试检查点恢复保留更新时间"""
+        manager = StateManager()
+        await manager.create_agent("agent-1", metadata={"role": "worker"})
+        await manager.transition("agent-1", AgentState.RUNNING, "start")
+        await manager.transition("agent-1", AgentState.COMPLETED, "done")
+        checkpoint = await manager.checkpoint("agent-1")
+        
+        restored = StateManager()
+        assert await restored.restore(checkpoint)
+        record = await restored.get_state("agent-1")
+        assert record.current_state == AgentState.COMPLETED
+        assert record.updated_at.isoformat() == checkpoint["updated_at"]
+        assert [t.to_state for t in record.transitions] == [
+            AgentState.RUNNING, AgentState.COMPLETED
+        ]
+        assert record.metadata == {"role": "worker"}
+    
+    async def test_agents_do_not_block_each_other(self):
+        """测试不同 Agent 的状态保存互不阻塞"""
+        import asyncio
+        
+        class SlowStorage:
+            def __init__(self):
+                self.saved = []
+                self.release = asyncio.Event()
+            
+            async def save_agent_state(self, agent_id, checkpoint):
+                if agent_id == "slow" and checkpoint["state"] == "running":
+                    await self.release.wait()
+                self.saved.append((agent_id, checkpoint["state"]))
+        
+        storage = SlowStorage()
+        manager = StateManager(storage)
+        await manager.create_agent("slow")
+        await manager.create_agent("fast")
+        
+        slow = asyncio.create_task(manager.transition("slow", AgentState.RUNNING))
+        await asyncio.sleep(0)
+        assert await asyncio.wait_for(
+            manager.transition("fast", AgentState.RUNNING), timeout=1
+        )
+        assert ("fast", "running") in storage.saved
+        assert not slow.done()
+        
+        storage.release.set()
+        assert await slow
+        assert storage.saved[-1] == ("slow", "running")
+    
+    async def test_transition_history_is_bounded(self, monkeypatch):
+        """测试转换历史有上限且按时间顺序返回最近记录"""
+        from agent_os_kernel.core import state
+        
+        monkeypatch.setattr(state, "MAX_TRANSITIONS", 5)
+        manager = StateManager()
+        await manager.create_agent("agent-1")
+        for i in range(8):
+            target = AgentState.RUNNING if i % 2 == 0 else AgentState.WAITING
+            await manager.transition("agent-1", target, reason=str(i))
+        
+        history = await manager.get_transitions("agent-1")
+        assert [t.reason for t in history] == ["3", "4", "5", "6", "7"]
+        recent = await manager.get_transitions("agent-1", limit=2)
+        assert [t.reason for t in recent] == ["6", "7"]
+        assert manager.get_stats()["total_transitions"] == 5
+    
+    async def test_incremental_persistence(self, monkeypatch):
+        """测试增量持久化与回放恢复"""
+        from agent_os_kernel.core import state
+        
+        monkeypatch.setattr(state, "CHECKPOINT_INTERVAL", 3)
+        storage = _DeltaStorage()
+        manager = StateManager(storage)
+        await manager.create_agent("agent-1")
+        await manager.transition("agent-1", AgentState.RUNNING, "start")
+        await manager.transition("agent-1", AgentState.WAITING, "input")
+        assert storage.checkpoints["agent-1"]["state"] == "created"
+        assert [d["to"] for d in storage.deltas["agent-1"]] == ["running", "waiting"]
+        
+        # 达到间隔时写完整检查点并清空增量
+        await manager.transition("agent-1", AgentState.RUNNING, "resume")
+        assert storage.checkpoints["agent-1"]["state"] == "running"
+        assert storage.deltas["agent-1"] == []
+        
+        await manager.transition("agent-1", AgentState.COMPLETED, "done")
+        restored = StateManager()
+        assert await restored.restore(
+            storage.checkpoints["agent-1"], storage.deltas["agent-1"]
+        )
+        original = await manager.get_state("agent-1")
+        record = await restored.get_state("agent-1")
+        assert record.current_state == AgentState.COMPLETED
+        assert record.updated_at == original.updated_at
+        assert len(record.transitions) == 4
+    
+    async def test_checkpoint_after_deltas_not_replayed_twice(self, monkeypatch):
+        """测试增量之后写入完整检查点，恢复时不重复回放已并入检查点的增量"""
+        from agent_os_kernel.core import state
+        
+        monkeypatch.setattr(state, "CHECKPOINT_INTERVAL", 3)
+        storage = _DeltaStorage()
+        manager = StateManager(storage)
+        await manager.create_agent("agent-1")
+        await manager.transition("agent-1", AgentState.RUNNING, "start")
+        await manager.transition("agent-1", AgentState.WAITING, "input")
+        await manager.transition("agent-1", AgentState.RUNNING, "resume")
+        
+        # 第三次转换写完整检查点，之前的增量已并入其中
+        assert len(storage.checkpoints["agent-1"]["transitions"]) == 3
+        assert storage.deltas["agent-1"] == []
+        
+        restored = StateManager()
+        assert await restored.restore(
+            storage.checkpoints["agent-1"], storage.deltas["agent-1"]
+        )
+        record = await restored.get_state("agent-1")
+        assert record.current_state == AgentState.RUNNING
+        assert [t.reason for t in record.transitions] == ["start", "input", "resume"]
+    
+    async def test_restore_counts_replayed_deltas(self, monkeypatch):
+        """测试恢复时计入回放的增量，完整检查点不会推迟写入"""
+        from agent_os_kernel.core import state
+        
+        monkeypatch.setattr(state, "CHECKPOINT_INTERVAL", 3)
+        storage = _DeltaStorage()
+        manager = StateManager(storage)
+        await manager.create_agent("agent-1")
+        await manager.transition("agent-1", AgentState.RUNNING, "start")
+        await manager.transition("agent-1", AgentState.WAITING, "input")
+        assert len(storage.deltas["agent-1"]) == 2
+        
+        restored = StateManager(storage)
+        assert await restored.restore(
+            storage.checkpoints["agent-1"], storage.deltas["agent-1"]
+        )
+        await restored.transition("agent-1", AgentState.RUNNING, "resume")
+        assert storage.checkpoints["agent-1"]["state"] == "running"
+        assert storage.deltas["agent-1"] == []
+    
+    async def test_records_have_slots(self):
+        """测试状态记录使用 __slots__（Python 3.10+）"""
+        import sys
+        if sys.version_info < (3, 10):
+            pytest.skip("dataclass slots requires Python 3.10+")
+        manager = StateManager()
+        record = await manager.create_agent("agent-1")
+        await manager.transition("agent-1", AgentState.RUNNING)
+        assert not hasattr(record, "__dict__")
+        assert not hasattr(record.transitions[0], "__dict__")
@@ -8,6 +8,9 @@ from agent_os_kernel.core.state_machine import (
     StateMachine,
     HierarchicalStateMachine,
     ParallelStateMachine,
+    StateMachineSchema,
+    Transition,
+    StateCallbacks,
     TransitionType,
     state_machine
 )
@@ -102,7 +105,7 @@ class TestStateMachine:
         sm.add_transition("idle", "running", "start")
         
         # 添加 on_exit 回调
-        sm._callbacks["idle"].on_exit = on_exit_idle
+        sm._on_exit["idle"] = on_exit_idle
         
         # 触发转换
         sm.trigger_event("start")
@@ -229,6 +232,309 @@ class TestStateMachine:
         assert not sm.can_transition("finish")
         assert not sm.can_transition("invalid")
 
+    
+    def test_transition_index(self):
+        """测试按事件索引的转换查找"""
+        sm = StateMachine(initial_state="idle")
+        for i in range(50):
+            sm.add_transition("idle", f"s{i}", f"e{i}")
+        sm.add_transition("idle", "fallback", "e7")
+        
+        assert len(sm.get_transitions("idle")) == 51
+        assert sm.get_possible_events() == [f"e{i}" for i in range(50)]
+        assert sm.can_transition("e49")
+        assert sm.trigger_event("e7")
+        assert sm.current_state == "s7"
+        assert sm.get_transitions("missing") == []
+    
+    def test_single_lock_acquire_per_operation(self):
+        """测试每个公开操作只获取一次锁"""
+        import threading
+        
+        class CountingLock:
+            def __init__(self):
+                self.enters = 0
+                self._lock = threading.RLock()
+            
+            def __enter__(self):
+                self.enters += 1
+                return self._lock.__enter__()
+            
+            def __exit__(self, *exc):
+                return self._lock.__exit__(*exc)
+        
+        sm = StateMachine(initial_state="idle")
+        lock = sm._lock = CountingLock()
+        
+        sm.add_transition("idle", "running", "start")
+        assert lock.enters == 1
+        assert sm.has_state("running")
+        
+        sm.trigger_event("start")
+        sm.reset()
+        assert lock.enters == 3
+        assert sm.current_state == "idle"
+    
+    def test_concurrent_queries_during_construction(self):
+        """测试添加转换时并发查询不会出错"""
+        import threading
+        
+        sm = StateMachine(initial_state="idle")
+        errors = []
+        done = threading.Event()
+        
+        def reader():
+            try:
+                while not done.is_set():
+                    sm.get_possible_events()
+                    sm.can_transition("e1")
+            except Exception as e:  # pragma: no cover
+                errors.append(e)
+        
+        readers = [threading.Thread(target=reader) for _ in range(3)]
+        for t in readers:
+            t.start()
+        for i in range(2000):
+            sm.add_transition("idle", f"s{i}", f"e{i}")
+        done.set()
+        for t in readers:
+            t.join()
+        
+        assert not errors
+        assert len(sm.get_possible_events()) == 2000
+    
+    def test_compile(self):
+        """测试预编译分发表"""
+        calls = []
+        sm = StateMachine(initial_state="idle")
+        sm.add_state("idle", on_exit=lambda: calls.append("exit_idle"))
+        sm.add_state("running", on_enter=lambda: calls.append("enter_running"))
+        sm.add_transition("idle", "running", "start", guard=lambda: False)
+        sm.add_transition("idle", "running", "start", action=lambda d: calls.append(d))
+        sm.add_transition("running", "idle", "stop")
+        
+        sm.compile()
+        assert sm.is_compiled
+        
+        assert sm.trigger_event("start", "data")
+        assert calls == ["exit_idle", "data", "enter_running"]
+        assert sm.current_state == "running"
+        assert sm.previous_state == "idle"
+        assert not sm.trigger_event("unknown")
+        
+        # 配置变化后分发表失效，回退到解释执行
+        sm.add_transition("idle", "done", "finish")
+        assert not sm.is_compiled
+        assert sm.trigger_event("stop")
+        assert sm.trigger_event("finish")
+        assert sm.current_state == "done"
+    
+    def test_shared_guard_evaluated_once(self):
+        """测试同一次分发中共用的守卫只调用一次"""
+        calls = []
+        
+        def guard():
+            calls.append(1)
+            return False
+        
+        sm = StateMachine(initial_state="idle")
+        sm.add_transition("idle", "a", "go", guard=guard)
+        sm.add_transition("idle", "b", "go", guard=guard)
+        sm.add_transition("idle", "c", "other", guard=guard)
+        
+        assert not sm.trigger_event("go")
+        assert len(calls) == 1
+        
+        calls.clear()
+        assert sm.get_possible_events() == []
+        assert len(calls) == 1
+        
+        calls.clear()
+        sm.compile()
+        assert not sm.trigger_event("go")
+        assert len(calls) == 1
+    
+    def test_callback_tables(self):
+        """测试回调分表存放及 update 传入时间增量"""
+        updates = []
+        sm = StateMachine(initial_state="idle")
+        sm.add_state("idle", on_update=updates.append)
+        sm.add_state("running")
+        
+        assert "running" not in sm._on_enter
+        assert sm.get_callbacks("idle").on_update == updates.append
+        assert sm.get_callbacks("missing") is None
+        
+        sm.start()
+        sm.update(0.5)
+        assert updates == [0.5]
+        
+        # 重新添加状态会替换原有回调
+        sm.add_state("idle")
+        assert "idle" not in sm._on_update
+    
+    def test_names_interned(self):
+        """测试状态名和事件名在注册时驻留"""
+        import sys
+        
+        sm = StateMachine(initial_state="".join(["id", "le"]))
+        sm.add_transition("".join(["id", "le"]), "".join(["run", "ning"]), "".join(["st", "art"]))
+        
+        assert sm.current_state is sys.intern("idle")
+        assert "start" in sm._transitions["idle"]
+        for event in sm._transitions["idle"]:
+            assert event is sys.intern(event)
+        
+        assert sm.trigger_event("".join(["st", "art"]))
+        assert sm.current_state is sys.intern("running")
+    
+    def test_fast_path_transition(self):
+        """测试无守卫无动作的转换走快速路径"""
+        calls = []
+        sm = StateMachine(initial_state="idle")
+        sm.add_state("idle", on_exit=lambda: calls.append("exit"))
+        sm.add_state("running", on_enter=lambda: calls.append("enter"))
+        sm.add_transition("idle", "running", "start")
+        sm.add_transition("running", "idle", "stop", guard=lambda: True)
+        
+        assert sm.get_transitions("idle")[0]._fast
+        assert not sm.get_transitions("running")[0]._fast
+        
+        def fail_guard_check(guard, cache):
+            raise AssertionError("快速路径不应检查守卫")
+        
+        sm._check_guard = fail_guard_check
+        assert sm.trigger_event("start")
+        assert calls == ["exit", "enter"]
+        assert sm.previous_state == "idle"
+        assert sm.current_state == "running"
+    
+    def test_readd_state_keeps_transitions(self):
+        """测试重复添加状态保留已有转换"""
+        sm = StateMachine(initial_state="idle")
+        sm.add_transition("idle", "running", "start")
+        sm.add_state("idle", on_enter=lambda: None)
+        
+        assert sm.states == {"idle", "running"}
+        assert sm.has_state("running")
+        assert sm.trigger_event("start")
+    
+    def test_event_queue(self):
+        """测试事件队列按先进先出处理"""
+        sm = StateMachine(initial_state="idle")
+        sm.add_transition("idle", "running", "start")
+        sm.add_transition("running", "done", "finish",
+                          action=lambda d: sm.enqueue_event("restart"))
+        sm.add_transition("done", "idle", "restart")
+        
+        sm.enqueue_event("start")
+        sm.enqueue_event("unknown")
+        sm.enqueue_event("finish")
+        
+        # 动作中入队的 restart 也在本次处理
+        assert sm.process_queue() == 3
+        assert sm.current_state == "idle"
+        assert sm.process_queue() == 0
+    
+    def test_add_transitions_single_lock(self):
+        """测试批量添加转换只加锁一次"""
+        sm = StateMachine(initial_state="idle")
+        
+        class CountingLock:
+            def __init__(self, lock):
+                self.lock = lock
+                self.acquired = 0
+            
+            def __enter__(self):
+                self.acquired += 1
+                return self.lock.__enter__()
+            
+            def __exit__(self, *exc):
+                return self.lock.__exit__(*exc)
+        
+        sm._lock = CountingLock(sm._lock)
+        sm.add_transitions([
+            {"from_state": "idle", "to_state": "a", "event": "go"},
+            {"from_state": "idle", "to_state": "b", "event": "go", "guard": lambda: False},
+            {"from_state": "a", "to_state": "idle", "event": "back"},
+        ])
+        
+        assert sm._lock.acquired == 1
+        assert [t.to_state for t in sm.get_transitions("idle")] == ["a", "b"]
+        assert sm.trigger_event("go")
+        assert sm.current_state == "a"
+    
+    def test_records_have_slots(self):
+        """测试转换和回调记录使用 __slots__（Python 3.10+）"""
+        import sys
+        if sys.version_info < (3, 10):
+            pytest.skip("dataclass slots requires Python 3.10+")
+        transition = Transition(from_state="idle", to_state="running", event="start")
+        assert not hasattr(transition, "__dict__")
+        assert transition._fast
+        assert not hasattr(StateCallbacks(), "__dict__")
+    
+    def test_shared_schema(self):
+        """测试多个实例共享拓扑，修改时写时复制"""
+        entered = []
+        template = StateMachine(initial_state="idle")
+        template.add_state("running", on_enter=lambda: entered.append("running"))
+        template.add_transition("idle", "running", "start")
+        schema = template.export_schema()
+        
+        assert isinstance(schema, StateMachineSchema)
+        assert schema.states == {"idle", "running"}
+        
+        a = StateMachine("idle", schema=schema)
+        b = StateMachine("idle", schema=schema)
+        assert a._transitions is b._transitions
+        
+        assert a.trigger_event("start")
+        assert a.current_state == "running"
+        assert b.current_state == "idle"
+        assert entered == ["running"]
+        
+        # 修改拓扑只影响自身
+        b.add_transition("idle", "done", "finish")
+        assert b.can_transition("finish")
+        assert not template.can_transition("finish")
+        assert "done" not in schema.states
+        assert a._transitions is schema.transitions
+        
+        template.add_state("extra")
+        assert "extra" not in schema.states
+    
+    def test_states_view_cached(self):
+        """测试 states 返回缓存的只读集合"""
+        sm = StateMachine(initial_state="idle")
+        sm.add_state("running")
+        
+        states = sm.states
+        assert isinstance(states, frozenset)
+        assert sm.states is states
+        
+        sm.add_state("running", on_enter=lambda: None)
+        assert sm.states is states
+        
+        sm.add_transition("running", "done", "finish")
+        assert sm.states == {"idle", "running", "done"}
+        assert sm.states is not states
+    
+    def test_single_producer_without_lock(self):
+        """测试单生产者模式不创建线程锁"""
+        import threading
+        
+        sm = StateMachine(initial_state="idle", single_producer=True)
+        assert not isinstance(sm._lock, type(threading.RLock()))
+        
+        # 回调中再次触发事件仍然可用
+        sm.add_state("running", on_enter=lambda: sm.trigger_event("finish"))
+        sm.add_transition("idle", "running", "start")
+        sm.add_transition("running", "done", "finish")
+        
+        assert sm.trigger_event("start")
+        assert sm.current_state == "done"
+        assert ParallelStateMachine(["a"], single_producer=True).current_states == {"a"}
 
 class TestHierarchicalStateMachine:
     """层级状态机测试"""
@@ -259,6 +565,29 @@ class TestParallelStateMachine:
         assert "state1" in sm.current_states
         assert "state2" in sm.current_states
         assert "state3" not in sm.current_states
+    
+    def test_parallel_transitions_applied_after_scan(self):
+        """测试并行转换在扫描结束后统一生效"""
+        sm = ParallelStateMachine(initial_states=["a", "b"])
+        sm.add_transition("a", "b", "step")
+        sm.add_transition("b", "c", "step")
+        
+        assert sm.trigger_event("step")
+        # a->b 与 b->c 基于同一组活动状态判定
+        assert sm.current_states == {"b", "c"}
+        assert not sm.trigger_event("unknown")
+    
+    def test_reentrant_event_from_callback(self):
+        """测试回调中重入触发的事件在当前事件生效后处理"""
+        sm = ParallelStateMachine(initial_states=["a", "x", "z"])
+        sm.add_state("b", on_enter=lambda: sm.trigger_event("go2"))
+        sm.add_state("q")
+        sm.add_transition("a", "b", "go1")
+        sm.add_transition("x", "q", "go2")
+        sm.add_transition("z", "q", "go2")
+        
+        assert sm.trigger_event("go1")
+        assert sm.current_states == {"b", "q"}
 
 
 class TestStateMachineDecorator:
@@ -291,6 +620,29 @@ class TestStateMachineDecorator:
         assert "running" in obj.entered
         assert "idle" in obj.exited
 
+    
+    def test_decorator_discovers_callbacks(self):
+        """测试装饰器按状态归类发现的回调"""
+        @state_machine("idle")
+        class MyMachine:
+            def on_enter_running(self):
+                pass
+            
+            def on_exit_running(self):
+                pass
+            
+            def on_exit_idle(self):
+                pass
+            
+            on_enter_ignored = "not callable"
+        
+        sm = MyMachine._state_machine
+        
+        running = sm.get_callbacks("running")
+        assert running.on_enter is MyMachine.on_enter_running
+        assert running.on_exit is MyMachine.on_exit_running
+        assert sm.get_callbacks("idle").on_exit is MyMachine.on_exit_idle
+        assert not sm.has_state("ignored")
 
 class TestEdgeCases:
     """边界情况测试"""
@@ -1,7 +1,29 @@
 """测试存储"""
 
+import hashlib
+import os
+import queue
+import re
+import struct
+import sys
+import threading
+import time
+import types
+
 import pytest
-from agent_os_kernel.core.storage import StorageManager
+from agent_os_kernel.core.exceptions import StorageOperationError
+from agent_os_kernel.core.types import StorageBackend
+from agent_os_kernel.core.storage import (
+    StorageManager,
+    MemoryStorage,
+    FileStorage,
+    EvictionPolicy,
+    VectorStorage,
+    PostgreSQLStorage,
+    PG_STREAM_ITERSIZE,
+    _PG_PREPARED_STATEMENTS,
+    _pg_copy_field,
+)
 
 
 class TestStorageManager:
@@ -42,3 +64,745 @@ class TestStorageManager:
         storage.clear()
         assert storage.exists("key1") is False
         assert storage.exists("key2") is False
+    
+    def test_list_checkpoints_by_agent(self):
+        """测试按 agent_pid 列出检查点"""
+        storage = StorageManager()
+        storage.save_checkpoint({"checkpoint_id": "cp1", "agent_pid": "a"})
+        storage.save_checkpoint({"checkpoint_id": "cp2", "agent_pid": "b"})
+        storage.save_checkpoint({"checkpoint_id": "cp3", "agent_pid": "a"})
+        
+        assert [cp["checkpoint_id"] for cp in storage.list_checkpoints("a")] == ["cp1", "cp3"]
+        assert len(storage.list_checkpoints()) == 3
+        
+        # 检查点转移到其他 agent 后索引随之更新
+        storage.save_checkpoint({"checkpoint_id": "cp1", "agent_pid": "b"})
+        assert [cp["checkpoint_id"] for cp in storage.list_checkpoints("a")] == ["cp3"]
+        assert [cp["checkpoint_id"] for cp in storage.list_checkpoints("b")] == ["cp2", "cp1"]
+    
+    def test_vector_content_visible_through_data_api(self):
+        """测试内存后端的向量内容可通过通用接口读取，且不重复存储"""
+        storage = StorageManager()
+        storage.save("plain", {"data": 1})
+        storage.save_vector("vec", "hello", struct.pack("2f", 1, 0), {"tag": "t"})
+        
+        assert storage.retrieve("vec") == {"content": "hello", "metadata": {"tag": "t"}}
+        assert storage.exists("vec")
+        assert storage.list_keys() == ["plain", "vec"]
+        assert storage._data.retrieve("vec") is None
+        
+        storage.delete("vec")
+        assert storage.retrieve("vec") is None
+        assert not storage.exists("vec")
+    
+    def test_clear_removes_vectors(self):
+        """测试清空存储时一并清空向量"""
+        storage = StorageManager()
+        storage.save_vector("vec", "hello", struct.pack("2f", 1, 0))
+        storage.clear()
+        
+        assert storage.retrieve("vec") is None
+        assert storage.exists("vec") is False
+        assert storage.list_keys() == []
+    
+    def test_save_and_save_vector_same_key(self):
+        """测试同一键交替写入数据和向量时读取最新一次写入"""
+        storage = StorageManager()
+        storage.save("k2", {"data": 1})
+        storage.save_vector("k2", "hello", struct.pack("2f", 1, 0))
+        assert storage.retrieve("k2") == {"content": "hello", "metadata": {}}
+        assert storage.list_keys() == ["k2"]
+        
+        storage.save("k2", {"data": 2})
+        assert storage.retrieve("k2") == {"data": 2}
+        assert storage.list_keys() == ["k2"]
+    
+    def test_postgresql_methods_bound_at_construction(self):
+        """测试 PostgreSQL 后端的检查点和审计方法在构造时直接绑定"""
+        try:
+            import psycopg2  # noqa: F401
+            pytest.skip("需要在未安装 psycopg2 的环境中构造离线实例")
+        except ImportError:
+            pass
+        storage = StorageManager(backend=StorageBackend.POSTGRESQL)
+        assert storage.log_audit == storage._data.save_audit_log
+        assert storage.list_checkpoints == storage._data.list_checkpoints
+        # 连接池不可用，写入直接失败，不会落入内存存储
+        assert storage.save_checkpoint({"checkpoint_id": "cp", "agent_pid": "a"}) is False
+        assert storage._checkpoint.list_keys() == []
+        
+        assert "log_audit" not in vars(StorageManager())
+    
+    def test_log_action(self):
+        """测试 log_action 写入审计日志"""
+        storage = StorageManager()
+        assert storage.log_action("a", "reasoning", {"n": 1}, {"ok": True}, "why")
+        
+        log, = storage.get_audit_logs("a")
+        assert log["action"] == "reasoning"
+        assert log["details"] == {"input": {"n": 1}, "output": {"ok": True}, "reasoning": "why"}
+    
+    def test_pg_copy_field_escaping(self):
+        """测试 COPY 文本格式字段转义"""
+        assert _pg_copy_field(None) == "\\N"
+        assert _pg_copy_field(1.5) == "1.5"
+        assert _pg_copy_field("a\tb\nc\\d\r") == "a\\tb\\nc\\\\d\\r"
+    
+    def test_transaction_without_postgresql(self):
+        """测试非 PostgreSQL 后端的 transaction 为空上下文"""
+        storage = StorageManager()
+        with storage.transaction():
+            storage.save("tx", 1)
+            storage.log_audit({"agent_pid": "a", "action": "run"})
+        assert storage.retrieve("tx") == 1
+        assert len(storage.get_audit_logs("a")) == 1
+    
+    def test_audit_logs_limit_after_filter(self):
+        """测试 limit 作用于过滤后的审计日志"""
+        storage = StorageManager()
+        for i in range(5):
+            storage.log_audit({"agent_pid": "a", "action": "run", "seq": i})
+            storage.log_audit({"agent_pid": "b", "action": "run", "seq": i})
+        
+        assert [log["seq"] for log in storage.get_audit_logs("a", limit=3)] == [2, 3, 4]
+        assert len(storage.get_audit_logs(limit=4)) == 4
+        assert len(storage.get_audit_logs()) == 10
+        assert storage.get_audit_logs("missing") == []
+        assert [log["seq"] for log in storage.iter_audit_logs("b")] == [0, 1, 2, 3, 4]
+        assert len(list(storage.iter_audit_logs())) == 10
+
+
+class TestMemoryStorage:
+    """测试内存存储后端"""
+    
+    def test_save_does_not_pickle(self, monkeypatch):
+        """测试默认写入不做序列化，按类型估算大小"""
+        import pickle
+        
+        def fail_dumps(*args, **kwargs):
+            raise AssertionError("不应序列化")
+        
+        monkeypatch.setattr(pickle, "dumps", fail_dumps)
+        storage = MemoryStorage()
+        assert storage.save("blob", b"x" * 1000)
+        assert storage.save("text", "abc")
+        assert storage.get_stats().total_size_bytes == 1003
+    
+    def test_overwrite_size_accounting(self):
+        """测试覆盖写入时累计大小扣除旧值"""
+        storage = MemoryStorage()
+        storage.save("key", b"x" * 100)
+        storage.save("key", b"x" * 10)
+        assert storage.get_stats().total_size_bytes == 10
+        storage.delete("key")
+        assert storage.get_stats().total_size_bytes == 0
+    
+    def test_exact_sizing(self):
+        """测试精确大小统计使用序列化长度"""
+        import pickle
+        
+        storage = MemoryStorage(exact_sizing=True)
+        value = {"data": [1, 2, 3]}
+        storage.save("key", value)
+        assert storage.get_stats().total_size_bytes == len(pickle.dumps(value))
+    
+    def test_sharded_keys_keep_insertion_order(self):
+        """测试分片后 list_keys 仍按首次写入顺序返回"""
+        storage = MemoryStorage()
+        keys = [f"key{i}" for i in range(50)]
+        for key in keys:
+            storage.save(key, {"v": key})
+        storage.save("key0", {"v": "updated"})
+        
+        assert len({id(storage._shard_for(k)) for k in keys}) > 1
+        assert storage.list_keys() == keys
+        assert storage.list_keys("key1") == ["key1"] + [f"key{i}" for i in range(10, 20)]
+        assert storage.retrieve("key0") == {"v": "updated"}
+    
+    def test_hit_miss_counters(self):
+        """测试并发读取时命中/未命中计数准确"""
+        import threading
+        
+        storage = MemoryStorage()
+        storage.save("key", None)
+        
+        def reader():
+            for _ in range(1000):
+                storage.retrieve("key")
+                storage.retrieve("missing")
+        
+        threads = [threading.Thread(target=reader) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        stats = storage.get_stats()
+        assert stats.hit_count == 4000
+        assert stats.miss_count == 4000
+        assert storage.get_stats().hit_count == 4000
+        assert storage.exists("key")
+
+    
+    def test_lru_eviction(self):
+        """测试按最近最少使用淘汰"""
+        storage = MemoryStorage(max_entries=3)
+        for key in ("a", "b", "c"):
+            storage.save(key, 1)
+        storage.retrieve("a")
+        storage.save("d", 1)
+        
+        assert storage.list_keys() == ["a", "c", "d"]
+        assert storage.evictions == 1
+        assert storage.get_stats().total_keys == 3
+    
+    def test_fifo_and_lfu_eviction(self):
+        """测试先进先出与最不经常使用淘汰"""
+        fifo = MemoryStorage(max_entries=2, policy=EvictionPolicy.FIFO)
+        fifo.save("a", 1)
+        fifo.save("b", 1)
+        fifo.retrieve("a")
+        fifo.save("c", 1)
+        assert fifo.list_keys() == ["b", "c"]
+        
+        lfu = MemoryStorage(max_entries=2, policy=EvictionPolicy.LFU)
+        lfu.save("a", 1)
+        lfu.save("b", 1)
+        lfu.retrieve("a")
+        lfu.save("c", 1)
+        assert lfu.list_keys() == ["a", "c"]
+    
+    def test_max_bytes_eviction(self):
+        """测试按总大小淘汰，统计不扫描全部键"""
+        storage = MemoryStorage(max_bytes=25)
+        storage.save("a", b"x" * 10)
+        storage.save("b", b"x" * 10)
+        storage.save("c", b"x" * 10)
+        
+        assert not storage.exists("a")
+        assert storage.get_stats().total_size_bytes == 20
+        storage.save("big", b"x" * 100)
+        assert storage.list_keys() == ["big"]
+    
+    def test_max_bytes_counts_nested_values(self):
+        """测试按总大小淘汰时计入 dict/list 内部元素的大小"""
+        storage = MemoryStorage(max_bytes=3000)
+        storage.save("a", {"payload": "x" * 1000, "items": [b"y" * 500]})
+        assert storage.get_stats().total_size_bytes > 1500
+        
+        storage.save("b", {"payload": "x" * 1000, "items": [b"y" * 500]})
+        assert not storage.exists("a")
+        assert storage.list_keys() == ["b"]
+
+class TestFileStorage:
+    """测试文件存储后端"""
+    
+    def test_save_retrieve_delete(self, tmp_path):
+        """测试文件读写"""
+        storage = FileStorage(str(tmp_path))
+        assert storage.save("key", {"data": "value"})
+        assert storage.exists("key")
+        assert storage.retrieve("key") == {"data": "value"}
+        assert storage.delete("key")
+        assert not storage.exists("key")
+        assert storage.retrieve("key") is None
+    
+    def test_no_makedirs_on_hot_path(self, tmp_path, monkeypatch):
+        """测试子目录在初始化时创建，读写不再调用 makedirs"""
+        import os
+        
+        storage = FileStorage(str(tmp_path))
+        assert len(os.listdir(tmp_path)) == 256
+        
+        def fail_makedirs(*args, **kwargs):
+            raise AssertionError("读写路径不应创建目录")
+        
+        monkeypatch.setattr(os, "makedirs", fail_makedirs)
+        assert storage.save("key", [1, 2, 3])
+        assert storage.retrieve("key") == [1, 2, 3]
+        assert storage._get_path("key") is storage._get_path("key")
+    
+    def test_clear_recreates_subdirs(self, tmp_path):
+        """测试清空后仍可继续写入"""
+        storage = FileStorage(str(tmp_path / "data"))
+        storage.save("key", 1)
+        assert storage.clear()
+        assert not storage.exists("key")
+        assert storage.save("key", 2)
+        assert storage.retrieve("key") == 2
+    
+    def test_batch_save_retrieve(self, tmp_path):
+        """测试批量读写"""
+        storage = FileStorage(str(tmp_path))
+        items = {f"key{i}": {"i": i} for i in range(10)}
+        
+        assert storage.save_many(items) == 10
+        assert storage.retrieve_many(list(items) + ["missing"]) == items
+        assert storage._stats.hit_count == 10
+        assert storage._stats.miss_count == 1
+    
+    def test_compact_and_pretty_output(self, tmp_path):
+        """测试默认紧凑写入，可选缩进格式"""
+        value = {"text": "中文", "items": [1, 2]}
+        
+        compact = FileStorage(str(tmp_path / "compact"))
+        compact.save("key", value)
+        with open(compact._get_path("key"), encoding="utf-8") as f:
+            content = f.read()
+        assert "\n" not in content
+        assert "中文" in content
+        assert compact.retrieve("key") == value
+        
+        pretty = FileStorage(str(tmp_path / "pretty"), pretty=True)
+        pretty.save("key", value)
+        with open(pretty._get_path("key"), encoding="utf-8") as f:
+            assert "\n" in f.read()
+        assert pretty.retrieve("key") == value
+    
+    def test_reads_legacy_md5_paths(self, tmp_path):
+        """测试兼容读取旧版 md5 路径，并在读取时迁移"""
+        storage = FileStorage(str(tmp_path))
+        key_hash = hashlib.md5(b"old").hexdigest()
+        legacy = tmp_path / key_hash[:2] / (key_hash[2:] + ".json")
+        legacy.write_text('{"v": 1}', encoding="utf-8")
+        
+        assert storage.exists("old")
+        assert storage.retrieve("old") == {"v": 1}
+        assert not legacy.exists()
+        assert os.path.exists(storage._get_path("old"))
+        
+        legacy.write_text('{"v": 0}', encoding="utf-8")
+        assert storage.delete("old")
+        assert not legacy.exists()
+        assert storage.retrieve("old") is None
+
+
+def _vec(*values):
+    return struct.pack(f"{len(values)}f", *values)
+
+
+class TestVectorStorage:
+    """测试向量存储"""
+    
+    def test_cosine_similarity(self):
+        """测试余弦相似度按 float32 解码"""
+        storage = VectorStorage()
+        assert storage._cosine_similarity(_vec(1, 0), _vec(1, 0)) == pytest.approx(1.0)
+        assert storage._cosine_similarity(_vec(1, 0), _vec(0, 1)) == pytest.approx(0.0)
+        assert storage._cosine_similarity(_vec(1, 0), _vec(1, 0, 0)) == 0.0
+        assert storage._cosine_similarity(_vec(0, 0), _vec(1, 0)) == 0.0
+    
+    def test_search_order_and_top_k(self):
+        """测试搜索按相似度降序并截断"""
+        storage = VectorStorage()
+        storage.add("x", "X", _vec(1, 0), {"axis": "x"})
+        storage.add("y", "Y", _vec(0, 1))
+        storage.add("xy", "XY", _vec(1, 1))
+        
+        results = storage.search(_vec(1, 0.1), top_k=2)
+        assert [r["key"] for r in results] == ["x", "xy"]
+        assert results[0]["content"] == "X"
+        assert results[0]["metadata"] == {"axis": "x"}
+        assert results[0]["similarity"] > results[1]["similarity"]
+        assert storage.search(_vec(1, 0), top_k=0) == []
+    
+    def test_search_skips_other_dimensions(self):
+        """测试只比较同维度向量"""
+        storage = VectorStorage()
+        storage.add("a", "", _vec(1, 0))
+        storage.add("b", "", _vec(1, 0, 0))
+        
+        assert [r["key"] for r in storage.search(_vec(1, 0))] == ["a"]
+    
+    def test_search_after_update_and_delete(self):
+        """测试修改和删除后搜索结果同步"""
+        storage = VectorStorage()
+        storage.add("a", "", _vec(1, 0))
+        storage.add("b", "", _vec(0, 1))
+        assert storage.search(_vec(1, 0), top_k=1)[0]["key"] == "a"
+        
+        storage.save("b", _vec(1, 0.01))
+        storage.delete("a")
+        results = storage.search(_vec(1, 0))
+        assert [r["key"] for r in results] == ["b"]
+        
+        storage.clear()
+        assert storage.search(_vec(1, 0)) == []
+    
+    def test_invalid_dtype(self):
+        """测试不支持的向量类型"""
+        with pytest.raises(ValueError):
+            VectorStorage(dtype="int4")
+    
+    @pytest.mark.parametrize("dtype", ["float16", "int8"])
+    def test_quantized_search_matches_float32(self, dtype):
+        """测试量化矩阵的排序与 float32 一致"""
+        pytest.importorskip("numpy")
+        exact = VectorStorage()
+        narrow = VectorStorage(dtype=dtype)
+        for i, values in enumerate([(1, 0, 0), (1, 1, 0), (0, 1, 0), (0, 1, 1), (0, 0, 1)]):
+            emb = _vec(*values)
+            exact.add(f"k{i}", "", emb)
+            narrow.add(f"k{i}", "", emb)
+        
+        query = _vec(1.0, 0.9, 0.0)
+        assert ([r["key"] for r in narrow.search(query, top_k=3)] ==
+                [r["key"] for r in exact.search(query, top_k=3)])
+    
+    def test_invalid_index(self):
+        """测试不支持的索引类型"""
+        with pytest.raises(ValueError):
+            VectorStorage(index="ivf")
+    
+    def test_hnsw_search(self):
+        """测试 HNSW 索引的增删与搜索"""
+        pytest.importorskip("hnswlib")
+        storage = VectorStorage(embedding_dim=2, index="hnsw")
+        storage.add("x", "X", _vec(1, 0))
+        storage.add("y", "Y", _vec(0, 1))
+        storage.add("other", "", _vec(1, 0, 0))
+        
+        results = storage.search(_vec(1, 0.1), top_k=1)
+        assert storage._ann is not None
+        assert results[0]["key"] == "x"
+        assert results[0]["content"] == "X"
+        assert results[0]["similarity"] == pytest.approx(0.995, abs=1e-3)
+        
+        storage.delete("x")
+        assert [r["key"] for r in storage.search(_vec(1, 0.1))] == ["y"]
+        # 维度不同的向量不进入索引，仍按暴力计算
+        assert [r["key"] for r in storage.search(_vec(1, 0, 0))] == ["other"]
+
+
+class _FakePgError(Exception):
+    """模拟 psycopg2 抛出的数据库错误"""
+
+
+_COPY_UNESCAPES = {'t': '\t', 'n': '\n', 'r': '\r', '\\': '\\'}
+
+
+class _FakePgDatabase:
+    """内存中的假 PostgreSQL：提交后的数据、审计行和执行过的语句"""
+    
+    def __init__(self):
+        self.data = {}
+        self.audit = []
+        self.statements = []
+        self.cursors = []
+        # 语句包含该子串时报错，并使所在事务进入中止状态
+        self.fail = None
+        self.pools = []
+        self.lock = threading.Lock()
+
+
+class _FakePgCursor:
+    def __init__(self, conn, name=None):
+        self.conn = conn
+        self.name = name
+        self.itersize = None
+        self.rowcount = 0
+        self._rows = []
+    
+    def _check(self, sql):
+        conn = self.conn
+        conn.db.statements.append(sql)
+        if conn.aborted:
+            raise _FakePgError("current transaction is aborted")
+        if conn.db.fail and conn.db.fail in sql:
+            conn.aborted = True
+            raise _FakePgError(f"failed: {sql}")
+    
+    def execute(self, sql, params=None):
+        sql = " ".join(sql.split())
+        self._check(sql)
+        conn = self.conn
+        words = sql.split()
+        rows = []
+        if sql.startswith("SELECT to_regclass"):
+            rows = [tuple(True for _ in params)]
+        elif words[0] == "PREPARE":
+            conn.prepared.append(words[1])
+        elif words[0] == "EXECUTE":
+            name = words[1]
+            if name == "aosk_save":
+                conn.writes[params[0]] = params[1]
+            elif name == "aosk_retrieve":
+                value = conn.read(params[0])
+                rows = [] if value is None else [(value,)]
+            elif name == "aosk_exists":
+                rows = [] if conn.read(params[0]) is None else [(1,)]
+            elif name == "aosk_delete":
+                self.rowcount = int(conn.read(params[0]) is not None)
+                conn.writes[params[0]] = None
+            elif name == "aosk_save_audit_log":
+                conn.pending_audit.append(tuple(params))
+        elif words[0] == "SELECT" and "audit" in sql:
+            rows = [r for r in conn.db.audit if "agent_pid = %s" not in sql or r[0] == params[0]]
+            if "DESC" in sql:
+                rows = rows[::-1][:params[-1]]
+        self._rows = rows
+    
+    def copy_expert(self, sql, buf):
+        self._check(" ".join(sql.split()))
+        for line in buf.read().splitlines():
+            fields = [
+                None if f == "\\N" else re.sub(r"\\(.)", lambda m: _COPY_UNESCAPES[m.group(1)], f)
+                for f in line.split("\t")
+            ]
+            fields[-1] = float(fields[-1])
+            self.conn.pending_audit.append(tuple(fields))
+    
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+    
+    def fetchall(self):
+        return list(self._rows)
+    
+    def __iter__(self):
+        return iter(self._rows)
+    
+    def close(self):
+        pass
+
+
+class _FakePgConnection:
+    """每个连接有自己的未提交写入；语句失败后事务中止，提交等同回滚"""
+    
+    def __init__(self, db):
+        self.db = db
+        self.closed = 0
+        self.prepared = []
+        self.aborted = False
+        self.writes = {}
+        self.pending_audit = []
+    
+    def cursor(self, name=None):
+        cur = _FakePgCursor(self, name)
+        self.db.cursors.append(cur)
+        return cur
+    
+    def read(self, key):
+        if key in self.writes:
+            return self.writes[key]
+        return self.db.data.get(key)
+    
+    def commit(self):
+        if not self.aborted:
+            with self.db.lock:
+                for key, value in self.writes.items():
+                    if value is None:
+                        self.db.data.pop(key, None)
+                    else:
+                        self.db.data[key] = value
+                self.db.audit.extend(self.pending_audit)
+        self.rollback()
+    
+    def rollback(self):
+        self.aborted = False
+        self.writes = {}
+        self.pending_audit = []
+
+
+class _FakePgPool:
+    def __init__(self, db):
+        self.db = db
+        self.idle = []
+        self.discarded = []
+        self.borrowed = 0
+        self._lock = threading.Lock()
+    
+    def getconn(self):
+        with self._lock:
+            self.borrowed += 1
+            return self.idle.pop() if self.idle else _FakePgConnection(self.db)
+    
+    def putconn(self, conn, close=False):
+        with self._lock:
+            self.borrowed -= 1
+            if close:
+                conn.closed = 1
+                self.discarded.append(conn)
+            else:
+                self.idle.append(conn)
+    
+    def closeall(self):
+        pass
+
+
+def _fake_execute_values(cur, sql, rows, template=None, page_size=100):
+    cur._check(" ".join(sql.split()))
+    for key, value in rows:
+        cur.conn.writes[key] = value
+
+
+@pytest.fixture
+def fake_pg(monkeypatch):
+    """用内存中的假 psycopg2 驱动 PostgreSQLStorage 的连接池和 SQL 路径"""
+    db = _FakePgDatabase()
+    
+    def make_pool(**kwargs):
+        pool = _FakePgPool(db)
+        db.pools.append(pool)
+        return pool
+    
+    psycopg2 = types.ModuleType("psycopg2")
+    psycopg2.pool = types.ModuleType("psycopg2.pool")
+    psycopg2.pool.ThreadedConnectionPool = make_pool
+    psycopg2.extras = types.ModuleType("psycopg2.extras")
+    psycopg2.extras.execute_values = _fake_execute_values
+    monkeypatch.setitem(sys.modules, "psycopg2", psycopg2)
+    monkeypatch.setitem(sys.modules, "psycopg2.pool", psycopg2.pool)
+    monkeypatch.setitem(sys.modules, "psycopg2.extras", psycopg2.extras)
+    return db
+
+
+class TestPostgreSQLStorage:
+    """测试 PostgreSQL 后端（假 psycopg2）"""
+    
+    def test_prepared_statements_once_per_connection(self, fake_pg):
+        """测试每个连接只 PREPARE 一次热点语句，之后按名称执行"""
+        storage = PostgreSQLStorage()
+        assert storage.save("k", {"a": 1})
+        assert storage.retrieve("k") == {"a": 1}
+        assert storage.exists("k")
+        assert storage.delete("k")
+        assert storage.retrieve("k") is None
+        
+        conn, = fake_pg.pools[0].idle
+        assert sorted(conn.prepared) == sorted(_PG_PREPARED_STATEMENTS)
+        assert "EXECUTE aosk_save (%s, %s)" in fake_pg.statements
+    
+    def test_getconn_discards_closed_connection(self, fake_pg):
+        """测试空闲期间断开的连接被丢弃并换用新连接"""
+        storage = PostgreSQLStorage()
+        pool = fake_pg.pools[0]
+        stale = pool.getconn()
+        stale.closed = 1
+        pool.putconn(stale)
+        
+        assert storage.save("k", 1)
+        assert pool.discarded == [stale]
+        assert pool.borrowed == 0
+        assert fake_pg.data["k"] == "1"
+    
+    def test_getconn_prepare_failure_releases_connection(self, fake_pg):
+        """测试 PREPARE 失败时关闭连接而不泄漏"""
+        storage = PostgreSQLStorage()
+        pool = fake_pg.pools[0]
+        fake_pg.fail = "PREPARE aosk_retrieve"
+        assert storage.save("k", 1) is False
+        assert pool.borrowed == 0
+        assert len(pool.discarded) == 1
+        
+        fake_pg.fail = None
+        assert storage.save("k", 1)
+        assert pool.borrowed == 0
+    
+    def test_save_audit_logs_uses_copy(self, fake_pg):
+        """测试批量审计日志通过 COPY 写入并正确转义"""
+        storage = PostgreSQLStorage()
+        logs = [
+            {"agent_pid": "a", "action": "run", "details": {"text": "x\ty"}, "duration_ms": 1.5},
+            {"agent_pid": "b", "action": "stop"},
+        ]
+        assert storage.save_audit_logs(logs) == 2
+        assert any(s.startswith("COPY aosk_audit") for s in fake_pg.statements)
+        
+        assert storage.get_audit_logs("a") == [{
+            "agent_pid": "a", "action": "run", "resource": "",
+            "details": {"text": "x\ty"}, "result": "", "duration_ms": 1.5,
+        }]
+    
+    def test_iter_audit_logs_named_cursor(self, fake_pg):
+        """测试流式读取使用服务端命名游标，结束后归还连接"""
+        storage = PostgreSQLStorage()
+        for i in range(3):
+            assert storage.save_audit_log({"agent_pid": "a" if i != 1 else "b", "action": str(i)})
+        
+        assert [log["action"] for log in storage.iter_audit_logs("a")] == ["0", "2"]
+        assert [log["action"] for log in storage.iter_audit_logs()] == ["0", "1", "2"]
+        cur = fake_pg.cursors[-1]
+        assert cur.name == "aosk_audit_stream"
+        assert cur.itersize == PG_STREAM_ITERSIZE
+        assert fake_pg.pools[0].borrowed == 0
+    
+    def test_write_behind_reads_own_writes(self, fake_pg):
+        """测试写回模式下读操作先写出队列中的条目"""
+        storage = PostgreSQLStorage(write_behind=True)
+        try:
+            assert storage.save("k", "v1")
+            assert storage.save_audit_log({"agent_pid": "a", "action": "run"})
+            assert storage.retrieve("k") == "v1"
+            assert [log["action"] for log in storage.get_audit_logs("a")] == ["run"]
+        finally:
+            storage.close()
+    
+    def test_write_behind_flush_not_overtaken_by_flusher(self, fake_pg, monkeypatch):
+        """测试后台线程已取出的旧条目不会在 flush() 写出新值之后覆盖它"""
+        dequeued = threading.Event()
+        base = queue.SimpleQueue
+        
+        class PausingQueue(base):
+            """后台线程取出第一个条目后暂停，模拟它在写出前被抢占"""
+            paused = False
+            
+            def _take(self, item):
+                if threading.current_thread() is not threading.main_thread() and not self.paused:
+                    self.paused = True
+                    dequeued.set()
+                    time.sleep(0.2)
+                return item
+            
+            def get(self, *args, **kwargs):
+                return self._take(base.get(self, *args, **kwargs))
+            
+            def get_nowait(self):
+                return self._take(base.get_nowait(self))
+        
+        monkeypatch.setattr(queue, "SimpleQueue", PausingQueue)
+        storage = PostgreSQLStorage(write_behind=True)
+        try:
+            assert storage.save("k", "v1")
+            assert dequeued.wait(2.0)
+            assert storage.save("k", "v2")
+            assert storage.retrieve("k") == "v2"
+        finally:
+            storage.close()
+        assert fake_pg.data["k"] == '"v2"'
+    
+    def test_transaction_failure_rolls_back_and_raises(self, fake_pg):
+        """测试事务内操作失败时整体回滚并抛出异常，而不是静默丢失写入"""
+        storage = PostgreSQLStorage()
+        fake_pg.fail = "EXECUTE aosk_delete"
+        with pytest.raises(StorageOperationError):
+            with storage.transaction():
+                assert storage.save("a", 1)
+                assert storage.delete("b") is False
+        assert "a" not in fake_pg.data
+        assert fake_pg.pools[0].borrowed == 0
+        
+        fake_pg.fail = None
+        with storage.transaction():
+            assert storage.save("a", 1)
+            assert storage.save_audit_log({"agent_pid": "p", "action": "run"})
+        assert fake_pg.data["a"] == "1"
+        assert len(fake_pg.audit) == 1
+    
+    def test_write_behind_transaction_isolated_from_queue(self, fake_pg):
+        """测试写回模式下事务内写入走事务连接，flush() 写出的他人条目不随事务回滚"""
+        storage = PostgreSQLStorage(write_behind=True)
+        try:
+            fake_pg.fail = "EXECUTE aosk_delete"
+            with pytest.raises(StorageOperationError):
+                with storage.transaction():
+                    assert storage.save("mine", 1)
+                    other = threading.Thread(target=storage.save, args=("other", 2))
+                    other.start()
+                    other.join()
+                    assert storage.retrieve("mine") == 1
+                    storage.delete("x")
+            fake_pg.fail = None
+            assert storage.retrieve("mine") is None
+            assert storage.retrieve("other") == 2
+        finally:
+            storage.close()